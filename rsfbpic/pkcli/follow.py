@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+u"""Reduce FBPIC dumps as a running job writes them
+
+:copyright: Copyright (c) 2019 RadiaSoft LLC.  All Rights Reserved.
+:license: http://www.apache.org/licenses/LICENSE-2.0.html
+"""
+from __future__ import absolute_import, division, print_function
+
+from rsfbpic.rsdata import follow
+from rsfbpic.rsdata import reductions
+
+
+def default_command(dump_dir, state_path, n_pe, poll_interval=10., settle_time=30., idle_timeout=3600.):
+    """Follow `dump_dir`, writing on-axis Ez, bubble radius and PW curl to `state_path`
+
+    Args:
+        dump_dir (str): FBPIC output directory being written
+        state_path (str): JSON state file; arrays go to the same name with .h5
+        n_pe (float): number density of the electron plasma [m^-3]
+        poll_interval (float): seconds between polls
+        settle_time (float): seconds a file must be unchanged to be complete
+        idle_timeout (float): stop after this many seconds without a new dump
+    Returns:
+        str: path to state file
+    """
+    follow.follow(
+        dump_dir,
+        state_path,
+        reductions.default_reductions(float(n_pe)),
+        poll_interval=float(poll_interval),
+        settle_time=float(settle_time),
+        idle_timeout=float(idle_timeout),
+    )
+    return state_path
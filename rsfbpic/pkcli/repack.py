@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+u"""Repack FBPIC dumps into a consolidated HDF5 file
+
+:copyright: Copyright (c) 2019 RadiaSoft LLC.  All Rights Reserved.
+:license: http://www.apache.org/licenses/LICENSE-2.0.html
+"""
+from __future__ import absolute_import, division, print_function
+
+from rsfbpic.rsdata import repack
+
+
+def default_command(dump_dir, out_path, chunking='time_series', compression='gzip', float32=False):
+    """Rewrite `dump_dir` as one chunked HDF5 file at `out_path`
+
+    Args:
+        dump_dir (str): FBPIC output directory (dataNNNNNNNN.h5 files)
+        out_path (str): consolidated file to write
+        chunking (str): time_series, on_axis or snapshot
+        compression (str): gzip, lzf or none
+        float32 (bool): store fields in single precision
+    Returns:
+        str: path to consolidated file
+    """
+    if compression == 'none':
+        compression = None
+    return repack.repack(dump_dir, out_path, chunking, compression, float32)
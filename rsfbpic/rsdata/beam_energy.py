@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+Track drive and witness beam energy spectra and the transformer ratio.
+
+For every dump, each beam species is streamed in chunks of
+macroparticles into a charge-weighted kinetic energy histogram with
+float64 moments. Only z, w and the three momenta are read (the energy
+needs ux and uy as well as uz), and only the on-axis row of Ez. The
+peak decelerating field is the largest Ez on axis along the drive beam,
+the peak accelerating field the largest -Ez along the witness (electron
+beams), and their ratio is the transformer ratio.
+
+Dumps are processed in parallel and appended, in order of iteration, to
+a per-run HDF5 time series; a rerun appends only the new dumps. The file
+holds iteration, time, peak_decel, peak_accel, transformer_ratio and
+energy_edges, and for each role (e.g. drive, witness) a group with
+charge, mean_energy, gain (since the first dump with particles of the
+role), rms_spread and histogram. A role added on a rerun is NaN for the
+dumps already in the file.
+
+:copyright: Copyright (c) 2019 Radiasoft LLC. All Rights Reserved.
+:license: http://www.apache.org/licenses/LICENSE-2.0.html
+"""
+
+# Python imports
+import functools
+import multiprocessing
+
+import h5py
+import numpy as np
+import scipy.constants
+
+# RadiaSoft imports
+from rsfbpic.rsdata import parallel
+from rsfbpic.rsdata import read_field_hdf
+from rsfbpic.rsdata import read_particle_hdf
+
+#: quantities read for each macroparticle; not x, y or the ids
+VAR_LIST = ['z', 'ux', 'uy', 'uz', 'w']
+
+#: per-dump scalars of the time series
+SCALARS = ('time', 'peak_decel', 'peak_accel', 'transformer_ratio')
+
+#: per-dump scalars of each role
+ROLE_SCALARS = ('charge', 'mean_energy', 'rms_spread')
+
+def calc_kinetic_energy(ux, uy, uz, mass):
+    """
+    Calculate the kinetic energy of particles from their momenta.
+
+    Args:
+        ux, uy, uz: momentum / (mass*c)
+        mass:       particle mass [kg]
+    Returns:
+        energy: kinetic energy [eV]
+    """
+    u2 = ux*ux + uy*uy + uz*uz
+    # (gamma - 1) without cancellation at low energy
+    return u2/(np.sqrt(1. + u2) + 1.)*mass*scipy.constants.c**2/scipy.constants.e
+
+def species_spectrum(path_to_file, n_dump_str, species, energy_edges, chunk_size=1000000):
+    """
+    Stream a particle species into a charge-weighted energy spectrum.
+
+    Args:
+        path_to_file: location of a specific HDF5 file
+        n_dump_str:   dump number (as a string)
+        species:      name of the particle species
+        energy_edges: histogram bin edges [eV], uniformly spaced
+        chunk_size:   number of macroparticles per chunk
+    Returns:
+        spectrum: dict with histogram (charge per bin [C]), charge [C],
+            mean_energy and rms_spread [eV], and the z extent of the beam [m]
+    """
+    mass = read_particle_hdf.read_constant(path_to_file, species, n_dump_str, 'mass')
+    charge = abs(read_particle_hdf.read_constant(path_to_file, species, n_dump_str, 'charge'))
+    bins = len(energy_edges) - 1
+    histogram = np.zeros(bins)
+    # moments about a reference energy, to keep the spread accurate
+    reference = None
+    sum_w = sum_wde = sum_wde2 = 0.
+    z_min = np.inf
+    z_max = -np.inf
+    for ptcl in read_particle_hdf.iter_species(
+            path_to_file, species, n_dump_str, VAR_LIST, chunk_size):
+        energy = calc_kinetic_energy(ptcl['ux'], ptcl['uy'], ptcl['uz'], mass)
+        w = ptcl['w']*charge
+        if not len(w):
+            continue
+        if reference is None:
+            reference = float(np.average(energy, weights=w)) if w.sum() else 0.
+        de = energy - reference
+        sum_w += w.sum()
+        sum_wde += np.dot(w, de)
+        sum_wde2 += np.dot(w, de*de)
+        i = np.floor((energy - energy_edges[0])/(energy_edges[1] - energy_edges[0]))
+        inside = (i >= 0) & (i < bins)
+        histogram += np.bincount(i[inside].astype(np.int64), w[inside], minlength=bins)
+        occupied = ptcl['z'][w > 0.]
+        if len(occupied):
+            z_min = min(z_min, occupied.min())
+            z_max = max(z_max, occupied.max())
+    mean = sum_wde/sum_w if sum_w else np.nan
+    return dict(
+        histogram=histogram,
+        charge=sum_w,
+        mean_energy=(reference or 0.) + mean,
+        rms_spread=np.sqrt(max(sum_wde2/sum_w - mean*mean, 0.)) if sum_w else np.nan,
+        z_min=z_min,
+        z_max=z_max,
+    )
+
+def track_dump(path_to_file, n_dump_str, species, energy_edges, chunk_size=1000000):
+    """
+    Compute the spectra, peak fields and transformer ratio of one dump.
+
+    Args:
+        path_to_file: location of a specific HDF5 file
+        n_dump_str:   dump number (as a string)
+        species:      dict of role to species name; the roles drive and
+                      witness set the peak fields
+        energy_edges: histogram bin edges [eV], uniformly spaced
+        chunk_size:   number of macroparticles per chunk
+    Returns:
+        result: dict of SCALARS, and of role to species_spectrum
+    """
+    ez, z, time = read_field_hdf.read_line(path_to_file, 'E', 'z', n_dump_str)
+    result = dict(time=time)
+    for role, name in species.items():
+        result[role] = species_spectrum(path_to_file, n_dump_str, name, energy_edges, chunk_size)
+    result['peak_decel'] = _peak(ez, z, result.get('drive'))
+    result['peak_accel'] = _peak(-ez, z, result.get('witness'))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result['transformer_ratio'] = result['peak_accel']/result['peak_decel']
+    return result
+
+def track(path, out_path, species, energy_range, bins=200, chunk_size=1000000,
+          num_workers=None):
+    """
+    Append the beam energy time series of every new dump to a file.
+
+    Args:
+        path:         dump directory or consolidated HDF5 file
+        out_path:     per-run time series file, created if missing
+        species:      dict of role to species name, e.g.
+                      dict(drive='beam', witness='witness')
+        energy_range: (low, high) of the histograms [eV]
+        bins:         number of histogram bins
+        chunk_size:   number of macroparticles per chunk
+        num_workers:  number of processes; None for all cores
+    Returns:
+        iterations: dump numbers appended by this call
+    """
+    energy_edges = np.linspace(energy_range[0], energy_range[1], bins + 1)
+    done = set()
+    with h5py.File(out_path, 'a') as out:
+        if 'energy_edges' in out:
+            if not np.array_equal(out['energy_edges'][...], energy_edges):
+                raise ValueError('{}: written with other energy bins'.format(out_path))
+            done.update(out['iteration'][...].tolist())
+    dumps = [d for d in read_field_hdf.list_dumps(path) if d[0] not in done]
+    func = functools.partial(_track_one, species, energy_edges, chunk_size)
+    if num_workers is None:
+        num_workers = multiprocessing.cpu_count()
+    # dumps are appended a block at a time, so an interrupted run keeps its results
+    block = 4*max(num_workers, 1)
+    for start in range(0, len(dumps), block):
+        results = parallel.map_dumps(func, dumps[start:start + block], num_workers)
+        _append(out_path, species, energy_edges, dumps[start:start + block], results)
+    return [d[0] for d in dumps]
+
+def _append(out_path, species, energy_edges, dumps, results):
+    with h5py.File(out_path, 'a') as out:
+        if 'energy_edges' not in out:
+            out['energy_edges'] = energy_edges
+            _create(out, 'iteration', (), np.int64)
+            for name in SCALARS:
+                _create(out, name, (), np.float64)
+        n = out['iteration'].shape[0]
+        for role in species:
+            if role in out:
+                continue
+            # a role added on a rerun is NaN for the dumps before it
+            group = out.create_group(role)
+            group.attrs['species'] = species[role]
+            for name in ROLE_SCALARS + ('gain',):
+                _create(group, name, (), np.float64)
+            _create(group, 'histogram', (len(energy_edges) - 1,), np.float64)
+            for dataset in group.values():
+                dataset.resize(n, axis=0)
+                dataset[...] = np.nan
+        rows = {'iteration': [d[0] for d in dumps]}
+        for name in SCALARS:
+            rows[name] = [r[name] for r in results]
+        for role in species:
+            mean = np.array([r[role]['mean_energy'] for r in results])
+            finite = mean[np.isfinite(mean)]
+            if 'initial_mean_energy' not in out[role].attrs and len(finite):
+                out[role].attrs['initial_mean_energy'] = finite[0]
+            rows[role + '/gain'] = mean - out[role].attrs.get('initial_mean_energy', np.nan)
+            for name in ROLE_SCALARS + ('histogram',):
+                rows[role + '/' + name] = [r[role][name] for r in results]
+        for name, values in rows.items():
+            dataset = out[name]
+            dataset.resize(n + len(dumps), axis=0)
+            dataset[n:] = np.array(values)
+
+def _create(group, name, shape, dtype):
+    group.create_dataset(
+        name, shape=(0,) + shape, maxshape=(None,) + shape, dtype=dtype,
+        chunks=(256,) + shape, compression='gzip' if shape else None)
+
+def _peak(field, z, spectrum):
+    # largest field over the z extent of a beam, widened by a cell
+    if spectrum is None or not np.isfinite(spectrum['z_min']):
+        return np.nan
+    dz = z[1] - z[0]
+    along = (z >= spectrum['z_min'] - dz) & (z <= spectrum['z_max'] + dz)
+    return float(field[along].max()) if along.any() else np.nan
+
+def _track_one(species, energy_edges, chunk_size, n_dump, path_to_file):
+    return track_dump(path_to_file, str(n_dump), species, energy_edges, chunk_size)
@@ -0,0 +1,380 @@
+# -*- coding: utf-8 -*-
+"""
+Run a parameter scan of simulations concurrently, reusing finished runs.
+
+A campaign is a base dict of parameters and the values to scan (e.g.
+the witness charges of wake_function_test.ipynb), plus an optional
+baseline (e.g. the drive beam alone). Each run lives in out_dir/<hash>,
+where the hash is that of its parameters, so a run whose outputs
+already exist is skipped instead of being recomputed, and a completed
+baseline is shared by every later scan over the same drive beam.
+
+Runs are started by a launcher, called as launcher(params, run_dir) in
+a worker process, which writes its dumps to run_dir/hdf5 the way FBPIC
+does. fbpic_launcher runs FBPIC; tests pass a cheap stand-in. Workers
+are spawned with their thread counts limited to threads_per_run in the
+environment (OMP_NUM_THREADS, etc.), and as many run at once as fit on
+the CPUs. As each run finishes, its dumps are reduced with
+:class:`rsfbpic.rsdata.follow.DumpFollower` into run_dir/reductions.json
+(and .h5); a scan run also gets wake_ez, its Ez minus that of the
+baseline, once the baseline has finished.
+
+:copyright: Copyright (c) 2019 Radiasoft LLC. All Rights Reserved.
+:license: http://www.apache.org/licenses/LICENSE-2.0.html
+"""
+
+# Python imports
+import concurrent.futures
+import functools
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import shutil
+import time
+
+import numpy as np
+import scipy.constants
+
+# RadiaSoft imports
+from rsfbpic.rsdata import follow
+from rsfbpic.rsdata import reductions as rsreductions
+
+#: environment variables limiting the threads of a worker
+THREAD_VARS = ('OMP_NUM_THREADS', 'NUMBA_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS')
+
+#: parameters of a run, written before it is launched
+PARAMS_FILE = 'params.json'
+
+#: written once the launcher of a run has returned
+DONE_FILE = 'done.json'
+
+#: directory of a run holding its dumps
+DUMP_SUBDIR = 'hdf5'
+
+#: file of a run holding its reductions, see follow.DumpFollower
+STATE_FILE = 'reductions.json'
+
+#: parameters of wake_function_test.ipynb, in SI units; no witness beam
+WAKE_FUNCTION_PARAMS = dict(
+    drive_sigma_r=3.65e-6,
+    drive_sigma_z=12.77e-6,
+    drive_Q=-1.e10*scipy.constants.e,
+    drive_N_macro=4000,
+    drive_gamma=10.e9/5.12e5,
+    witness_sigma_r=3.65e-6,
+    witness_sigma_z=6.38e-6,
+    witness_Q=0.,
+    witness_N_macro=4000,
+    trailing_distance=150.e-6,
+    n_plasma=4.e22,
+    domain_l=2.,
+    domain_r=2.,
+    min_res_z=0.1,
+    min_res_r=0.1,
+    seed=0,
+)
+
+def param_hash(params):
+    """
+    Hash the parameters of a run, independent of the order of the keys.
+
+    Args:
+        params: dict of JSON-serializable values (numpy scalars allowed)
+    Returns:
+        hash: 16 hex digits
+    """
+    text = json.dumps(params, sort_keys=True, separators=(',', ':'), default=_json_default)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+def expand(base, scan=None, runs=None):
+    """
+    Describe the runs of a scan.
+
+    Args:
+        base: dict of parameters shared by every run
+        scan: dict of parameter name to list of values; every
+              combination of values is a run
+        runs: list of dicts of parameters overriding base, each a run
+    Returns:
+        params: list of dicts of parameters, one per run
+    """
+    res = []
+    if scan:
+        names = sorted(scan)
+        for values in itertools.product(*[scan[n] for n in names]):
+            p = dict(base)
+            p.update(zip(names, values))
+            res.append(p)
+    for overrides in runs or []:
+        p = dict(base)
+        p.update(overrides)
+        res.append(p)
+    return res
+
+def run_dir(out_dir, params):
+    """
+    Locate the directory of a run.
+
+    Args:
+        out_dir: directory of the campaign
+        params:  dict of parameters of the run
+    Returns:
+        run_dir: out_dir/<param_hash>
+    """
+    return os.path.join(out_dir, param_hash(params))
+
+def is_complete(path):
+    """
+    Check whether the launcher of a run returned for its parameters.
+
+    Args:
+        path: directory of the run
+    Returns:
+        complete: True if DONE_FILE matches the hash of PARAMS_FILE
+    """
+    try:
+        with open(os.path.join(path, PARAMS_FILE)) as f:
+            params = json.load(f)
+        with open(os.path.join(path, DONE_FILE)) as f:
+            done = json.load(f)
+    except (IOError, OSError, ValueError):
+        return False
+    return done.get('hash') == param_hash(params)
+
+def run_campaign(out_dir, launcher, runs, baseline=None, reductions=None, max_workers=None,
+                 threads_per_run=1):
+    """
+    Launch every run not already complete, reducing each as it finishes.
+
+    A run that fails does not stop the others; once they have finished
+    and been reduced, the first failure is raised. An incomplete run
+    (e.g. one that was killed) is launched again from scratch. A reused
+    run only has its new dumps reduced, so remove its reductions.json
+    to reduce it with other reductions.
+    Args:
+        out_dir:         directory of the campaign, created if missing
+        launcher:        module-level func(params, run_dir), importable
+                         by a spawned worker, writing dumps to run_dir/hdf5
+        runs:            list of dicts of parameters, e.g. from expand
+        baseline:        dict of parameters of the baseline run, or None
+        reductions:      dict of name to func(path_to_file, n_dump_str),
+                         applied to every run including the baseline
+        max_workers:     runs at once; default CPUs // threads_per_run,
+                         1 to launch in this process, one at a time
+        threads_per_run: threads each run may use
+    Returns:
+        results: list of dicts of params, hash, run_dir, dump_dir,
+            state_path and launched (False if reused), baseline first
+    """
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    jobs = []
+    seen = set()
+    for p in ([baseline] if baseline is not None else []) + list(runs):
+        h = param_hash(p)
+        if h in seen:
+            continue
+        seen.add(h)
+        d = os.path.join(out_dir, h)
+        jobs.append(dict(
+            params=p,
+            hash=h,
+            run_dir=d,
+            dump_dir=os.path.join(d, DUMP_SUBDIR),
+            state_path=os.path.join(d, STATE_FILE),
+            launched=not is_complete(d),
+        ))
+    _write_index(out_dir, jobs, baseline)
+    base_job = jobs[0] if baseline is not None else None
+    reduce_job = functools.partial(_reduce, reductions or {}, base_job)
+    todo = [j for j in jobs if j['launched']]
+    # scan runs wait for the baseline before they are reduced
+    waiting = []
+    errors = []
+    baseline_done = [base_job is None or not base_job['launched']]
+
+    def finished(job, error=None):
+        if error is not None:
+            errors.append((job, error))
+            return
+        if job is base_job:
+            baseline_done[0] = True
+        if not baseline_done[0]:
+            waiting.append(job)
+            return
+        for j in [job] + waiting:
+            reduce_job(j)
+        del waiting[:]
+
+    for job in jobs:
+        if not job['launched']:
+            finished(job)
+    for job in todo:
+        _prepare(job)
+    if max_workers is None:
+        max_workers = max(multiprocessing.cpu_count()//threads_per_run, 1)
+    if max_workers <= 1 or not todo:
+        for job in todo:
+            try:
+                _launch(launcher, job['params'], job['run_dir'])
+            except Exception as e:
+                finished(job, e)
+                continue
+            _mark_done(job)
+            finished(job)
+    else:
+        # spawned workers start with the limits in their environment, so
+        # BLAS and numba read them when loaded; forked workers would
+        # inherit the thread pools of this process
+        saved = _limit_threads(threads_per_run)
+        try:
+            with concurrent.futures.ProcessPoolExecutor(
+                    min(max_workers, len(todo)),
+                    mp_context=multiprocessing.get_context('spawn')) as executor:
+                futures = {}
+                for job in todo:
+                    futures[executor.submit(
+                        _launch, launcher, job['params'], job['run_dir'])] = job
+                for future in concurrent.futures.as_completed(futures):
+                    job = futures[future]
+                    try:
+                        future.result()
+                    except Exception as e:
+                        finished(job, e)
+                        continue
+                    _mark_done(job)
+                    finished(job)
+        finally:
+            _restore_environ(saved)
+    if errors:
+        job, error = errors[0]
+        raise RuntimeError('{}: run failed: {}'.format(job['run_dir'], error))
+    return jobs
+
+def fbpic_launcher(params, run_dir):
+    """
+    Run the FBPIC simulation of wake_function_test.ipynb.
+
+    The witness beam is left out when witness_Q is 0, which makes the
+    baseline. The grid resolves the witness even then, so the baseline
+    and the scan runs share a grid.
+    Args:
+        params:  dict with the keys of WAKE_FUNCTION_PARAMS
+        run_dir: FBPIC writes its dumps to run_dir/hdf5
+    """
+    from fbpic.lpa_utils.bunch import add_elec_bunch_gaussian
+    from fbpic.main import Simulation
+    from fbpic.openpmd_diag import FieldDiagnostic, ParticleDiagnostic
+
+    p = params
+    c = scipy.constants.c
+    np.random.seed(p['seed'])
+    k_p = np.sqrt(p['n_plasma']*scipy.constants.e**2
+                  /(scipy.constants.m_e*scipy.constants.epsilon_0))/c
+    lambda_p = 2.*np.pi/k_p
+    length = p['domain_l']*lambda_p
+    radius = p['domain_r']*lambda_p
+    dz = p['min_res_z']*min(p['drive_sigma_z'], lambda_p, p['witness_sigma_z'])
+    dr = p['min_res_r']*min(p['drive_sigma_r'], lambda_p, p['witness_sigma_r'])
+    # small fudge factor so particles do not cross a full cell per step
+    dt = 0.95*np.sqrt((dz**2 + dr**2)/2.)/c
+    ramp_start = length
+    ramp_length = 3.*p['drive_sigma_z']
+    # just long enough for the wake to form behind the drive beam
+    n_steps = int((ramp_start + ramp_length + 30.*p['drive_sigma_z'])/c/dt)
+    n_steps = n_steps - n_steps%100 + 1
+
+    def dens_func(z, r):
+        return np.clip((z - ramp_start)/ramp_length, 0., 1.)
+
+    sim = Simulation(
+        int(np.rint(length/dz)), length, int(np.rint(radius/dr)), radius, 1, dt,
+        boundaries='open')
+    sim.ptcl = []
+    beams = dict(drive=(p['drive_sigma_r'], p['drive_sigma_z'], p['drive_Q'],
+                        p['drive_N_macro'], 0.))
+    if p['witness_Q']:
+        beams['witness'] = (p['witness_sigma_r'], p['witness_sigma_z'], p['witness_Q'],
+                            p['witness_N_macro'], p['trailing_distance'])
+    species = {}
+    for name in sorted(beams):
+        sig_r, sig_z, Q, N, behind = beams[name]
+        add_elec_bunch_gaussian(
+            sim, sig_r=sig_r, sig_z=sig_z, n_emit=0., gamma0=p['drive_gamma'], sig_gamma=1.,
+            Q=Q, N=N, tf=0., zf=0.75*length - behind, boost=None)
+        species[name] = sim.ptcl[-1]
+    sim.add_new_species(
+        q=-scipy.constants.e, m=scipy.constants.m_e, dens_func=dens_func,
+        n=p['n_plasma'], p_nz=2, p_nr=2, p_nt=1)
+    sim.set_moving_window(v=c)
+    sim.diags.append(FieldDiagnostic(n_steps - 1, sim.fld, sim.comm, write_dir=run_dir))
+    sim.diags.append(ParticleDiagnostic(n_steps - 1, species, sim.comm, write_dir=run_dir))
+    sim.step(n_steps)
+
+def _json_default(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError('{!r} is not JSON serializable'.format(value))
+
+def _launch(launcher, params, path):
+    launcher(params, path)
+
+def _limit_threads(threads_per_run):
+    saved = dict((name, os.environ.get(name)) for name in THREAD_VARS)
+    for name in THREAD_VARS:
+        os.environ[name] = str(threads_per_run)
+    return saved
+
+def _restore_environ(saved):
+    for name, value in saved.items():
+        if value is None:
+            os.environ.pop(name, None)
+        else:
+            os.environ[name] = value
+
+def _mark_done(job):
+    path = os.path.join(job['run_dir'], DONE_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(dict(hash=job['hash'], time=time.time()), f)
+    os.rename(path + '.tmp', path)
+
+def _prepare(job):
+    # output of an incomplete run would mix with the new dumps
+    for name in (DONE_FILE, STATE_FILE, os.path.splitext(STATE_FILE)[0] + '.h5'):
+        path = os.path.join(job['run_dir'], name)
+        if os.path.exists(path):
+            os.remove(path)
+    if os.path.isdir(job['dump_dir']):
+        shutil.rmtree(job['dump_dir'])
+    if not os.path.isdir(job['run_dir']):
+        os.makedirs(job['run_dir'])
+    with open(os.path.join(job['run_dir'], PARAMS_FILE), 'w') as f:
+        json.dump(job['params'], f, sort_keys=True, indent=1, default=_json_default)
+
+def _reduce(reductions, base_job, job):
+    funcs = dict(reductions)
+    if base_job is not None and job is not base_job:
+        funcs['wake_ez'] = functools.partial(
+            rsreductions.wake_ez, baseline_path=base_job['dump_dir'])
+    if funcs:
+        follow.DumpFollower(job['dump_dir'], job['state_path'], funcs, settle_time=0.).poll()
+
+def _write_index(out_dir, jobs, baseline):
+    index = dict(
+        baseline=jobs[0]['hash'] if baseline is not None else None,
+        runs=dict((j['hash'], j['params']) for j in jobs),
+    )
+    path = os.path.join(out_dir, 'campaign.json')
+    if os.path.exists(path):
+        with open(path) as f:
+            old = json.load(f)
+        old['runs'].update(index['runs'])
+        index['runs'] = old['runs']
+        index['baseline'] = index['baseline'] or old.get('baseline')
+    with open(path + '.tmp', 'w') as f:
+        json.dump(index, f, sort_keys=True, indent=1, default=_json_default)
+    os.rename(path + '.tmp', path)
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Deposit weighted macroparticles onto grids and phase-space histograms.
+
+Binning uses cloud-in-cell (linear) weights on cell-centred bins and is
+vectorized with numpy.bincount. Species are read in chunks, so memory
+use is bounded by the chunk size, and dumps are processed in parallel.
+
+:copyright: Copyright (c) 2019 Radiasoft LLC. All Rights Reserved.
+:license: http://www.apache.org/licenses/LICENSE-2.0.html
+"""
+
+# Python imports
+import functools
+import math
+
+import numpy as np
+import scipy.constants
+
+# RadiaSoft imports
+from rsfbpic.rsdata import parallel
+from rsfbpic.rsdata import read_field_hdf
+from rsfbpic.rsdata import read_particle_hdf
+
+def _r_ur(ptcl, time):
+    r = np.hypot(ptcl['x'], ptcl['y'])
+    ur = np.zeros_like(r)
+    nonzero = r > 0.
+    ur[nonzero] = (ptcl['x'] * ptcl['ux'] + ptcl['y'] * ptcl['uy'])[nonzero] / r[nonzero]
+    return r, ur
+
+#: phase spaces: quantities read, and the (a, b) coordinates computed
+#: from those quantities and the dump time
+PHASE_SPACES = {
+    'z-uz': (('z', 'uz'), lambda p, t: (p['z'], p['uz'])),
+    'zeta-uz': (('z', 'uz'), lambda p, t: (p['z'] - scipy.constants.c * t, p['uz'])),
+    'r-ur': (('x', 'y', 'ux', 'uy'), _r_ur),
+    'x-xp': (('x', 'ux', 'uz'), lambda p, t: (p['x'], p['ux'] / p['uz'])),
+}
+
+def cic_histogram2d(a, b, weights, a_range, b_range, bins, out=None, reflect_a=False):
+    """
+    Bin weighted points onto a 2D grid with cloud-in-cell weights.
+
+    Each point is shared between the four nearest bin centres. Points
+    outside the ranges are dropped. With reflect_a, weight falling below
+    the first a bin is folded back into it, as for r >= 0.
+    Args:
+        a, b:      coordinates of the points
+        weights:   weight of each point
+        a_range:   (min, max) of the a axis
+        b_range:   (min, max) of the b axis
+        bins:      (na, nb) number of bins
+        out:       float64 array of shape bins to accumulate into
+        reflect_a: fold weight below a_range[0] back onto the grid
+    Returns:
+        hist: summed weights, shape bins
+    """
+    na, nb = bins
+    if out is None:
+        out = np.zeros(bins)
+    ia, wa = _cic(a, a_range, na)
+    ib, wb = _cic(b, b_range, nb)
+    flat = out.reshape(-1)
+    for da in (0, 1):
+        i = ia + da
+        if reflect_a:
+            i = np.where(i < 0, -1 - i, i)
+        for db in (0, 1):
+            j = ib + db
+            w = weights * (wa if da else 1. - wa) * (wb if db else 1. - wb)
+            valid = (i >= 0) & (i < na) & (j >= 0) & (j < nb)
+            flat += np.bincount(
+                i[valid] * nb + j[valid], weights=w[valid], minlength=na * nb)
+    return out
+
+def density_rz(path_to_file, species, n_dump_str, r_range, z_range, bins,
+               chunk_size=1000000):
+    """
+    Deposit a particle species onto an r-z grid as a number density.
+
+    Args:
+        path_to_file: location of a specific HDF5 file
+        species:      name of the particle species
+        n_dump_str:   dump number (as a string)
+        r_range:      (rmin, rmax) of the grid [m]
+        z_range:      (zmin, zmax) of the grid [m]
+        bins:         (nr, nz) number of cells
+        chunk_size:   number of macroparticles read at a time
+    Returns:
+        n:   number density at the cell centres [m^-3], shape bins
+    """
+    hist = np.zeros(bins)
+    for ptcl in read_particle_hdf.iter_species(
+            path_to_file, species, n_dump_str, ('x', 'y', 'z', 'w'), chunk_size):
+        cic_histogram2d(
+            np.hypot(ptcl['x'], ptcl['y']), ptcl['z'], ptcl['w'],
+            r_range, z_range, bins, out=hist, reflect_a=r_range[0] == 0.,
+        )
+    dr = (r_range[1] - r_range[0]) / bins[0]
+    dz = (z_range[1] - z_range[0]) / bins[1]
+    r = r_range[0] + (np.arange(bins[0]) + 0.5) * dr
+    hist /= (2. * math.pi * dr * dz * r)[:, np.newaxis]
+    return hist
+
+def phase_space(path_to_file, species, n_dump_str, name, a_range, b_range, bins,
+                chunk_size=1000000):
+    """
+    Histogram a particle species in one of PHASE_SPACES.
+
+    Args:
+        path_to_file: location of a specific HDF5 file
+        species:      name of the particle species
+        n_dump_str:   dump number (as a string)
+        name:         key of PHASE_SPACES, e.g. 'z-uz'
+        a_range:      (min, max) of the first coordinate
+        b_range:      (min, max) of the second coordinate
+        bins:         (na, nb) number of bins
+        chunk_size:   number of macroparticles read at a time
+    Returns:
+        hist: summed macroparticle weights, shape bins
+    """
+    var_list, coordinates = PHASE_SPACES[name]
+    time = read_field_hdf.read_time(path_to_file, n_dump_str)
+    hist = np.zeros(bins)
+    for ptcl in read_particle_hdf.iter_species(
+            path_to_file, species, n_dump_str, var_list + ('w',), chunk_size):
+        a, b = coordinates(ptcl, time)
+        cic_histogram2d(a, b, ptcl['w'], a_range, b_range, bins, out=hist)
+    return hist
+
+def accumulate(path, func, num_workers=None, dtype=np.float32, **kwargs):
+    """
+    Run density_rz or phase_space on every dump, in parallel.
+
+    Each dump is binned in float64 and the results are stacked in the
+    compact dtype, ready to cache or animate.
+    Args:
+        path:         dump directory or consolidated HDF5 file
+        func:         density_rz or phase_space
+        num_workers:  number of processes; None for all cores
+        dtype:        dtype of the returned stack
+        kwargs:       arguments of func other than path_to_file, n_dump_str
+    Returns:
+        iterations:   dump numbers
+        stack:        results, shape (len(iterations),) + bins
+    """
+    dumps = read_field_hdf.list_dumps(path)
+    results = parallel.map_dumps(
+        functools.partial(_accumulate_one, func, kwargs), dumps, num_workers)
+    return np.array([d[0] for d in dumps]), np.array(results, dtype=dtype)
+
+def _accumulate_one(func, kwargs, n_dump, path_to_file):
+    return func(path_to_file, n_dump_str=str(n_dump), **kwargs)
+
+def _cic(x, x_range, n):
+    dx = (x_range[1] - x_range[0]) / n
+    f = (x - x_range[0]) / dx - 0.5
+    i = np.floor(f)
+    return i.astype(np.int64), f - i
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+Follow a running FBPIC job and reduce each dump as it is written.
+
+A dump is read only once it is complete: either a later dump already
+exists (FBPIC writes dumps in order), or its size and modification time
+have not changed for settle_time seconds. It must also open with h5py
+and contain its data/<iteration> group. A complete dump that still
+fails to open after max_attempts polls (e.g. a corrupt file) is logged,
+recorded in the state under skipped, and passed over, so it does not
+hold back the dumps after it.
+
+Scalar results are kept in a small JSON state file, rewritten
+atomically after every dump, so it can be watched while the job runs.
+Array results (e.g. on-axis Ez) are appended to an HDF5 file next to
+it, with one row per iteration. A follower restarted on the same state
+file skips the iterations already reduced.
+
+:copyright: Copyright (c) 2019 Radiasoft LLC. All Rights Reserved.
+:license: http://www.apache.org/licenses/LICENSE-2.0.html
+"""
+
+# Python imports
+import json
+import os
+import time
+
+import h5py
+import numpy as np
+
+# RadiaSoft imports
+from pykern.pkdebug import pkdlog
+from rsfbpic.rsdata import read_field_hdf
+
+#: polls a complete dump may fail to open before it is skipped
+MAX_ATTEMPTS = 3
+
+class DumpFollower:
+
+    def __init__(self, dump_dir, state_path, reductions, settle_time=30.,
+                 max_attempts=MAX_ATTEMPTS):
+        """
+        ::str:: dump_dir -- FBPIC output directory being written
+        ::str:: state_path -- JSON state file; arrays go to the same name with .h5
+        ::dict:: reductions -- name to func(path_to_file, n_dump_str)
+        ::float:: settle_time -- seconds a file must be unchanged to be complete
+        ::int:: max_attempts -- polls a complete dump may fail to open before it is skipped
+        """
+        self.dump_dir = dump_dir
+        self.state_path = state_path
+        self.arrays_path = os.path.splitext(state_path)[0] + '.h5'
+        self.reductions = reductions
+        self.settle_time = settle_time
+        self.max_attempts = max_attempts
+        self.state = dict(
+            dump_dir=dump_dir, iterations=[], time=[], scalars={}, arrays=[], skipped=[])
+        if os.path.exists(state_path):
+            with open(state_path) as f:
+                self.state = json.load(f)
+            self.state.setdefault('skipped', [])
+        self._seen = {}
+        self._failed = {}
+
+    def poll(self):
+        """
+        Reduce every newly completed dump, in order of iteration.
+
+        Returns:
+            iterations: dump numbers reduced by this call
+        """
+        done = set(self.state['iterations']) | set(self.state['skipped'])
+        dumps = read_field_hdf.list_dumps(self.dump_dir)
+        reduced = []
+        for i, (n_dump, path_to_file) in enumerate(dumps):
+            if n_dump in done:
+                continue
+            if not self._is_complete(path_to_file, n_dump, i < len(dumps) - 1):
+                if self._failed.get(path_to_file, 0) >= self.max_attempts:
+                    self._skip(n_dump, path_to_file)
+                    continue
+                # later dumps wait too, so results stay in iteration order
+                break
+            self._reduce(n_dump, path_to_file)
+            reduced.append(n_dump)
+        return reduced
+
+    def _is_complete(self, path_to_file, n_dump, has_successor):
+        stat = os.stat(path_to_file)
+        signature = (stat.st_size, stat.st_mtime)
+        now = time.time()
+        if self._seen.get(path_to_file, (None, None))[0] != signature:
+            # still being written, so earlier failures to open do not count
+            self._seen[path_to_file] = (signature, now)
+            self._failed.pop(path_to_file, None)
+        settled = now - self._seen[path_to_file][1] >= self.settle_time
+        if not (has_successor or settled):
+            return False
+        try:
+            with h5py.File(path_to_file, 'r') as file:
+                return str(n_dump) in file['data']
+        except (IOError, OSError, KeyError):
+            self._failed[path_to_file] = self._failed.get(path_to_file, 0) + 1
+            return False
+
+    def _reduce(self, n_dump, path_to_file):
+        n_dump_str = str(n_dump)
+        arrays = {}
+        for name, func in sorted(self.reductions.items()):
+            value = np.asarray(func(path_to_file, n_dump_str))
+            if value.ndim == 0:
+                self.state['scalars'].setdefault(name, []).append(float(value))
+            else:
+                arrays[name] = value
+        if arrays:
+            self._append_arrays(n_dump, arrays)
+        self.state['iterations'].append(n_dump)
+        self.state['time'].append(float(read_field_hdf.read_time(path_to_file, n_dump_str)))
+        self.state['arrays'] = sorted(set(self.state['arrays']) | set(arrays))
+        self._write_state()
+
+    def _skip(self, n_dump, path_to_file):
+        pkdlog(
+            '{}: skipping dump {}, failed to open {} times',
+            path_to_file, n_dump, self._failed[path_to_file],
+        )
+        self.state['skipped'].append(n_dump)
+        self._write_state()
+
+    def _write_state(self):
+        self.state['updated'] = time.time()
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.state, f)
+        os.rename(tmp_path, self.state_path)
+
+    def _append_arrays(self, n_dump, arrays):
+        with h5py.File(self.arrays_path, 'a') as file:
+            for name, value in arrays.items():
+                if name not in file:
+                    file.create_dataset(
+                        name, shape=(0,) + value.shape, maxshape=(None,) + value.shape,
+                        dtype=value.dtype, chunks=(16,) + value.shape)
+                    file.create_dataset(
+                        name + '_iteration', shape=(0,), maxshape=(None,), dtype='i8')
+                dataset = file[name]
+                iterations = file[name + '_iteration']
+                n = dataset.shape[0]
+                # a row written before a crash, but not recorded in the
+                # state file, is overwritten on restart
+                if n and iterations[n - 1] == n_dump:
+                    n -= 1
+                dataset.resize(n + 1, axis=0)
+                dataset[n] = value
+                iterations.resize(n + 1, axis=0)
+                iterations[n] = n_dump
+
+def follow(dump_dir, state_path, reductions, poll_interval=10., settle_time=30.,
+           idle_timeout=3600.):
+    """
+    Poll a dump directory until no new dump has appeared for a while.
+
+    Args:
+        dump_dir:      FBPIC output directory being written
+        state_path:    JSON state file
+        reductions:    dict of name to func(path_to_file, n_dump_str)
+        poll_interval: seconds between polls
+        settle_time:   seconds a file must be unchanged to be complete
+        idle_timeout:  stop after this many seconds without a new dump
+    Returns:
+        state: the final contents of the state file
+    """
+    follower = DumpFollower(dump_dir, state_path, reductions, settle_time)
+    last_new = time.time()
+    while True:
+        if follower.poll():
+            last_new = time.time()
+        elif time.time() - last_new >= idle_timeout:
+            return follower.state
+        time.sleep(poll_interval)
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+Run a per-dump calculation over many dumps on several cores.
+
+:copyright: Copyright (c) 2019 Radiasoft LLC. All Rights Reserved.
+:license: http://www.apache.org/licenses/LICENSE-2.0.html
+"""
+
+# Python imports
+import multiprocessing
+
+def map_dumps(func, dumps, num_workers=None):
+    """
+    Apply a function to every dump, in order, with a process pool.
+
+    func is called as func(n_dump, path_to_file) and must be picklable
+    (a module-level function, or a functools.partial of one).
+    Args:
+        func:         per-dump calculation
+        dumps:        list of (iteration, path_to_file) tuples
+        num_workers:  number of processes; None for all cores, 1 for serial
+    Returns:
+        results: list of return values of func, in the order of dumps
+    """
+    return map_items(func, dumps, num_workers, star=True)
+
+def map_items(func, items, num_workers=None, star=False):
+    """
+    Apply a picklable function to every item, in order, with a process pool.
+
+    Args:
+        func:         calculation applied to each item
+        items:        sequence of arguments
+        num_workers:  number of processes; None for all cores, 1 for serial
+        star:         unpack each item as positional arguments of func
+    Returns:
+        results: list of return values of func, in the order of items
+    """
+    items = list(items)
+    if num_workers is None:
+        num_workers = multiprocessing.cpu_count()
+    num_workers = min(num_workers, len(items))
+    if num_workers <= 1:
+        if star:
+            return [func(*item) for item in items]
+        return [func(item) for item in items]
+    pool = multiprocessing.Pool(num_workers)
+    try:
+        if star:
+            return pool.starmap(func, items)
+        return pool.map(func, items)
+    finally:
+        pool.close()
+        pool.join()
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+Opt-in reduced-precision (float32) analysis.
+
+FBPIC writes fields in float64, but plots and wake fits rarely need more
+than 3-4 significant figures. Readers, stacks and reductions in rsdata
+take a dtype argument: None keeps the stored precision, FLOAT32 halves
+memory, bandwidth and cache size. Conversion is done chunk by chunk
+while reading (see convert), so no full float64 copy is made.
+Sums, means and fits keep float64 accumulators.
+
+ErrorTally measures the error a conversion introduces; writers that
+store float32 record it in the attributes of the dataset (see
+ERROR_ATTRS).
+
+:copyright: Copyright (c) 2019 Radiasoft LLC. All Rights Reserved.
+:license: http://www.apache.org/licenses/LICENSE-2.0.html
+"""
+
+# Python imports
+import numpy as np
+
+#: reduced-precision dtype of the float32 analysis mode
+FLOAT32 = np.float32
+
+#: dtype of accumulators, whatever the dtype of the data
+ACCUMULATOR = np.float64
+
+#: number of elements converted at a time
+CHUNK_SIZE = 1 << 20
+
+#: dataset attributes recording the conversion error, see ErrorTally
+ERROR_ATTRS = ('conversion_max_abs_error', 'conversion_rms_error',
+               'conversion_max_rel_error')
+
+class ErrorTally:
+
+    def __init__(self):
+        """
+        Accumulate, in float64, the error of converting chunks of data.
+        """
+        self.count = 0
+        self.sum_sq = 0.
+        self.max_abs_error = 0.
+        self.max_abs = 0.
+
+    def update(self, reference, converted):
+        """
+        Add the error of one converted chunk.
+
+        Args:
+            reference: chunk before conversion
+            converted: the same chunk after conversion
+        """
+        reference = np.asarray(reference, dtype=ACCUMULATOR)
+        error = np.asarray(converted, dtype=ACCUMULATOR) - reference
+        finite = np.isfinite(reference)
+        if not finite.any():
+            return
+        error = error[finite]
+        self.count += error.size
+        self.sum_sq += float(np.dot(error, error))
+        self.max_abs_error = max(self.max_abs_error, float(np.abs(error).max()))
+        self.max_abs = max(self.max_abs, float(np.abs(reference[finite]).max()))
+
+    def report(self):
+        """
+        Summarize the error of all chunks.
+
+        Returns:
+            report: dict with the keys of ERROR_ATTRS; the relative error
+                is the maximum error over the maximum absolute value
+        """
+        return dict(
+            conversion_max_abs_error=self.max_abs_error,
+            conversion_rms_error=np.sqrt(self.sum_sq/max(self.count, 1)),
+            conversion_max_rel_error=self.max_abs_error/self.max_abs if self.max_abs else 0.,
+        )
+
+def read(dataset, selection=Ellipsis, dtype=None):
+    """
+    Read a selection of an h5py dataset, converting it while reading.
+
+    Conversion is done by convert, so at most CHUNK_SIZE elements are
+    held in the stored dtype at a time.
+    Args:
+        dataset:   h5py dataset
+        selection: index expression, e.g. (0, slice(None), slice(None))
+        dtype:     dtype to return; None for the stored dtype
+    Returns:
+        values: the selected data
+    """
+    if dtype is None or np.dtype(dtype) == dataset.dtype:
+        return dataset[selection]
+    return convert(dataset, dtype, selection=selection)
+
+def convert(values, dtype=FLOAT32, chunk_size=CHUNK_SIZE, tally=None, selection=Ellipsis):
+    """
+    Convert an array or h5py dataset chunk by chunk along its first sliced axis.
+
+    Args:
+        values:     array or h5py dataset
+        dtype:      dtype to convert to
+        chunk_size: number of elements converted at a time
+        tally:      ErrorTally to add the conversion error to
+        selection:  integers and slices with positive steps, or Ellipsis;
+                    missing trailing axes are taken whole
+    Returns:
+        converted: new array of dtype
+    """
+    key = _expand_selection(selection, values.ndim)
+    axes = [a for a, k in enumerate(key) if isinstance(k, slice)]
+    shape = tuple(len(range(*key[a].indices(values.shape[a]))) for a in axes)
+    converted = np.empty(shape, dtype=dtype)
+    if not shape or not shape[0]:
+        chunk = values[key]
+        converted[...] = chunk
+        if tally is not None:
+            tally.update(chunk, converted)
+        return converted
+    first = axes[0]
+    start, _, step = key[first].indices(values.shape[first])
+    rows = max(chunk_size//max(int(np.prod(shape[1:])), 1), 1)
+    for i in range(0, shape[0], rows):
+        n = min(rows, shape[0] - i)
+        block = list(key)
+        block[first] = slice(start + i*step, start + (i + n - 1)*step + 1, step)
+        chunk = values[tuple(block)]
+        converted[i:i + n] = chunk
+        if tally is not None:
+            tally.update(chunk, converted[i:i + n])
+    return converted
+
+def _expand_selection(selection, ndim):
+    # one integer or slice per axis
+    if selection is Ellipsis:
+        selection = ()
+    elif not isinstance(selection, tuple):
+        selection = (selection,)
+    if any(k is Ellipsis for k in selection):
+        i = selection.index(Ellipsis)
+        fill = (slice(None),)*(ndim - len(selection) + 1)
+        selection = selection[:i] + fill + selection[i + 1:]
+    key = tuple(selection) + (slice(None),)*(ndim - len(selection))
+    for k in key:
+        if isinstance(k, slice) and (k.step or 1) < 1:
+            raise ValueError('selection {} must have positive steps'.format(selection))
+    return key
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+Build multi-resolution min/max pyramids of field frames for browsing.
+
+Level 0 of a pyramid is the full-resolution frame (azimuthal mode 0);
+each further level halves both axes, keeping the minimum and maximum of
+every 2x2 block, so narrow peaks stay visible when zoomed out. Levels
+are stored as (iteration, r, z) datasets, chunked in tiles, so fetch
+reads only the tiles of the level that matches the current view,
+e.g. from a %matplotlib widget callback.
+
+The file holds iteration, time, r and z0 (the first z of each dump),
+and for each field (e.g. 'E/z' or 'rho') the groups level0, level1, ...
+with min and max datasets; at level 0 they are the same dataset.
+
+:copyright: Copyright (c) 2019 Radiasoft LLC. All Rights Reserved.
+:license: http://www.apache.org/licenses/LICENSE-2.0.html
+"""
+
+# Python imports
+import functools
+import multiprocessing
+
+import h5py
+import numpy as np
+
+# RadiaSoft imports
+from rsfbpic.rsdata import parallel
+from rsfbpic.rsdata import precision
+from rsfbpic.rsdata import read_field_hdf
+
+#: chunk shape (r, z) of every level
+TILE = (64, 256)
+
+def downsample(frame_min, frame_max):
+    """
+    Halve both axes of a frame, keeping the extremes of each 2x2 block.
+
+    An odd trailing row or column forms a block of its own.
+    Args:
+        frame_min: minima of the finer level, shape (nr, nz)
+        frame_max: maxima of the finer level, shape (nr, nz)
+    Returns:
+        coarse_min: shape ((nr+1)//2, (nz+1)//2)
+        coarse_max: likewise
+    """
+    pad = ((0, frame_min.shape[0] % 2), (0, frame_min.shape[1] % 2))
+    res = []
+    for frame, reduce in ((frame_min, np.min), (frame_max, np.max)):
+        frame = np.pad(frame, pad, mode='edge')
+        nr, nz = frame.shape
+        res.append(reduce(frame.reshape(nr//2, 2, nz//2, 2), axis=(1, 3)))
+    return res[0], res[1]
+
+def calc_levels(shape, tile=TILE):
+    """
+    Count the levels needed for the coarsest to fit in one tile.
+
+    Args:
+        shape: (nr, nz) of the full-resolution frame
+        tile:  chunk shape (r, z)
+    Returns:
+        levels: number of levels, including level 0
+    """
+    levels = 1
+    nr, nz = shape
+    while nr > tile[0] or nz > tile[1]:
+        nr = (nr + 1)//2
+        nz = (nz + 1)//2
+        levels += 1
+    return levels
+
+def build_pyramid(path, out_path, fields, levels=None, tile=TILE, dtype=precision.FLOAT32,
+                  compression='gzip', num_workers=None):
+    """
+    Write min/max pyramids of fields for every dump at a path.
+
+    Dumps are reduced in parallel and written a block at a time, so only
+    a few full frames are in memory.
+    Args:
+        path:        dump directory or consolidated HDF5 file
+        out_path:    location of the pyramid file
+        fields:      list of (field_name, field_coord); field_coord None
+                     for a scalar, e.g. [('E', 'z'), ('rho', None)]
+        levels:      number of levels; default from calc_levels
+        tile:        chunk shape (r, z) of every level
+        dtype:       dtype of the stored levels
+        compression: HDF5 compression filter ('gzip', 'lzf' or None)
+        num_workers: number of processes; None for all cores
+    Returns:
+        out_path: location of the written file
+    """
+    dumps = read_field_hdf.list_dumps(path)
+    if not dumps:
+        raise ValueError('no dumps found in {}'.format(path))
+    keys = [_key(name, coord) for name, coord in fields]
+    r, z = read_field_hdf.read_r_z(dumps[0][1], fields[0][0], str(dumps[0][0]))
+    if levels is None:
+        levels = calc_levels((len(r), len(z)), tile)
+    if num_workers is None:
+        num_workers = multiprocessing.cpu_count()
+    func = functools.partial(_pyramid_one, fields, levels)
+    with h5py.File(out_path, 'w') as out:
+        out['iteration'] = np.array([d[0] for d in dumps])
+        out['r'] = r
+        out['z0'] = np.zeros(len(dumps))
+        out['time'] = np.zeros(len(dumps))
+        out.attrs['dz'] = z[1] - z[0]
+        out.attrs['levels'] = levels
+        for key in keys:
+            nr, nz = len(r), len(z)
+            for k in range(levels):
+                group = out.create_group('{}/level{}'.format(key, k))
+                shape = (len(dumps), nr, nz)
+                chunks = (1, min(nr, tile[0]), min(nz, tile[1]))
+                for name in ('min', 'max') if k else ('min',):
+                    group.create_dataset(
+                        name, shape=shape, dtype=dtype, chunks=chunks,
+                        compression=compression, shuffle=compression is not None)
+                if not k:
+                    group['max'] = group['min']
+                nr = (nr + 1)//2
+                nz = (nz + 1)//2
+        block = 2*max(num_workers, 1)
+        for start in range(0, len(dumps), block):
+            results = parallel.map_dumps(func, dumps[start:start + block], num_workers)
+            for i, (time, z0, pyramids) in enumerate(results, start):
+                out['time'][i] = time
+                out['z0'][i] = z0
+                for key, pyramid in zip(keys, pyramids):
+                    for k, (frame_min, frame_max) in enumerate(pyramid):
+                        group = out['{}/level{}'.format(key, k)]
+                        group['min'][i] = frame_min
+                        if k:
+                            group['max'][i] = frame_max
+    return out_path
+
+def open_pyramid(path_to_pyramid):
+    """
+    Open a pyramid written by build_pyramid without reading it.
+
+    The caller closes the file.
+    Args:
+        path_to_pyramid: location of the pyramid file
+    Returns:
+        file: read-only h5py.File
+    """
+    return h5py.File(path_to_pyramid, 'r')
+
+def fetch(pyramid, field, iteration, r_range=None, z_range=None, max_shape=(256, 1024)):
+    """
+    Read the coarsest level that resolves a view, only within the view.
+
+    Args:
+        pyramid:   file returned by open_pyramid
+        field:     field key, e.g. 'E/z' or 'rho'
+        iteration: dump number
+        r_range:   (low, high) radial extent of the view [m]; default all
+        z_range:   (low, high) axial extent of the view [m]; default all
+        max_shape: largest (r, z) shape worth drawing, e.g. the size of
+                   the axes in pixels
+    Returns:
+        view: dict of min and max (equal at level 0), r and z of the
+            cell centres, and level
+    """
+    i = int(np.flatnonzero(pyramid['iteration'][...] == iteration)[0])
+    r = pyramid['r'][...]
+    dz = pyramid.attrs['dz']
+    z0 = pyramid['z0'][i]
+    dr = r[1] - r[0]
+    nr, nz = pyramid['{}/level0/min'.format(field)].shape[1:]
+    ir = _index_range(r_range, r[0], dr, nr)
+    iz = _index_range(z_range, z0, dz, nz)
+    level = 0
+    while level + 1 < pyramid.attrs['levels'] and (
+            ir[1] - ir[0] > max_shape[0] << level or iz[1] - iz[0] > max_shape[1] << level):
+        level += 1
+    a, b = ir[0] >> level, -(-ir[1] >> level)
+    c, d = iz[0] >> level, -(-iz[1] >> level)
+    group = pyramid['{}/level{}'.format(field, level)]
+    frame_min = group['min'][i, a:b, c:d]
+    frame_max = frame_min if level == 0 else group['max'][i, a:b, c:d]
+    # centres of the coarse cells, which cover 2**level fine cells
+    offset = 0.5*((1 << level) - 1)
+    return dict(
+        min=frame_min,
+        max=frame_max,
+        r=r[0] + ((np.arange(a, b) << level) + offset)*dr,
+        z=z0 + ((np.arange(c, d) << level) + offset)*dz,
+        level=level,
+    )
+
+def _index_range(value_range, start, spacing, n):
+    if value_range is None:
+        return 0, n
+    # a range ending on grid points covers exactly those points
+    low = int(np.floor((value_range[0] - start)/spacing + 1.e-6))
+    high = int(np.ceil((value_range[1] - start)/spacing - 1.e-6)) + 1
+    low = min(max(low, 0), n - 1)
+    return low, min(max(high, low + 1), n)
+
+def _key(field_name, field_coord):
+    return field_name if field_coord is None else field_name + '/' + field_coord
+
+def _pyramid_one(fields, levels, n_dump, path_to_file):
+    pyramids = []
+    for field_name, field_coord in fields:
+        frame, _, z, time = read_field_hdf.read_field_rz(
+            path_to_file, field_name, field_coord, str(n_dump))
+        pyramid = [(frame, frame)]
+        for _ in range(1, levels):
+            pyramid.append(downsample(*pyramid[-1]))
+        pyramids.append(pyramid)
+    return time, z[0], pyramids
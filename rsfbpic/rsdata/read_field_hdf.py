@@ -7,9 +7,22 @@ Read openPMD field data from HDF5 file without using openPMD.
 """
 
 # Python imports
+import os
+import re
+
 import h5py
+import numpy as np
+
+# RadiaSoft imports
+from rsfbpic.rsdata import precision
+
+#: FBPIC names one file per dump, e.g. data00000280.h5
+DUMP_FILE_PATTERN = re.compile(r'^data(\d+)\.h5$')
+
+#: group holding the stacked fields of a file written by rsdata.repack
+REPACK_STACK_PATH = 'repack/fields'
 
-def read_vector(path_to_file, field_name, field_coord, n_dump_str):
+def read_vector(path_to_file, field_name, field_coord, n_dump_str, dtype=None):
     """
     Read one component of a vector field from an HDF5 file.
 
@@ -20,6 +33,7 @@ def read_vector(path_to_file, field_name, field_coord, n_dump_str):
         field_name:   name of field in the HDF5 file
         field_coord:  field coordinate ('r','t', or 'z')
         n_dump_str:   dump number (as a string)
+        dtype:        dtype to read as, e.g. precision.FLOAT32; None as stored
     Returns:
         field:     specified component of the field data
    """
@@ -29,11 +43,11 @@ def read_vector(path_to_file, field_name, field_coord, n_dump_str):
     all_fields = step.get('fields')
     my_field = all_fields.get(field_name)
     field_h5 = my_field.get(field_coord)
-    field = field_h5[0,:,:]
+    field = precision.read(field_h5, (0, slice(None), slice(None)), dtype)
 
     return field
 
-def read_scalar(path_to_file, field_name, n_dump_str):
+def read_scalar(path_to_file, field_name, n_dump_str, dtype=None):
     """
     Read a scalar field by name from an HDF5 file.
 
@@ -43,6 +57,7 @@ def read_scalar(path_to_file, field_name, n_dump_str):
         path_to_file: location of a specific HDF5 file
         field_name:   name of field in the HDF5 file
         n_dump_str:   dump number (as a string)
+        dtype:        dtype to read as, e.g. precision.FLOAT32; None as stored
     Returns:
         field:     the requested field data
    """
@@ -51,7 +66,7 @@ def read_scalar(path_to_file, field_name, n_dump_str):
     step = data.get(n_dump_str)
     all_fields = step.get('fields')
     field_h5 = all_fields.get(field_name)
-    field = field_h5[0,:,:]
+    field = precision.read(field_h5, (0, slice(None), slice(None)), dtype)
 
     return field
 
@@ -99,3 +114,148 @@ def read_time(path_to_file, n_dump_str):
     time = step.attrs["time"] * step.attrs["timeUnitSI"]
 
     return time
+
+def list_dumps(path):
+    """
+    List the dumps available at a path, sorted by iteration.
+
+    The path may be an FBPIC output directory (one dataNNNNNNNN.h5 file
+    per iteration) or a single HDF5 file holding several iterations
+    under data/, such as one written by :mod:`rsfbpic.rsdata.repack`.
+    Args:
+        path: location of a dump directory or of a single HDF5 file
+    Returns:
+        dumps: list of (iteration, path_to_file) tuples
+    """
+    if os.path.isdir(path):
+        dumps = []
+        for name in os.listdir(path):
+            match = DUMP_FILE_PATTERN.match(name)
+            if match:
+                dumps.append((int(match.group(1)), os.path.join(path, name)))
+        return sorted(dumps)
+    with h5py.File(path, 'r') as file:
+        return sorted((int(n), path) for n in file['data'].keys())
+
+def read_r_z(path_to_file, field_name, n_dump_str):
+    """
+    Read the radial and axial grid coordinates from an HDF5 file.
+
+    Assume openPMD conventions
+    Assume 2D mesh of values (ie quasi-3D rz)
+    Args:
+        path_to_file: location of a specific HDF5 file
+        field_name:   name of field associated with the grid
+        n_dump_str:   dump number (as a string)
+    Returns:
+        r:   radial grid coordinates [m]
+        z:   axial  grid coordinates [m]
+    """
+    with h5py.File(path_to_file, 'r') as file:
+        field_h5 = file['data'][n_dump_str]['fields'][field_name]
+        return _mesh_r_z(field_h5)
+
+def read_field_rz(path_to_file, field_name, field_coord, n_dump_str, dtype=None):
+    """
+    Read a field together with its grid and time, opening the file once.
+
+    Assume openPMD conventions
+    Assume 2D mesh of values (ie quasi-3D rz)
+    Args:
+        path_to_file: location of a specific HDF5 file
+        field_name:   name of field in the HDF5 file
+        field_coord:  field coordinate ('r','t','z'), or None for a scalar
+        n_dump_str:   dump number (as a string)
+        dtype:        dtype to read the field as; None as stored
+    Returns:
+        field: the requested field data (azimuthal mode 0)
+        r:     radial grid coordinates [m]
+        z:     axial  grid coordinates [m]
+        time:  time [s] at which data was dumped
+    """
+    with h5py.File(path_to_file, 'r') as file:
+        step = file['data'][n_dump_str]
+        field_h5 = step['fields'][field_name]
+        r, z = _mesh_r_z(field_h5)
+        if field_coord is not None:
+            field_h5 = field_h5[field_coord]
+        field = precision.read(field_h5, (0, slice(None), slice(None)), dtype)
+        time = step.attrs["time"] * step.attrs["timeUnitSI"]
+    return field, r, z, time
+
+def read_line(path_to_file, field_name, field_coord, n_dump_str, i_r=0, mode=0, dtype=None):
+    """
+    Read one radial row of a field, e.g. on axis, without the rest of the frame.
+
+    Assume openPMD conventions
+    Args:
+        path_to_file: location of a specific HDF5 file
+        field_name:   name of field in the HDF5 file
+        field_coord:  field coordinate ('r','t','z'), or None for a scalar
+        n_dump_str:   dump number (as a string)
+        i_r:          radial index of the row (0 is on axis)
+        mode:         index of the azimuthal mode component
+        dtype:        dtype to read the row as; None as stored
+    Returns:
+        line:  field along z
+        z:     axial grid coordinates [m]
+        time:  time [s] at which data was dumped
+    """
+    with h5py.File(path_to_file, 'r') as file:
+        step = file['data'][n_dump_str]
+        field_h5 = step['fields'][field_name]
+        _, z = _mesh_r_z(field_h5)
+        if field_coord is not None:
+            field_h5 = field_h5[field_coord]
+        line = precision.read(field_h5, (mode, i_r, slice(None)), dtype)
+        time = step.attrs["time"] * step.attrs["timeUnitSI"]
+    return line, z, time
+
+def read_series(path, field_name, field_coord, i_r, mode=0, dtype=None):
+    """
+    Read one radial row of a field for every dump at a path.
+
+    A repacked file is read with a single slice of its stacked field;
+    otherwise every dump file is opened in turn.
+    Args:
+        path:         dump directory or consolidated HDF5 file
+        field_name:   name of field in the HDF5 file
+        field_coord:  field coordinate ('r','t','z'), or None for a scalar
+        i_r:          radial index of the row (0 is on axis)
+        mode:         index of the azimuthal mode component
+        dtype:        dtype to read the rows as; None as stored
+    Returns:
+        iterations:   dump numbers
+        series:       field rows, shape (len(iterations), nz)
+    """
+    component = field_name if field_coord is None else field_name + '/' + field_coord
+    if os.path.isfile(path):
+        with h5py.File(path, 'r') as file:
+            if REPACK_STACK_PATH in file:
+                stack = file[REPACK_STACK_PATH][component]
+                return file['repack/iteration'][...], precision.read(
+                    stack, (slice(None), mode, i_r, slice(None)), dtype)
+    iterations = []
+    series = []
+    for n_dump, path_to_file in list_dumps(path):
+        with h5py.File(path_to_file, 'r') as file:
+            fields = file['data'][str(n_dump)]['fields']
+            series.append(precision.read(
+                fields[component], (mode, i_r, slice(None)), dtype))
+        iterations.append(n_dump)
+    return np.array(iterations), np.array(series, dtype=dtype)
+
+def _mesh_r_z(field_h5):
+    # a vector field keeps the grid attributes on the record, and the
+    # position within the cell on each of its components
+    component = field_h5
+    if isinstance(field_h5, h5py.Group):
+        component = field_h5[list(field_h5.keys())[0]]
+    position = component.attrs.get('position', np.zeros(2))
+    unit = field_h5.attrs['gridUnitSI']
+    offset = field_h5.attrs['gridGlobalOffset']
+    spacing = field_h5.attrs['gridSpacing']
+    nr, nz = component.shape[-2:]
+    r = (offset[0] + (np.arange(nr) + position[0]) * spacing[0]) * unit
+    z = (offset[1] + (np.arange(nz) + position[1]) * spacing[1]) * unit
+    return r, z
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Read openPMD particle data from HDF5 file without using openPMD.
+
+Quantities use the names of opmd_viewer: x, y, z [m], ux, uy, uz
+(momentum / mc) and w (macroparticle weight).
+
+:copyright: Copyright (c) 2019 Radiasoft LLC. All Rights Reserved.
+:license: http://www.apache.org/licenses/LICENSE-2.0.html
+"""
+
+# Python imports
+import h5py
+import numpy as np
+import scipy.constants
+
+#: record and component of each quantity, relative to the species group
+RECORDS = {
+    'x': ('position', 'x'),
+    'y': ('position', 'y'),
+    'z': ('position', 'z'),
+    'ux': ('momentum', 'x'),
+    'uy': ('momentum', 'y'),
+    'uz': ('momentum', 'z'),
+    'w': ('weighting', None),
+}
+
+def read_species(path_to_file, species, n_dump_str, var_list, start=0, stop=None):
+    """
+    Read quantities of a particle species from an HDF5 file.
+
+    Assume openPMD conventions
+    Args:
+        path_to_file: location of a specific HDF5 file
+        species:      name of the particle species
+        n_dump_str:   dump number (as a string)
+        var_list:     names of quantities to read, e.g. ['z', 'uz', 'w']
+        start:        index of the first macroparticle to read
+        stop:         index past the last macroparticle to read
+    Returns:
+        ptcl: dict of arrays in SI units, keyed by the names in var_list
+    """
+    with h5py.File(path_to_file, 'r') as file:
+        group = file['data'][n_dump_str]['particles'][species]
+        return _read(group, var_list, slice(start, stop))
+
+def count_species(path_to_file, species, n_dump_str):
+    """
+    Count the macroparticles of a species in an HDF5 file.
+
+    Args:
+        path_to_file: location of a specific HDF5 file
+        species:      name of the particle species
+        n_dump_str:   dump number (as a string)
+    Returns:
+        n: number of macroparticles
+    """
+    with h5py.File(path_to_file, 'r') as file:
+        group = file['data'][n_dump_str]['particles'][species]
+        return _component_len(_component(group, 'w'))
+
+def read_constant(path_to_file, species, n_dump_str, record):
+    """
+    Read a constant record of a particle species, e.g. its mass.
+
+    Args:
+        path_to_file: location of a specific HDF5 file
+        species:      name of the particle species
+        n_dump_str:   dump number (as a string)
+        record:       name of the record, 'mass' or 'charge'
+    Returns:
+        value: the value of the record in SI units
+    """
+    with h5py.File(path_to_file, 'r') as file:
+        group = file['data'][n_dump_str]['particles'][species]
+        return float(_constant(group, record))
+
+def iter_species(path_to_file, species, n_dump_str, var_list, chunk_size=1000000):
+    """
+    Read a particle species in chunks of macroparticles.
+
+    Only one chunk of the requested quantities is in memory at a time.
+    Args:
+        path_to_file: location of a specific HDF5 file
+        species:      name of the particle species
+        n_dump_str:   dump number (as a string)
+        var_list:     names of quantities to read, e.g. ['z', 'uz', 'w']
+        chunk_size:   number of macroparticles per chunk
+    Returns:
+        generator of dicts as returned by read_species
+    """
+    with h5py.File(path_to_file, 'r') as file:
+        group = file['data'][n_dump_str]['particles'][species]
+        n = _component_len(_component(group, 'w'))
+        for start in range(0, n, chunk_size):
+            yield _read(group, var_list, slice(start, start + chunk_size))
+
+def _component(group, name):
+    record, component = RECORDS[name]
+    if component is None:
+        return group[record]
+    return group[record][component]
+
+def _component_len(component):
+    # constant record components are groups with 'value' and 'shape'
+    if isinstance(component, h5py.Group):
+        return int(component.attrs['shape'][0])
+    return component.shape[0]
+
+def _constant(group, record):
+    item = group[record]
+    return item.attrs['value'] * item.attrs['unitSI']
+
+def _read(group, var_list, selection):
+    ptcl = {}
+    for name in var_list:
+        component = _component(group, name)
+        if isinstance(component, h5py.Group):
+            n = len(range(*selection.indices(_component_len(component))))
+            values = np.full(n, component.attrs['value'], dtype=np.float64)
+        else:
+            values = component[selection].astype(np.float64)
+        values *= component.attrs['unitSI']
+        if RECORDS[name][0] == 'momentum':
+            values /= _constant(group, 'mass') * scipy.constants.c
+        elif RECORDS[name][0] == 'position' and 'positionOffset' in group:
+            offset = _component_offset(group, RECORDS[name][1], selection)
+            values += offset
+        ptcl[name] = values
+    return ptcl
+
+def _component_offset(group, axis, selection):
+    offset = group['positionOffset'][axis]
+    if isinstance(offset, h5py.Group):
+        return offset.attrs['value'] * offset.attrs['unitSI']
+    return offset[selection] * offset.attrs['unitSI']
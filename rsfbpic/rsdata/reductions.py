@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+Per-dump reductions of FBPIC field data.
+
+Each reduction is called as func(path_to_file, n_dump_str) and returns a
+number or a 1D array, so it can be registered with
+:mod:`rsfbpic.rsdata.follow` or run over a whole run with
+:func:`rsfbpic.rsdata.shard.reduce_dumps`.
+
+:copyright: Copyright (c) 2019 Radiasoft LLC. All Rights Reserved.
+:license: http://www.apache.org/licenses/LICENSE-2.0.html
+"""
+
+# Python imports
+import functools
+
+import numpy as np
+import scipy.constants
+
+# RadiaSoft imports
+from rsfbpic.rsdata import precision
+from rsfbpic.rsdata import read_field_hdf
+
+def calc_pw_curl(F_r, F_z, r, z):
+    """
+    Compute the azimuthal curl of the force, dFr/dz - dFz/dr.
+
+    The curl vanishes in the Panofsky-Wenzel limit. Derivatives are
+    co-located at the cell corners, between grid points in r and z.
+    Args:
+        F_r:  radial force per charge, Er - c*Btheta, shape (nr, nz)
+        F_z:  longitudinal force per charge, Ez, shape (nr, nz)
+        r:    radial grid coordinates
+        z:    axial grid coordinates
+    Returns:
+        curl_F:  curl of the force, shape (nr-1, nz-1)
+        curl_rs: radial coordinates of the curl
+        curl_zs: axial coordinates of the curl
+    """
+    dr = r[1] - r[0]
+    dz = z[1] - z[0]
+    dFr_dz = 0.5*((F_r[1:, 1:] - F_r[1:, :-1]) + (F_r[:-1, 1:] - F_r[:-1, :-1]))/dz
+    dFz_dr = 0.5*((F_z[1:, 1:] - F_z[:-1, 1:]) + (F_z[1:, :-1] - F_z[:-1, :-1]))/dr
+    return dFr_dz - dFz_dr, 0.5*(r[1:] + r[:-1]), 0.5*(z[1:] + z[:-1])
+
+def calc_bubble_radius(rho, r, n_pe, threshold=0.5):
+    """
+    Extract the plasma bubble radius from the charge density.
+
+    The background is the density at the outer edge of the grid. A cell
+    is in the bubble when the density there exceeds the background by
+    more than threshold*e*n_pe, i.e. the plasma electrons have been
+    expelled. The bubble radius of each column is the outer edge of the
+    innermost run of such cells, so a drive beam on axis is skipped.
+    Args:
+        rho:       charge density, shape (nr, nz) [C/m^3]
+        r:         radial grid coordinates (cell centres) [m]
+        n_pe:      number density of the electron plasma [m^-3]
+        threshold: fraction of the plasma charge density
+    Returns:
+        rb: bubble radius for each column, 0 without a bubble [m]
+    """
+    excess = (rho - rho[-1:, :])/(scipy.constants.e*n_pe)
+    depleted = excess > threshold
+    index = np.arange(rho.shape[0])[:, np.newaxis]
+    start = np.argmax(depleted, axis=0)
+    outside = ~depleted & (index > start)
+    stop = np.where(outside.any(axis=0), np.argmax(outside, axis=0), rho.shape[0])
+    edges = np.append(r - 0.5*(r[1] - r[0]), r[-1] + 0.5*(r[1] - r[0]))
+    return np.where(depleted.any(axis=0), edges[stop], 0.)
+
+def on_axis_ez(path_to_file, n_dump_str, dtype=None):
+    """
+    Read the longitudinal electric field on axis.
+
+    Args:
+        path_to_file: location of a specific HDF5 file
+        n_dump_str:   dump number (as a string)
+        dtype:        dtype to read as, e.g. precision.FLOAT32; None as stored
+    Returns:
+        ez: Ez at the first radial grid point [V/m]
+    """
+    return read_field_hdf.read_line(path_to_file, 'E', 'z', n_dump_str, dtype=dtype)[0]
+
+def bubble_radius(path_to_file, n_dump_str, n_pe, field_name='rho', threshold=0.5,
+                  dtype=None):
+    """
+    Extract the bubble radius along z from a charge density dump.
+
+    Args:
+        path_to_file: location of a specific HDF5 file
+        n_dump_str:   dump number (as a string)
+        n_pe:         number density of the electron plasma [m^-3]
+        field_name:   name of the charge density field
+        threshold:    see calc_bubble_radius
+        dtype:        dtype to read as, e.g. precision.FLOAT32; None as stored
+    Returns:
+        rb: bubble radius for each z grid point [m]
+    """
+    rho, r, _, _ = read_field_hdf.read_field_rz(
+        path_to_file, field_name, None, n_dump_str, dtype)
+    return calc_bubble_radius(rho, r, n_pe, threshold)
+
+def pw_curl_norm(path_to_file, n_dump_str, dtype=None):
+    """
+    Compute the rms Panofsky-Wenzel curl of the force over the grid.
+
+    The mean square is accumulated in float64, scaled by the peak so
+    float32 data cannot overflow.
+    Args:
+        path_to_file: location of a specific HDF5 file
+        n_dump_str:   dump number (as a string)
+        dtype:        dtype to read as, e.g. precision.FLOAT32; None as stored
+    Returns:
+        norm: rms of dFr/dz - dFz/dr [V/m^2]
+    """
+    E_z, r, z, _ = read_field_hdf.read_field_rz(path_to_file, 'E', 'z', n_dump_str, dtype)
+    E_r = read_field_hdf.read_vector(path_to_file, 'E', 'r', n_dump_str, dtype)
+    B_t = read_field_hdf.read_vector(path_to_file, 'B', 't', n_dump_str, dtype)
+    curl_F, _, _ = calc_pw_curl(E_r - scipy.constants.c*B_t, E_z, r, z)
+    scale = float(np.abs(curl_F).max()) or 1.
+    return scale*float(np.sqrt(np.mean(np.square(curl_F/scale), dtype=precision.ACCUMULATOR)))
+
+def wake_ez(path_to_file, n_dump_str, baseline_path, i_r=0, dtype=None):
+    """
+    Subtract the Ez of a baseline run from Ez along a row of a dump.
+
+    The baseline (e.g. the drive beam alone) must have been run on the
+    same grid and dumped at the same iteration, so what is left is the
+    wake of whatever the run adds, e.g. a witness beam.
+    Args:
+        path_to_file:  location of a specific HDF5 file
+        n_dump_str:    dump number (as a string)
+        baseline_path: dump directory or consolidated HDF5 file of the baseline
+        i_r:           radial index of the row (0 is on axis)
+        dtype:         dtype to read as, e.g. precision.FLOAT32; None as stored
+    Returns:
+        ez: Ez of the dump minus Ez of the baseline [V/m]
+    """
+    baseline = dict(read_field_hdf.list_dumps(baseline_path))
+    if int(n_dump_str) not in baseline:
+        raise ValueError('{}: no baseline dump {}'.format(baseline_path, n_dump_str))
+    ez, z, _ = read_field_hdf.read_line(
+        path_to_file, 'E', 'z', n_dump_str, i_r=i_r, dtype=dtype)
+    ez_base, z_base, _ = read_field_hdf.read_line(
+        baseline[int(n_dump_str)], 'E', 'z', n_dump_str, i_r=i_r, dtype=dtype)
+    if len(z) != len(z_base) or not np.allclose(z, z_base):
+        raise ValueError('{}: baseline dump {} is on another grid'.format(
+            baseline_path, n_dump_str))
+    return ez - ez_base
+
+def default_reductions(n_pe, dtype=None):
+    """
+    Build the standard set of reductions for a run.
+
+    Args:
+        n_pe:  number density of the electron plasma [m^-3]
+        dtype: dtype fields are read as, e.g. precision.FLOAT32; None as stored
+    Returns:
+        reductions: dict of name to func(path_to_file, n_dump_str)
+    """
+    return dict(
+        on_axis_ez=functools.partial(on_axis_ez, dtype=dtype),
+        bubble_radius=functools.partial(bubble_radius, n_pe=n_pe, dtype=dtype),
+        pw_curl_norm=functools.partial(pw_curl_norm, dtype=dtype),
+    )
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+Repack FBPIC per-iteration dumps into one chunked HDF5 file.
+
+FBPIC writes one contiguous file per iteration, which suits snapshots
+but not queries across iterations. The repacked file stores each field
+component as a single (iteration, mode, r, z) dataset with chunking
+tuned for the expected access, and keeps the openPMD group-based layout
+(data/<iteration>/fields/...) as virtual datasets into those stacks, so
+the readers in :mod:`rsfbpic.rsdata.read_field_hdf` work unchanged.
+
+:copyright: Copyright (c) 2019 Radiasoft LLC. All Rights Reserved.
+:license: http://www.apache.org/licenses/LICENSE-2.0.html
+"""
+
+# Python imports
+import os
+
+import h5py
+import numpy as np
+
+# RadiaSoft imports
+from rsfbpic.rsdata import precision
+from rsfbpic.rsdata import read_field_hdf
+
+#: chunk shapes (iteration, mode, r, z), clipped to the data shape
+CHUNKING = {
+    # a patch of one field over many iterations
+    'time_series': (32, 1, 16, 128),
+    # a few radial rows, e.g. on-axis Ez, over all iterations
+    'on_axis': (256, 1, 1, 256),
+    # whole frames, like the original dumps
+    'snapshot': (1, 1, None, None),
+}
+
+#: bytes of source data buffered per field component while repacking
+BUFFER_BYTES = 2**28
+
+def repack(dump_dir, out_path, chunking='time_series', compression='gzip',
+           float32=False):
+    """
+    Rewrite a dump directory as a single consolidated HDF5 file.
+
+    Field components are stacked over iterations with shuffle and
+    compression, a chunk deep at a time, so each compressed chunk is
+    written once; particle records are copied as they are. Only one
+    dump file is open at a time: a block of dumps one chunk deep (up to
+    256 for on_axis) is read a file at a time into a buffer of radial
+    slabs of at most BUFFER_BYTES (or one chunk high). The file is
+    written under a temporary name and renamed when complete.
+    Args:
+        dump_dir:     FBPIC output directory (dataNNNNNNNN.h5 files)
+        out_path:     location of the consolidated file
+        chunking:     key of CHUNKING, or an explicit 4-tuple chunk shape
+        compression:  HDF5 compression filter ('gzip', 'lzf' or None)
+        float32:      down-convert field data to single precision, and
+                      record the error in the attributes of each stack
+                      (precision.ERROR_ATTRS)
+    Returns:
+        out_path:     location of the consolidated file
+    """
+    dumps = read_field_hdf.list_dumps(dump_dir)
+    if not dumps:
+        raise ValueError('no dumps found in {}'.format(dump_dir))
+    tmp_path = out_path + '.tmp'
+    with h5py.File(tmp_path, 'w') as out:
+        with h5py.File(dumps[0][1], 'r') as src:
+            _copy_attrs(src, out)
+            stacks = _create_stacks(
+                out, src['data'][str(dumps[0][0])]['fields'], len(dumps),
+                chunking, compression, float32,
+            )
+        out.attrs['iterationEncoding'] = 'groupBased'
+        out.attrs['iterationFormat'] = '/data/%T/'
+        tallies = {}
+        # a block of iterations one chunk deep is written a slab of
+        # chunks at a time, so every compressed chunk is written once
+        depth = next(iter(stacks.values())).chunks[0]
+        for start in range(0, len(dumps), depth):
+            block = dumps[start:start + depth]
+            for i, (n_dump, path_to_file) in enumerate(block):
+                with h5py.File(path_to_file, 'r') as src:
+                    _repack_step(src, out, n_dump, start + i, stacks)
+            for path, stack in stacks.items():
+                _write_block(stack, block, start, tallies, path)
+        for path, tally in tallies.items():
+            for key, value in tally.report().items():
+                stacks[path].attrs[key] = value
+        out['repack/iteration'] = np.array([d[0] for d in dumps])
+    os.rename(tmp_path, out_path)
+    return out_path
+
+def is_repacked(path_to_file):
+    """
+    Check whether an HDF5 file was written by repack.
+
+    Args:
+        path_to_file: location of an HDF5 file
+    Returns:
+        bool: True if the file holds stacked fields
+    """
+    with h5py.File(path_to_file, 'r') as file:
+        return read_field_hdf.REPACK_STACK_PATH in file
+
+def _chunk_shape(chunking, shape):
+    if not isinstance(chunking, (tuple, list)):
+        chunking = CHUNKING[chunking]
+    return tuple(min(c or s, s) for c, s in zip(chunking, shape))
+
+def _component_paths(fields_h5):
+    paths = []
+    for name, record in fields_h5.items():
+        if isinstance(record, h5py.Group):
+            paths.extend(name + '/' + coord for coord in record.keys())
+        else:
+            paths.append(name)
+    return paths
+
+def _copy_attrs(src, dst):
+    for key, value in src.attrs.items():
+        dst.attrs[key] = value
+
+def _create_stacks(out, fields_h5, n_dumps, chunking, compression, float32):
+    stacks = {}
+    for path in _component_paths(fields_h5):
+        component = fields_h5[path]
+        shape = (n_dumps,) + component.shape
+        stacks[path] = out.create_dataset(
+            read_field_hdf.REPACK_STACK_PATH + '/' + path,
+            shape=shape,
+            dtype='f4' if float32 else component.dtype,
+            chunks=_chunk_shape(chunking, shape),
+            compression=compression,
+            shuffle=compression is not None,
+        )
+    return stacks
+
+def _repack_step(src, out, n_dump, index, stacks):
+    src_step = src['data'][str(n_dump)]
+    step = out.create_group('data/{}'.format(n_dump))
+    _copy_attrs(src_step, step)
+    for name, item in src_step.items():
+        if name != 'fields':
+            src.copy(item, step, name=name)
+    fields = step.create_group('fields')
+    _copy_attrs(src_step['fields'], fields)
+    for name, record in src_step['fields'].items():
+        if isinstance(record, h5py.Group):
+            fields.create_group(name)
+            _copy_attrs(record, fields[name])
+    for path, stack in stacks.items():
+        component = src_step['fields'][path]
+        if component.shape != stack.shape[1:]:
+            raise ValueError(
+                'field {} of dump {} has shape {}, expected {}'.format(
+                    path, n_dump, component.shape, stack.shape[1:]))
+        layout = h5py.VirtualLayout(shape=stack.shape[1:], dtype=stack.dtype)
+        layout[...] = h5py.VirtualSource(
+            '.', stack.name, shape=stack.shape, dtype=stack.dtype)[index]
+        _copy_attrs(component, fields.create_virtual_dataset(path, layout))
+
+def _write_block(stack, block, start, tallies, path):
+    # radial slabs a whole number of chunks high, from every iteration
+    # of the block, read one dump file at a time; the slab spans all
+    # modes and z, so it covers whole chunks
+    height = stack.chunks[2]
+    row_bytes = len(block)*stack.shape[1]*stack.shape[3]*np.dtype(np.float64).itemsize
+    height *= max(BUFFER_BYTES//(row_bytes*height), 1)
+    stop = start + len(block)
+    for r0 in range(0, stack.shape[2], height):
+        values = None
+        for i, (n_dump, path_to_file) in enumerate(block):
+            with h5py.File(path_to_file, 'r') as src:
+                slab = src['data'][str(n_dump)]['fields'][path][:, r0:r0 + height, :]
+            if values is None:
+                values = np.empty((len(block),) + slab.shape, dtype=slab.dtype)
+            values[i] = slab
+        if stack.dtype != values.dtype:
+            values = precision.convert(
+                values, stack.dtype, tally=tallies.setdefault(path, precision.ErrorTally()))
+        stack[start:stop, :, r0:r0 + height, :] = values
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""
+Run a per-dump reduction over a whole run in checkpointed shards.
+
+The dumps of a run are dealt round-robin into num_shards shards. Shards
+are spread over the ranks of an MPI job when mpi4py is available and
+the job has more than one rank, otherwise over local processes, so the
+same script runs on a laptop or on several nodes.
+
+Each shard periodically writes its partial result to a new segment file
+in checkpoint_dir (atomically, via a temporary file). A rerun with the
+same checkpoint_dir skips the dumps already reduced, so an interrupted
+analysis restarts where it left off. Results are merged from the
+segments in a fixed order, independent of how many ranks ran them:
+
+    stack: per-dump results, stacked in order of iteration
+    sum:   per-dump results summed in float64, within each shard in
+           order of iteration, then over shards in order of shard
+
+:copyright: Copyright (c) 2019 Radiasoft LLC. All Rights Reserved.
+:license: http://www.apache.org/licenses/LICENSE-2.0.html
+"""
+
+# Python imports
+import functools
+import multiprocessing
+import os
+import re
+
+import h5py
+import numpy as np
+
+# RadiaSoft imports
+from rsfbpic.rsdata import parallel
+from rsfbpic.rsdata import read_field_hdf
+
+try:
+    from mpi4py import MPI
+except ImportError:
+    MPI = None
+
+#: ways per-dump results are merged
+HOW = ('stack', 'sum')
+
+#: checkpoint segment of a shard, shardRRRR_SSSSSS.h5
+SEGMENT_PATTERN = re.compile(r'^shard(\d{4})_(\d{6})\.h5$')
+
+def reduce_dumps(path, func, checkpoint_dir, how='stack', num_shards=None,
+                 checkpoint_every=16, num_workers=None, comm=None):
+    """
+    Reduce every dump of a run, sharded and checkpointed.
+
+    func is called as func(path_to_file, n_dump_str), like the functions
+    of rsfbpic.rsdata.reductions, and returns a number or an array of
+    fixed shape. In local mode it must be picklable.
+    Args:
+        path:             dump directory or consolidated HDF5 file
+        func:             per-dump reduction
+        checkpoint_dir:   directory for the checkpoint segments
+        how:              'stack' or 'sum'
+        num_shards:       number of shards; default from an existing
+                          checkpoint, else the number of ranks or cores
+        checkpoint_every: dumps reduced between checkpoints of a shard
+        num_workers:      local processes; None for all cores
+        comm:             MPI communicator; default COMM_WORLD if mpi4py
+                          is available
+    Returns:
+        iterations: dump numbers
+        result:     stack of shape (len(iterations), ...), or the sum
+    """
+    if how not in HOW:
+        raise ValueError('how={} must be one of {}'.format(how, HOW))
+    if comm is None and MPI is not None:
+        comm = MPI.COMM_WORLD
+    use_mpi = comm is not None and comm.Get_size() > 1
+    rank = comm.Get_rank() if use_mpi else 0
+    checked = None
+    if rank == 0:
+        if not os.path.isdir(checkpoint_dir):
+            os.makedirs(checkpoint_dir)
+        # checked before any rank starts writing, as a sum checkpoint
+        # deletes the segments it supersedes
+        try:
+            checked = _check_shards(checkpoint_dir, how, num_shards)
+        except ValueError as e:
+            checked = e
+    if use_mpi:
+        checked = comm.bcast(checked, root=0)
+    if isinstance(checked, ValueError):
+        raise checked
+    num_shards = checked
+    if num_shards is None:
+        num_shards = comm.Get_size() if use_mpi else (
+            num_workers or multiprocessing.cpu_count())
+    dumps = read_field_hdf.list_dumps(path)
+    run = functools.partial(
+        run_shard, dumps, func, checkpoint_dir, how, num_shards, checkpoint_every)
+    if use_mpi:
+        for shard in range(rank, num_shards, comm.Get_size()):
+            run(shard)
+        comm.Barrier()
+    else:
+        parallel.map_items(run, range(num_shards), num_workers)
+    return merge(checkpoint_dir, [d[0] for d in dumps])
+
+def run_shard(dumps, func, checkpoint_dir, how, num_shards, checkpoint_every, shard):
+    """
+    Reduce the dumps of one shard, resuming from its checkpoint.
+
+    Args:
+        dumps:            list of (iteration, path_to_file) of the whole run
+        func:             per-dump reduction
+        checkpoint_dir:   directory for the checkpoint segments
+        how:              'stack' or 'sum'
+        num_shards:       number of shards
+        checkpoint_every: dumps reduced between checkpoints
+        shard:            index of this shard
+    Returns:
+        count: number of dumps reduced by this call
+    """
+    segments = _segments(checkpoint_dir).get(shard, [])
+    seq = segments[-1][0] + 1 if segments else 0
+    done = set()
+    total = None
+    for _, p in segments:
+        with h5py.File(p, 'r') as f:
+            done.update(f['iteration'][...].tolist())
+            if how == 'sum':
+                # each sum segment holds the running total of the shard
+                total = f['value'][...]
+    iterations = []
+    values = []
+    count = 0
+    for n_dump, path_to_file in dumps[shard::num_shards]:
+        if n_dump in done:
+            continue
+        value = np.asarray(func(path_to_file, str(n_dump)), dtype=np.float64)
+        if how == 'sum':
+            total = value if total is None else total + value
+        else:
+            values.append(value)
+        iterations.append(n_dump)
+        count += 1
+        if len(iterations) >= checkpoint_every:
+            _write_segment(
+                checkpoint_dir, shard, seq, how, num_shards, done, iterations,
+                total if how == 'sum' else np.array(values))
+            seq += 1
+            iterations = []
+            values = []
+    if iterations:
+        _write_segment(
+            checkpoint_dir, shard, seq, how, num_shards, done, iterations,
+            total if how == 'sum' else np.array(values))
+    return count
+
+def merge(checkpoint_dir, iterations=None):
+    """
+    Merge the checkpoint segments of all shards.
+
+    Args:
+        checkpoint_dir: directory of the checkpoint segments
+        iterations:     dump numbers that must all be present
+    Returns:
+        iterations: dump numbers, in order
+        result:     stack of shape (len(iterations), ...), or the sum
+    """
+    how = None
+    found = []
+    values = []
+    for shard, segments in sorted(_segments(checkpoint_dir).items()):
+        for _, p in segments:
+            with h5py.File(p, 'r') as f:
+                how = _attr_str(f.attrs['how'])
+                if how == 'sum' and p != segments[-1][1]:
+                    # superseded total, left by an interrupted checkpoint
+                    continue
+                found.append(f['iteration'][...])
+                values.append(f['value'][...])
+    if how is None:
+        raise ValueError('{}: no checkpoint segments'.format(checkpoint_dir))
+    found = np.concatenate(found)
+    if iterations is not None:
+        missing = sorted(set(iterations) - set(found.tolist()))
+        if missing:
+            raise ValueError('{}: iterations {} not reduced'.format(checkpoint_dir, missing))
+    order = np.argsort(found, kind='stable')
+    if how == 'sum':
+        total = values[0].copy()
+        for v in values[1:]:
+            total += v
+        return found[order], total
+    return found[order], np.concatenate(values)[order]
+
+def _attr_str(value):
+    return value if isinstance(value, str) else value.decode()
+
+def _check_shards(checkpoint_dir, how, num_shards):
+    # a checkpoint can only be resumed with the sharding it was written with
+    segments = _segments(checkpoint_dir)
+    if not segments:
+        return num_shards
+    with h5py.File(next(iter(segments.values()))[-1][1], 'r') as f:
+        written = int(f.attrs['num_shards'])
+        written_how = _attr_str(f.attrs['how'])
+    if written_how != how:
+        raise ValueError('{}: checkpoint written with how={}'.format(checkpoint_dir, written_how))
+    if num_shards is not None and num_shards != written:
+        raise ValueError('{}: checkpoint written with {} shards'.format(checkpoint_dir, written))
+    return written
+
+def _segments(checkpoint_dir):
+    # shard -> sorted list of (seq, path)
+    res = {}
+    if not os.path.isdir(checkpoint_dir):
+        return res
+    for name in os.listdir(checkpoint_dir):
+        m = SEGMENT_PATTERN.match(name)
+        if m:
+            res.setdefault(int(m.group(1)), []).append(
+                (int(m.group(2)), os.path.join(checkpoint_dir, name)))
+    for v in res.values():
+        v.sort()
+    return res
+
+def _write_segment(checkpoint_dir, shard, seq, how, num_shards, done, iterations, value):
+    path = os.path.join(checkpoint_dir, 'shard{:04d}_{:06d}.h5'.format(shard, seq))
+    if how == 'sum':
+        done.update(iterations)
+        iterations = sorted(done)
+    tmp_path = path + '.tmp'
+    with h5py.File(tmp_path, 'w') as f:
+        f.attrs['how'] = how
+        f.attrs['num_shards'] = num_shards
+        f.create_dataset('iteration', data=np.array(iterations, dtype=np.int64))
+        f.create_dataset('value', data=value)
+    os.rename(tmp_path, path)
+    if how == 'sum':
+        # the new total supersedes earlier segments
+        for s, p in _segments(checkpoint_dir).get(shard, []):
+            if s < seq:
+                os.remove(p)
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Stack field dumps onto a common co-moving (zeta = z - ct) grid.
+
+The moving window shifts the z-axis of every dump, so comparing fields
+across iterations needs re-indexing. The stack built here holds one
+(iteration, r, zeta) dataset in a chunked, compressed HDF5 file, so the
+time evolution at fixed zeta is a slice instead of a loop over files.
+
+:copyright: Copyright (c) 2019 Radiasoft LLC. All Rights Reserved.
+:license: http://www.apache.org/licenses/LICENSE-2.0.html
+"""
+
+# Python imports
+import h5py
+import numpy as np
+import scipy.constants
+
+# RadiaSoft imports
+from rsfbpic.rsdata import precision
+from rsfbpic.rsdata import read_field_hdf
+
+def calc_zeta(z, time):
+    """
+    Convert lab-frame axial coordinates to the co-moving coordinate.
+
+    Args:
+        z:     axial grid coordinates [m]
+        time:  simulation time [s]
+    Returns:
+        zeta:  co-moving coordinate zeta = z - c*t [m]
+    """
+    return z - scipy.constants.c * time
+
+def resample_to_zeta(field, zeta_field, zeta, fill_value=np.nan):
+    """
+    Linearly interpolate every radial row of a field onto a zeta grid.
+
+    All rows are resampled at once; zeta_field must be uniformly spaced,
+    as it is for an FBPIC dump.
+    Args:
+        field:       2D field data, shape (nr, nz)
+        zeta_field:  zeta coordinates of the field columns [m]
+        zeta:        target zeta grid [m]
+        fill_value:  value for target points outside zeta_field
+    Returns:
+        resampled:   field on the target grid, shape (nr, len(zeta))
+    """
+    dzeta = zeta_field[1] - zeta_field[0]
+    index = (np.asarray(zeta) - zeta_field[0]) / dzeta
+    valid = (index >= 0.) & (index <= len(zeta_field) - 1)
+    i0 = np.clip(np.floor(index).astype(int), 0, len(zeta_field) - 2)
+    weight = index - i0
+    resampled = field[:, i0] * (1. - weight) + field[:, i0 + 1] * weight
+    resampled[:, ~valid] = fill_value
+    return resampled
+
+def calc_common_zeta(path, field_name):
+    """
+    Find the zeta grid covered by every dump at a path.
+
+    The grid spacing is that of the first dump.
+    Args:
+        path:        dump directory or consolidated HDF5 file
+        field_name:  name of field associated with the grid
+    Returns:
+        zeta:        common co-moving grid [m]
+    """
+    zeta_min = -np.inf
+    zeta_max = np.inf
+    dzeta = None
+    for n_dump, path_to_file in read_field_hdf.list_dumps(path):
+        n_dump_str = str(n_dump)
+        _, z = read_field_hdf.read_r_z(path_to_file, field_name, n_dump_str)
+        zeta = calc_zeta(z, read_field_hdf.read_time(path_to_file, n_dump_str))
+        zeta_min = max(zeta_min, zeta[0])
+        zeta_max = min(zeta_max, zeta[-1])
+        if dzeta is None:
+            dzeta = z[1] - z[0]
+    if dzeta is None or zeta_max < zeta_min:
+        raise ValueError('no zeta range common to all dumps in {}'.format(path))
+    return zeta_min + dzeta * np.arange(int((zeta_max - zeta_min) / dzeta + 1.e-6) + 1)
+
+def build_stack(path, out_path, field_name, field_coord=None, zeta=None,
+                chunks=None, compression='gzip', dtype=np.float64):
+    """
+    Write one field from every dump onto a common zeta grid.
+
+    Each dump is shifted and resampled in a single vectorized step.
+    Frames are written to disk a chunk deep at a time, so only that
+    many frames are held in memory.
+    The output file contains the datasets
+    field (iteration, r, zeta), r, zeta, iteration and time.
+    Frames are resampled in float64; if the field is stored in a smaller
+    dtype, the conversion error is recorded in its attributes
+    (precision.ERROR_ATTRS).
+    Args:
+        path:         dump directory or consolidated HDF5 file
+        out_path:     location of the HDF5 file to write
+        field_name:   name of field in the HDF5 files
+        field_coord:  field coordinate ('r','t','z'), or None for a scalar
+        zeta:         target zeta grid [m]; default from calc_common_zeta
+        chunks:       HDF5 chunk shape; default suits slices at fixed zeta
+        compression:  HDF5 compression filter ('gzip', 'lzf' or None)
+        dtype:        dtype of the stored field, e.g. precision.FLOAT32
+    Returns:
+        out_path:     location of the written file
+    """
+    dumps = read_field_hdf.list_dumps(path)
+    if zeta is None:
+        zeta = calc_common_zeta(path, field_name)
+    r, _ = read_field_hdf.read_r_z(dumps[0][1], field_name, str(dumps[0][0]))
+    shape = (len(dumps), len(r), len(zeta))
+    if chunks is None:
+        chunks = (min(shape[0], 16), min(shape[1], 32), min(shape[2], 256))
+    with h5py.File(out_path, 'w') as out:
+        stack = out.create_dataset(
+            'field', shape=shape, dtype=dtype, chunks=chunks,
+            compression=compression, shuffle=compression is not None,
+        )
+        time = np.zeros(len(dumps))
+        tally = precision.ErrorTally() if stack.dtype != np.float64 else None
+        # frames are written a chunk deep at a time, so every compressed
+        # chunk is written once instead of once per frame
+        block = np.empty((chunks[0],) + shape[1:], dtype=stack.dtype)
+        for i, (n_dump, path_to_file) in enumerate(dumps):
+            field, _, z, time[i] = read_field_hdf.read_field_rz(
+                path_to_file, field_name, field_coord, str(n_dump))
+            frame = resample_to_zeta(field, calc_zeta(z, time[i]), zeta)
+            block[i % chunks[0]] = frame
+            if tally is not None:
+                tally.update(frame, block[i % chunks[0]])
+            if (i + 1) % chunks[0] == 0 or i + 1 == len(dumps):
+                start = i - i % chunks[0]
+                stack[start:i + 1] = block[:i + 1 - start]
+        out['r'] = r
+        out['zeta'] = zeta
+        out['iteration'] = np.array([d[0] for d in dumps])
+        out['time'] = time
+        stack.attrs['field_name'] = field_name
+        stack.attrs['field_coord'] = field_coord or ''
+        if tally is not None:
+            for key, value in tally.report().items():
+                stack.attrs[key] = value
+    return out_path
+
+def open_stack(path_to_stack):
+    """
+    Open a stack written by build_stack without reading it.
+
+    Datasets are read lazily, e.g. f['field'][:, 0, iz] is the on-axis
+    time evolution at zeta index iz. The caller closes the file.
+    Args:
+        path_to_stack: location of the stack file
+    Returns:
+        file: read-only h5py.File
+    """
+    return h5py.File(path_to_stack, 'r')
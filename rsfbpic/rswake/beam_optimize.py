@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""Batched search for drive and witness beam parameters
+
+Candidate designs are evaluated a whole population at a time through the
+array-valued models of :mod:`rsfbpic.rswake.lbn_wake` (blowout) and
+:mod:`rsfbpic.rswake.hollow_channel`. The objectives, both maximized,
+are the transformer ratio R = E_acc/E_decel and the efficiency
+R*wb_tot_q/beam_tot_q, with the accelerating field reduced by an
+estimate of the witness beam loading. The search is gradient free: the
+LBN field is piecewise along the bubble, so populations are sampled in
+the bounds and then mutated around the current Pareto front.
+
+Design parameters are arrays keyed like the variables of
+examples/bubble/lbn_example.py: beam_rms_z, beam_tot_q, wb_rms_z,
+wb_tot_q, wb_trail (behind the centre of the drive beam), and for the
+hollow channel channel_radius. Charges are magnitudes [C].
+
+:copyright: Copyright (c) 2019 Radiasoft LLC. All Rights Reserved.
+:license: http://www.apache.org/licenses/LICENSE-2.0.html
+"""
+# import the usual suspects
+import functools
+import math
+import numpy as np
+import scipy.constants
+
+# RadiaSoft imports
+from rsfbpic.rsdata import parallel
+from rsfbpic.rswake import hollow_channel
+from rsfbpic.rswake import lbn_validate
+from rsfbpic.rswake import lbn_wake
+
+#: objectives maximized by optimize, in the order of the front
+OBJECTIVES = ('transformer_ratio', 'efficiency')
+
+def evaluate_lbn(params, n_pe, rb_min_fraction=0.3, strong_min=(1., 1.)):
+    """
+    Evaluate designs in the strong-bubble (LBN) model
+
+    The drive beam, of total length 4*beam_rms_z, starts at the front of
+    the bubble. The witness sees calc_Ez_on_axis_no_beam at its centre,
+    less its own calc_E_decel_along_beam as a beam-loading estimate.
+    Args:
+        params:          dict of design parameter arrays
+        n_pe:            number density of the electron plasma
+        rb_min_fraction: the witness must sit where rb >= this*rb_max,
+                         away from the divergent field at closure
+        strong_min:      lower limits of the two strong-bubble ratios
+    Returns:
+        result: dict of arrays, the OBJECTIVES, E_decel, E_acc,
+            strong_1, strong_2 and feasible
+    """
+    beam_tot_z = 4.*np.asarray(params['beam_rms_z'], dtype=np.float64)
+    beam_num_ptcl = params['beam_tot_q']/scipy.constants.e
+    rb_max = lbn_wake.calc_rb_max(n_pe, beam_tot_z, beam_num_ptcl)
+    xi_w = 0.5*beam_tot_z + params['wb_trail']
+    rb_w = lbn_wake.calc_local_bubble_radius(xi_w, rb_max)
+    behind = (xi_w - 2.*params['wb_rms_z'] > beam_tot_z) & (rb_w >= rb_min_fraction*rb_max)
+    E_decel = lbn_wake.calc_E_decel_along_beam(n_pe, beam_tot_z, beam_num_ptcl)
+    E_acc = -lbn_wake.calc_Ez_on_axis_no_beam(n_pe, np.where(behind, rb_w, rb_max), rb_max) \
+        - lbn_wake.calc_E_decel_along_beam(
+            n_pe, 4.*params['wb_rms_z'], params['wb_tot_q']/scipy.constants.e)
+    strong_1, strong_2 = lbn_validate.calc_strong_checks(n_pe, beam_tot_z, beam_num_ptcl)
+    feasible = behind & (strong_1 >= strong_min[0]) & (strong_2 >= strong_min[1]) \
+        & (E_acc > 0.)
+    return _objectives(params, E_decel, E_acc, feasible, strong_1=strong_1, strong_2=strong_2)
+
+def evaluate_hollow_channel(params, n_pe):
+    """
+    Evaluate designs in the hollow-channel (m=0) model
+
+    E_decel is the peak wake within 3 rms lengths of the drive centre;
+    the witness sees the drive wake at -wb_trail, less its own wake at
+    its centre as a beam-loading estimate.
+    Args:
+        params: dict of design parameter arrays, with channel_radius
+        n_pe:   number density of the electron plasma
+    Returns:
+        result: dict of arrays, the OBJECTIVES, E_decel, E_acc and feasible
+    """
+    k_pe = np.sqrt(n_pe*scipy.constants.e**2/(
+        scipy.constants.m_e*scipy.constants.epsilon_0))/scipy.constants.c
+    b = np.asarray(params['channel_radius'], dtype=np.float64)
+    Omega_kp = (hollow_channel.calc_Omega0(k_pe, b)*k_pe)[..., np.newaxis]
+    scale = hollow_channel.calc_kappa0(k_pe, b)/(4.*math.pi*scipy.constants.epsilon_0)
+    sigma = np.asarray(params['beam_rms_z'], dtype=np.float64)[..., np.newaxis]
+    zeta = sigma*np.linspace(-3., 3., 61)
+    E_decel = scale*params['beam_tot_q']*np.real(
+        hollow_channel.calc_wake_phasor(Omega_kp, sigma, zeta)).max(axis=-1)
+    E_acc = scale*(
+        -params['beam_tot_q']*np.real(hollow_channel.calc_wake_phasor(
+            Omega_kp[..., 0], sigma[..., 0], -params['wb_trail']))
+        - params['wb_tot_q']*np.real(hollow_channel.calc_wake_phasor(
+            Omega_kp[..., 0], params['wb_rms_z'], 0.)))
+    feasible = (params['wb_trail'] >= 3.*(sigma[..., 0] + params['wb_rms_z'])) \
+        & (E_acc > 0.)
+    return _objectives(params, E_decel, E_acc, feasible)
+
+def pareto_front(objectives, block=256):
+    """
+    Find the designs not dominated by any other, all objectives maximized
+
+    Args:
+        objectives: shape (N, K)
+        block:      number of designs compared with all others at once
+    Returns:
+        front: boolean mask of the non-dominated designs, shape (N,)
+    """
+    objectives = np.asarray(objectives, dtype=np.float64)
+    front = np.ones(len(objectives), dtype=bool)
+    for start in range(0, len(objectives), block):
+        o = objectives[start:start + block, np.newaxis, :]
+        dominated = ((objectives >= o).all(axis=2) & (objectives > o).any(axis=2)).any(axis=1)
+        front[start:start + block] = ~dominated
+    return front
+
+def optimize(evaluate, bounds, fixed=None, population=1000, generations=10,
+             num_workers=1, seed=None, **kwargs):
+    """
+    Search for the Pareto front of transformer ratio and efficiency
+
+    The first population is sampled log-uniformly within bounds, and
+    must contain a feasible design. Each generation mutates designs
+    drawn from the current front, with a step shrinking from a tenth of
+    the log range. Every population is split into num_workers batches
+    evaluated in parallel.
+    Args:
+        evaluate:    evaluate_lbn, evaluate_hollow_channel, or a function
+                     like them
+        bounds:      dict of design parameter to (low, high), both > 0
+        fixed:       dict of design parameters held constant
+        population:  number of designs per generation
+        generations: number of generations after the first
+        num_workers: number of processes batches are evaluated in
+        seed:        seed of the random number generator
+        kwargs:      further arguments of evaluate, e.g. n_pe
+    Returns:
+        front: dict of arrays of the feasible non-dominated designs,
+            their parameters and the results of evaluate, sorted by
+            decreasing transformer ratio
+    """
+    rng = np.random.RandomState(seed)
+    names = sorted(bounds)
+    low = np.log([bounds[n][0] for n in names])
+    high = np.log([bounds[n][1] for n in names])
+    run = functools.partial(_evaluate_batch, evaluate, fixed or {}, names, kwargs)
+    x = low + (high - low)*rng.uniform(size=(population, len(names)))
+    archive = None
+    for g in range(generations + 1):
+        if g:
+            step = 0.1*(high - low)*(1. - g/(generations + 1.))
+            parents = archive['x'][rng.randint(len(archive['x']), size=population)]
+            x = np.clip(parents + step*rng.normal(size=parents.shape), low, high)
+        batches = [b for b in np.array_split(x, max(num_workers, 1)) if len(b)]
+        results = parallel.map_items(run, batches, num_workers)
+        result = {k: np.concatenate([r[k] for r in results]) for k in results[0]}
+        result['x'] = x
+        if archive is not None:
+            result = {k: np.concatenate((archive[k], result[k])) for k in result}
+        result = {k: v[result['feasible']] for k, v in result.items()}
+        if not len(result['x']):
+            if archive is None:
+                # mutations need a feasible first population to start from
+                raise ValueError('no feasible design within bounds')
+            result = archive
+        archive = {
+            k: v[pareto_front(np.column_stack([result[o] for o in OBJECTIVES]))]
+            for k, v in result.items()
+        }
+    order = np.argsort(-archive[OBJECTIVES[0]], kind='stable')
+    front = {k: v[order] for k, v in archive.items() if k != 'x'}
+    return front
+
+def _evaluate_batch(evaluate, fixed, names, kwargs, x):
+    params = dict(fixed)
+    params.update((n, np.exp(x[:, i])) for i, n in enumerate(names))
+    params = dict(zip(params, np.broadcast_arrays(*params.values())))
+    result = dict(evaluate(params, **kwargs))
+    result.update(params)
+    return result
+
+def _objectives(params, E_decel, E_acc, feasible, **extra):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        transformer_ratio = np.where(feasible, E_acc/E_decel, np.nan)
+    res = dict(
+        transformer_ratio=transformer_ratio,
+        efficiency=transformer_ratio*params['wb_tot_q']/params['beam_tot_q'],
+        E_decel=E_decel,
+        E_acc=E_acc,
+        feasible=feasible,
+    )
+    res.update(extra)
+    return res
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""Smoothing filters for post-processing stacks of r-z field frames
+
+Binomial, Gaussian and user-supplied kernels are applied frame by frame
+to (iteration, r, z) stacks, overwriting the input. A numpy array is
+filtered in place; an h5py dataset, such as the field of a
+:mod:`rsfbpic.rsdata.zeta_stack` file, is read and written back by the
+calling thread a few frames at a time. Separable kernels are applied as
+two 1D convolutions, small kernels directly, and other kernels by FFT
+with a transfer function computed once per stack. Frames are shared
+between threads, as the convolutions and FFTs release the GIL.
+
+Filters are convolutions matching scipy.signal.convolve2d with
+mode='same': the kernel is centred on index (len(kernel) - 1)//2, so an
+even kernel reaches one cell further back than forward.
+
+:copyright: Copyright (c) 2019 Radiasoft LLC. All Rights Reserved.
+:license: http://www.apache.org/licenses/LICENSE-2.0.html
+"""
+# import the usual suspects
+import concurrent.futures
+import numpy as np
+import scipy.fft
+import scipy.ndimage
+
+#: boundary modes of scipy.ndimage and the matching modes of numpy.pad
+PAD_MODES = {
+    'reflect': 'symmetric',
+    'mirror': 'reflect',
+    'nearest': 'edge',
+    'wrap': 'wrap',
+    'constant': 'constant',
+}
+
+#: longest 1D Gaussian kernel applied directly; longer ones use the FFT
+MAX_DIRECT_TAPS = 31
+
+#: largest non-separable 2D kernel (in elements) applied directly
+MAX_DIRECT_SIZE = 49
+
+def binomial_kernel(n_pass=1):
+    """
+    Build the 1D kernel of n_pass passes of the [1, 2, 1]/4 filter
+
+    Args:
+        n_pass: number of passes
+    Returns:
+        kernel: normalized 1D kernel of length 2*n_pass + 1
+    """
+    kernel = np.ones(1)
+    for _ in range(n_pass):
+        kernel = np.convolve(kernel, [0.25, 0.5, 0.25])
+    return kernel
+
+def gaussian_kernel(sigma, truncate=4.):
+    """
+    Build a normalized 1D Gaussian kernel
+
+    Args:
+        sigma:    rms width in cells
+        truncate: half-width of the kernel in units of sigma
+    Returns:
+        kernel: normalized 1D kernel of odd length
+    """
+    half = max(int(truncate*sigma + 0.5), 1)
+    x = np.arange(-half, half + 1)
+    kernel = np.exp(-0.5*(x/float(sigma))**2)
+    return kernel/kernel.sum()
+
+def binomial(stack, n_pass=1, mode='reflect', num_threads=1):
+    """
+    Smooth every frame of a stack with a binomial filter, in place
+
+    Args:
+        stack:       array or h5py dataset, shape (..., r, z)
+        n_pass:      number of [1, 2, 1]/4 passes along each axis
+        mode:        boundary mode, a key of PAD_MODES
+        num_threads: number of threads frames are shared across
+    Returns:
+        stack: the filtered input
+    """
+    kernel = binomial_kernel(n_pass)
+    return separable(stack, kernel, kernel, mode, num_threads)
+
+def gaussian(stack, sigma_r, sigma_z, mode='reflect', num_threads=1):
+    """
+    Smooth every frame of a stack with a Gaussian filter, in place
+
+    Long kernels are applied by FFT.
+    Args:
+        stack:       array or h5py dataset, shape (..., r, z)
+        sigma_r:     rms width along r, in cells
+        sigma_z:     rms width along z, in cells
+        mode:        boundary mode, a key of PAD_MODES
+        num_threads: number of threads frames are shared across
+    Returns:
+        stack: the filtered input
+    """
+    kernel_r = gaussian_kernel(sigma_r)
+    kernel_z = gaussian_kernel(sigma_z)
+    if max(len(kernel_r), len(kernel_z)) > MAX_DIRECT_TAPS:
+        return fft_convolve(stack, np.outer(kernel_r, kernel_z), mode, num_threads)
+    return separable(stack, kernel_r, kernel_z, mode, num_threads)
+
+def convolve(stack, kernel, mode='reflect', num_threads=1):
+    """
+    Convolve every frame of a stack with a 2D kernel, in place
+
+    A rank-one kernel, e.g. np.outer(a, b), is applied separably, a
+    small kernel directly, and any other kernel by FFT.
+    Args:
+        stack:       array or h5py dataset, shape (..., r, z)
+        kernel:      2D kernel, shape (kr, kz)
+        mode:        boundary mode, a key of PAD_MODES
+        num_threads: number of threads frames are shared across
+    Returns:
+        stack: the filtered input
+    """
+    kernel = np.asarray(kernel, dtype=np.float64)
+    u, s, vt = np.linalg.svd(kernel)
+    if len(s) == 1 or s[1] <= 1.e-12*s[0]:
+        return separable(
+            stack, u[:, 0]*np.sqrt(s[0]), vt[0]*np.sqrt(s[0]), mode, num_threads)
+    if kernel.size <= MAX_DIRECT_SIZE:
+        return _direct_convolve(stack, kernel, mode, num_threads)
+    return fft_convolve(stack, kernel, mode, num_threads)
+
+def separable(stack, kernel_r, kernel_z, mode='reflect', num_threads=1):
+    """
+    Convolve every frame with kernel_r along r, then kernel_z along z
+
+    Args:
+        stack:       array or h5py dataset, shape (..., r, z)
+        kernel_r:    1D kernel along r
+        kernel_z:    1D kernel along z
+        mode:        boundary mode, a key of PAD_MODES
+        num_threads: number of threads frames are shared across
+    Returns:
+        stack: the filtered input
+    """
+    origin = _origin((len(kernel_r), len(kernel_z)))
+
+    def filter_frames(frames):
+        buf = None
+        for frame in frames:
+            if buf is None:
+                buf = np.empty_like(frame)
+            scipy.ndimage.convolve1d(
+                frame, kernel_r, axis=0, output=buf, mode=mode, origin=origin[0])
+            scipy.ndimage.convolve1d(
+                buf, kernel_z, axis=1, output=frame, mode=mode, origin=origin[1])
+            yield frame
+
+    return _map_frames(stack, filter_frames, num_threads)
+
+def fft_convolve(stack, kernel, mode='reflect', num_threads=1):
+    """
+    Convolve every frame of a stack with a 2D kernel by FFT, in place
+
+    Frames are padded according to mode, so edges are treated like the
+    separable filters.
+    Args:
+        stack:       array or h5py dataset, shape (..., r, z)
+        kernel:      2D kernel, shape (kr, kz)
+        mode:        boundary mode, a key of PAD_MODES
+        num_threads: number of threads frames are shared across
+    Returns:
+        stack: the filtered input
+    """
+    kernel = np.asarray(kernel, dtype=np.float64)
+    pad = (kernel.shape[0]//2, kernel.shape[1]//2)
+    crop = (pad[0] + (kernel.shape[0] - 1)//2, pad[1] + (kernel.shape[1] - 1)//2)
+    nr, nz = stack.shape[-2:]
+    shape = tuple(
+        scipy.fft.next_fast_len(n + 2*p + k - 1, real=True)
+        for n, p, k in zip((nr, nz), pad, kernel.shape)
+    )
+    transfer = scipy.fft.rfft2(kernel, s=shape)
+
+    def filter_frames(frames):
+        for frame in frames:
+            padded = np.pad(
+                frame, ((pad[0], pad[0]), (pad[1], pad[1])), mode=PAD_MODES[mode])
+            result = scipy.fft.irfft2(scipy.fft.rfft2(padded, s=shape)*transfer, s=shape)
+            frame[...] = result[crop[0]:crop[0] + nr, crop[1]:crop[1] + nz]
+            yield frame
+
+    return _map_frames(stack, filter_frames, num_threads)
+
+def _direct_convolve(stack, kernel, mode, num_threads):
+    origin = _origin(kernel.shape)
+
+    def filter_frames(frames):
+        buf = None
+        for frame in frames:
+            if buf is None:
+                buf = np.empty_like(frame)
+            scipy.ndimage.convolve(frame, kernel, output=buf, mode=mode, origin=origin)
+            frame[...] = buf
+            yield frame
+
+    return _map_frames(stack, filter_frames, num_threads)
+
+def _origin(shape):
+    # scipy.ndimage centres a kernel on len//2; convolve2d on (len - 1)//2
+    return [-1 if k % 2 == 0 else 0 for k in shape]
+
+def _map_frames(stack, filter_frames, num_threads):
+    n = int(np.prod(stack.shape[:-2]))
+    num_threads = max(num_threads, 1)
+    if not isinstance(stack, np.ndarray):
+        return _map_dataset_frames(stack, filter_frames, n, num_threads)
+    # each thread filters a contiguous block of frames with its own buffers
+    flat = stack.reshape((n,) + stack.shape[-2:])
+    if not np.shares_memory(flat, stack):
+        raise ValueError('stack must be contiguous to be filtered in place')
+
+    def run(indices):
+        for _ in filter_frames(flat[i] for i in indices):
+            pass
+
+    blocks = [b for b in np.array_split(np.arange(n), num_threads) if len(b)]
+    if len(blocks) <= 1:
+        for b in blocks:
+            run(b)
+        return stack
+    with concurrent.futures.ThreadPoolExecutor(len(blocks)) as executor:
+        list(executor.map(run, blocks))
+    return stack
+
+def _map_dataset_frames(stack, filter_frames, n, num_threads):
+    # h5py serializes access to files, so this thread reads and writes
+    # back num_threads frames at a time, and the pool only filters them
+    index = [np.unravel_index(i, stack.shape[:-2]) for i in range(n)]
+    if num_threads == 1:
+        frames = (np.asarray(stack[j], dtype=np.float64) for j in index)
+        for j, frame in zip(index, filter_frames(frames)):
+            stack[j] = frame
+        return stack
+
+    def run(frame):
+        return next(filter_frames(iter([frame])))
+
+    with concurrent.futures.ThreadPoolExecutor(num_threads) as executor:
+        for start in range(0, n, num_threads):
+            batch = index[start:start + num_threads]
+            frames = [np.asarray(stack[j], dtype=np.float64) for j in batch]
+            for j, frame in zip(batch, executor.map(run, frames)):
+                stack[j] = frame
+    return stack
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""Wakefields of a Gaussian bunch in a hollow plasma channel
+
+The m=0 longitudinal and m=1 transverse wakes follow Schroeder et al.,
+as used in jupyter/hollow_channel. All functions accept numpy arrays.
+
+:copyright: Copyright (c) 2019 Radiasoft LLC. All Rights Reserved.
+:license: http://www.apache.org/licenses/LICENSE-2.0.html
+"""
+# import the usual suspects
+import math
+import numpy as np
+import scipy.constants
+import scipy.special
+
+def calc_Omega0(k_pe, b):
+    """
+    Calculate the m=0 mode frequency of a hollow channel
+
+    Args:
+        k_pe:   plasma wavenumber
+        b:      inner radius of the channel
+    Returns:
+        Omega0: m=0 frequency, in units of the plasma frequency
+    """
+    kpb = k_pe*b
+    k0 = scipy.special.k0(kpb)
+    k1 = scipy.special.k1(kpb)
+    return np.sqrt(2.*k1/(2.*k1 + kpb*k0))
+
+def calc_kappa0(k_pe, b):
+    """
+    Calculate the m=0 loss factor of a hollow channel
+
+    Args:
+        k_pe:   plasma wavenumber
+        b:      inner radius of the channel
+    Returns:
+        kappa0: m=0 loss factor [m^-2]
+    """
+    kpb = k_pe*b
+    k0 = scipy.special.k0(kpb)
+    k1 = scipy.special.k1(kpb)
+    return k_pe**2*(k0/(kpb*k1))/(1. + kpb*k0/(2.*k1))
+
+def calc_Omega1(k_pe, b):
+    """
+    Calculate the m=1 mode frequency of a hollow channel
+
+    Args:
+        k_pe:   plasma wavenumber
+        b:      inner radius of the channel
+    Returns:
+        Omega1: m=1 frequency, in units of the plasma frequency
+    """
+    kpb = k_pe*b
+    k1 = scipy.special.k1(kpb)
+    k2 = scipy.special.kn(2, kpb)
+    return np.sqrt(2.*k2/(4.*k2 + kpb*k1))
+
+def calc_kappa1(k_pe, b):
+    """
+    Calculate the m=1 loss factor of a hollow channel
+
+    Args:
+        k_pe:   plasma wavenumber
+        b:      inner radius of the channel
+    Returns:
+        kappa1: m=1 loss factor [m^-2]
+    """
+    kpb = k_pe*b
+    k1 = scipy.special.k1(kpb)
+    k2 = scipy.special.kn(2, kpb)
+    return k_pe**2*(k1/(kpb*k2))/(1. + kpb*k1/(4.*k2))
+
+def calc_wake_phasor(Omega_kp, sigma, zeta):
+    """
+    Calculate the complex wake of a Gaussian bunch centred at zeta=0
+
+    The m=0 Ez wake is the real part, and the m=1 transverse wake the
+    imaginary part, each times kappa*Q/(4 pi epsilon_0).
+    Args:
+        Omega_kp: mode wavenumber, Omega*k_pe [m^-1]
+        sigma:    rms length of the bunch
+        zeta:     co-moving position, z - ct
+    Returns:
+        G: dimensionless complex wake
+    """
+    erfc_arg = (zeta - 1.j*Omega_kp*sigma*sigma)/(math.sqrt(2.)*sigma)
+    return np.exp(-1.j*Omega_kp*zeta - 0.5*(Omega_kp*sigma)**2)*scipy.special.erfc(erfc_arg)
+
+def calc_Ez(Omega0kp, sigma, Q, kappa0, zeta):
+    """
+    Calculate the m=0 longitudinal wakefield of a Gaussian bunch
+
+    Args:
+        Omega0kp: m=0 mode wavenumber, Omega0*k_pe [m^-1]
+        sigma:    rms length of the bunch
+        Q:        charge of the bunch [C]
+        kappa0:   m=0 loss factor [m^-2]
+        zeta:     co-moving position relative to the bunch centre
+    Returns:
+        Ez: longitudinal electric field [V/m]
+    """
+    G = calc_wake_phasor(Omega0kp, sigma, zeta)
+    return np.real(G)*kappa0*Q/(4.*math.pi*scipy.constants.epsilon_0)
+
+def calc_W1_perp(Omega1kp, sigma, Q, kappa1, zeta):
+    """
+    Calculate the m=1 transverse wakefield of a Gaussian bunch
+
+    Args:
+        Omega1kp: m=1 mode wavenumber, Omega1*k_pe [m^-1]
+        sigma:    rms length of the bunch
+        Q:        charge of the bunch [C]
+        kappa1:   m=1 loss factor [m^-2]
+        zeta:     co-moving position relative to the bunch centre
+    Returns:
+        W1: transverse force per unit charge [V/m]
+    """
+    G = calc_wake_phasor(Omega1kp, sigma, zeta)
+    return np.imag(G)*kappa1*Q/(4.*math.pi*scipy.constants.epsilon_0)
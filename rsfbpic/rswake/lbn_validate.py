@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+"""Validate LBN predictions against the on-axis fields of FBPIC runs
+
+For every dump, the simulated on-axis Ez and the bubble radius extracted
+from rho are compared with the LBN model of :mod:`rsfbpic.rswake.lbn_wake`
+on the same grid, xi = zeta_front - zeta, where zeta_front is the front
+of the bubble. As in :mod:`rsfbpic.rswake.lbn_plot`, the predicted Ez is
+calc_E_decel_along_beam along the drive beam and calc_Ez_on_axis_no_beam
+behind it. All iterations of a run are compared in one vectorized step,
+and validate_dir compares every run found in a directory.
+
+Metrics (relative errors; NaN where undefined):
+
+    rb_max_error:  peak simulated bubble radius vs. calc_rb_max
+    rb_l2:         L2 error of the bubble radius inside the bubble
+    ez_l2:         L2 error of Ez inside the validity window, where
+                   rb >= rb_min_fraction*rb_max (LBN Ez diverges at closure)
+    peak_error:    peak accelerating |Ez| in the window
+    decel_error:   mean Ez along the drive beam vs. calc_E_decel_along_beam
+    closure_error: xi at which the simulated bubble closes vs. 2*xi_b
+
+Large strong_1 = k_pe*rb_max and strong_2 = N/(n_pe*L^3) mark the
+strong-bubble regime, where LBN is valid.
+
+:copyright: Copyright (c) 2019 Radiasoft LLC. All Rights Reserved.
+:license: http://www.apache.org/licenses/LICENSE-2.0.html
+"""
+# import the usual suspects
+import functools
+import os
+import numpy as np
+import scipy.constants
+
+# RadiaSoft imports
+from rsfbpic.rsdata import parallel
+from rsfbpic.rsdata import read_field_hdf
+from rsfbpic.rsdata import reductions
+from rsfbpic.rsdata import repack
+from rsfbpic.rsdata import zeta_stack
+from rsfbpic.rswake import lbn_wake
+
+#: error metrics, in the order of the report columns
+METRICS = ('rb_max_error', 'rb_l2', 'ez_l2', 'peak_error', 'decel_error', 'closure_error')
+
+#: one row of the report per dump
+REPORT_DTYPE = np.dtype(
+    [('run', 'U64'), ('iteration', 'i8'), ('time', 'f8'),
+     ('strong_1', 'f8'), ('strong_2', 'f8')]
+    + [(m, 'f8') for m in METRICS]
+)
+
+def predict(xi, n_pe, beam_tot_z, beam_num_ptcl):
+    """
+    Evaluate the LBN bubble radius and on-axis Ez on a grid
+
+    Args:
+        xi:             distance behind the front of the bubble [m], any shape
+        n_pe:           number density of the electron plasma
+        beam_tot_z:     total length of the drive beam
+        beam_num_ptcl:  number of e- in the drive beam
+    Returns:
+        rb: local bubble radius, 0 outside the bubble
+        Ez: on-axis longitudinal field, NaN outside the bubble
+    """
+    xi = np.asarray(xi, dtype=np.float64)
+    rb_max = lbn_wake.calc_rb_max(n_pe, beam_tot_z, beam_num_ptcl)
+    rb = np.asarray(lbn_wake.calc_local_bubble_radius(xi, rb_max))
+    inside = rb > 0.
+    Ez = lbn_wake.calc_Ez_on_axis_no_beam(n_pe, np.where(inside, rb, rb_max), rb_max)
+    E_decel = lbn_wake.calc_E_decel_along_beam(n_pe, beam_tot_z, beam_num_ptcl)
+    Ez = np.where(xi < beam_tot_z, E_decel, Ez)
+    return rb, np.where(inside, Ez, np.nan)
+
+def find_front(zeta, rb):
+    """
+    Locate the front of the simulated bubble in each row
+
+    Args:
+        zeta:  co-moving positions, shape (N, M)
+        rb:    simulated bubble radius, shape (N, M)
+    Returns:
+        zeta_front: largest zeta inside the bubble, NaN without a bubble
+    """
+    front = np.where(rb > 0., zeta, -np.inf).max(axis=1)
+    return np.where(np.isfinite(front), front, np.nan)
+
+def compare(xi, Ez, rb, n_pe, beam_tot_z, beam_num_ptcl, rb_min_fraction=0.3):
+    """
+    Compute the error metrics of many on-axis lines at once
+
+    Args:
+        xi:              distance behind the bubble front [m], shape (N, M)
+        Ez:              simulated on-axis Ez [V/m], shape (N, M)
+        rb:              simulated bubble radius [m], shape (N, M)
+        n_pe:            number density of the electron plasma
+        beam_tot_z:      total length of the drive beam
+        beam_num_ptcl:   number of e- in the drive beam
+        rb_min_fraction: edge of the Ez validity window, in units of rb_max
+    Returns:
+        metrics: dict of arrays of length N, keyed by METRICS
+    """
+    xi, Ez, rb = (np.atleast_2d(np.asarray(a, dtype=np.float64)) for a in (xi, Ez, rb))
+    rb_pred, Ez_pred = predict(xi, n_pe, beam_tot_z, beam_num_ptcl)
+    rb_max = lbn_wake.calc_rb_max(n_pe, beam_tot_z, beam_num_ptcl)
+    xi_b = lbn_wake.calc_bubble_halfwidth(rb_max)
+    inside = rb_pred > 0.
+    window = rb_pred >= rb_min_fraction*rb_max
+    behind = window & (xi >= beam_tot_z)
+    along = inside & (xi < beam_tot_z)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        peak = np.where(behind, Ez, np.inf).min(axis=1)
+        peak_pred = np.where(behind, Ez_pred, np.inf).min(axis=1)
+        closure = np.where((xi > xi_b) & ~(rb > 0.), xi, np.inf).min(axis=1)
+        metrics = dict(
+            rb_max_error=np.where(
+                inside.any(axis=1), np.where(inside, rb, 0.).max(axis=1)/rb_max - 1., np.nan),
+            rb_l2=_relative_l2(rb, rb_pred, inside),
+            ez_l2=_relative_l2(Ez, Ez_pred, window),
+            peak_error=np.where(
+                np.isfinite(peak_pred), np.abs(peak)/np.abs(peak_pred) - 1., np.nan),
+            decel_error=np.where(along, Ez, 0.).sum(axis=1)/along.sum(axis=1)
+                / lbn_wake.calc_E_decel_along_beam(n_pe, beam_tot_z, beam_num_ptcl) - 1.,
+            closure_error=np.where(np.isfinite(closure), closure/(2.*xi_b) - 1., np.nan),
+        )
+    return metrics
+
+def validate_run(path, n_pe, beam_tot_z, beam_num_ptcl, zeta_front=None,
+                 rb_min_fraction=0.3, num_workers=None, dtype=None):
+    """
+    Compare every dump of one run with LBN
+
+    Args:
+        path:            dump directory or consolidated HDF5 file
+        n_pe:            number density of the electron plasma
+        beam_tot_z:      total length of the drive beam
+        beam_num_ptcl:   number of e- in the drive beam
+        zeta_front:      zeta of the bubble front, scalar or per dump;
+                         default from find_front
+        rb_min_fraction: edge of the Ez validity window, in units of rb_max
+        num_workers:     number of processes dumps are read with
+        dtype:           dtype fields are read as, e.g. precision.FLOAT32
+    Returns:
+        report: structured array of REPORT_DTYPE, one row per dump
+    """
+    return validate_runs(
+        [path], n_pe, beam_tot_z, beam_num_ptcl, zeta_front, rb_min_fraction,
+        num_workers, dtype)
+
+def find_runs(parent):
+    """
+    Find the runs in a directory
+
+    A run is a subdirectory holding dumps, directly or in hdf5/ as
+    FBPIC writes them (e.g. a campaign of rsfbpic.rsdata.campaign), or
+    a consolidated HDF5 file written by rsfbpic.rsdata.repack.
+    Args:
+        parent: directory of the runs
+    Returns:
+        runs: list of (name, path) sorted by name, where path is the
+            dump directory or file and name the entry in parent
+    """
+    runs = []
+    for name in sorted(os.listdir(parent)):
+        path = os.path.join(parent, name)
+        if os.path.isdir(path):
+            for p in (os.path.join(path, 'hdf5'), path):
+                if os.path.isdir(p) and read_field_hdf.list_dumps(p):
+                    runs.append((name, p))
+                    break
+        elif name.endswith('.h5') and repack.is_repacked(path):
+            runs.append((os.path.splitext(name)[0], path))
+    return runs
+
+def validate_dir(parent, n_pe, beam_tot_z, beam_num_ptcl, zeta_front=None,
+                 rb_min_fraction=0.3, num_workers=None, dtype=None):
+    """
+    Compare every dump of every run in a directory with LBN
+
+    Args:
+        parent:          directory of the runs, see find_runs
+        n_pe:            plasma density, scalar or one per run in the
+                         order of find_runs
+        beam_tot_z:      drive beam length, likewise
+        beam_num_ptcl:   drive beam e- count, likewise
+        zeta_front:      as for validate_run, the same for every run
+        rb_min_fraction: edge of the Ez validity window, in units of rb_max
+        num_workers:     number of processes dumps are read with
+        dtype:           dtype fields are read as, e.g. precision.FLOAT32
+    Returns:
+        report: structured array of REPORT_DTYPE, one row per dump;
+            run is the name from find_runs
+    """
+    runs = find_runs(parent)
+    if not runs:
+        raise ValueError('no runs found in {}'.format(parent))
+    names, paths = zip(*runs)
+    return validate_runs(
+        paths, n_pe, beam_tot_z, beam_num_ptcl, zeta_front, rb_min_fraction,
+        num_workers, dtype, names)
+
+def validate_runs(paths, n_pe, beam_tot_z, beam_num_ptcl, zeta_front=None,
+                  rb_min_fraction=0.3, num_workers=None, dtype=None, names=None):
+    """
+    Compare every dump of several runs with LBN
+
+    The dumps of all runs are read in one process pool.
+    Args:
+        paths:           dump directories or consolidated HDF5 files
+        n_pe:            plasma density, scalar or one per run
+        beam_tot_z:      drive beam length, scalar or one per run
+        beam_num_ptcl:   drive beam e- count, scalar or one per run
+        zeta_front:      as for validate_run, the same for every run
+        rb_min_fraction: edge of the Ez validity window, in units of rb_max
+        num_workers:     number of processes dumps are read with
+        dtype:           dtype fields are read as, e.g. precision.FLOAT32
+        names:           name of each run; default the base name of its path
+    Returns:
+        report: structured array of REPORT_DTYPE, one row per dump
+    """
+    if names is None:
+        names = [os.path.basename(os.path.normpath(p)) for p in paths]
+    params = np.broadcast_arrays(
+        np.zeros(len(paths)), n_pe, beam_tot_z, beam_num_ptcl)[1:]
+    items = []
+    for i, path in enumerate(paths):
+        for n_dump, path_to_file in read_field_hdf.list_dumps(path):
+            items.append((i, n_dump, path_to_file))
+    lines = parallel.map_items(
+        functools.partial(_read_dump, params[0], dtype), items, num_workers, star=True)
+    report = []
+    for i, path in enumerate(paths):
+        rows = [l for item, l in zip(items, lines) if item[0] == i]
+        if not rows:
+            continue
+        iterations = [item[1] for item in items if item[0] == i]
+        time, zeta, Ez, rb = (np.array(a) for a in zip(*rows))
+        front = find_front(zeta, rb) if zeta_front is None else zeta_front
+        xi = np.reshape(front, (-1, 1)) - zeta
+        metrics = compare(
+            xi, Ez, rb, params[0][i], params[1][i], params[2][i], rb_min_fraction)
+        run = np.zeros(len(rows), dtype=REPORT_DTYPE)
+        run['run'] = names[i]
+        run['iteration'] = iterations
+        run['time'] = time
+        run['strong_1'], run['strong_2'] = calc_strong_checks(
+            params[0][i], params[1][i], params[2][i])
+        for m in METRICS:
+            run[m] = metrics[m]
+        report.append(run)
+    return np.concatenate(report) if report else np.zeros(0, dtype=REPORT_DTYPE)
+
+def calc_strong_checks(n_pe, beam_tot_z, beam_num_ptcl):
+    """
+    Calculate the two strong-bubble validity parameters of LBN
+
+    Args:
+        n_pe:           number density of the electron plasma
+        beam_tot_z:     total length of the drive beam
+        beam_num_ptcl:  number of e- in the drive beam
+    Returns:
+        strong_1: k_pe*rb_max, large in the strong-bubble regime
+        strong_2: beam_num_ptcl/n_pe/beam_tot_z**3, likewise
+    """
+    k_pe = np.sqrt(n_pe*scipy.constants.e**2/(
+        scipy.constants.m_e*scipy.constants.epsilon_0))/scipy.constants.c
+    rb_max = lbn_wake.calc_rb_max(n_pe, beam_tot_z, beam_num_ptcl)
+    return k_pe*rb_max, beam_num_ptcl/n_pe/beam_tot_z**3
+
+def format_report(report):
+    """
+    Format a report as a compact text table
+
+    Args:
+        report: structured array of REPORT_DTYPE
+    Returns:
+        table: one line per dump, preceded by a header
+    """
+    names = REPORT_DTYPE.names
+    lines = [' '.join('{:>13}'.format(n) for n in names)]
+    for row in report:
+        lines.append(' '.join(
+            '{:>13}'.format(row[n]) if REPORT_DTYPE[n].kind in 'Ui'
+            else '{:>13.4g}'.format(row[n]) for n in names))
+    return '\n'.join(lines)
+
+def _read_dump(n_pe, dtype, i, n_dump, path_to_file):
+    n_dump_str = str(n_dump)
+    Ez, _, z, time = read_field_hdf.read_field_rz(path_to_file, 'E', 'z', n_dump_str, dtype)
+    rho, r, _, _ = read_field_hdf.read_field_rz(path_to_file, 'rho', None, n_dump_str, dtype)
+    rb = reductions.calc_bubble_radius(rho, r, n_pe[i])
+    return time, zeta_stack.calc_zeta(z, time), Ez[0], rb
+
+def _relative_l2(actual, expect, mask):
+    error = np.where(mask, actual - expect, 0.)
+    norm = np.where(mask, expect, 0.)
+    return np.sqrt((error**2).sum(axis=1)/(norm**2).sum(axis=1))
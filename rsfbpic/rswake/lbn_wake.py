@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
 """Calculations from 2017 PRAB article by Lebedev, Burov and Nagaitsev (LBN)
 
+All functions accept numpy arrays as well as scalars, so a whole xi grid,
+or a batch of beam parameters, is evaluated in one call.
+
 :copyright: Copyright (c) 2019 Radiasoft LLC. All Rights Reserved.
 :license: http://www.apache.org/licenses/LICENSE-2.0.html
 """
@@ -75,7 +78,7 @@ def calc_drb_dxi_no_beam(rb, rb_max):
     """
     # from Eq. (3) of LBN2017
     # there is ambiguity in the sign, which needs to be resolved
-    drb_dxi = math.sqrt((pow(rb_max/rb,4)-1.)/2.)
+    drb_dxi = np.sqrt((pow(rb_max/rb,4)-1.)/2.)
     return drb_dxi
 
 def calc_Ez_on_axis_no_beam(n_pe, rb, rb_max):
@@ -128,9 +131,11 @@ def calc_local_bubble_radius(xi, rb_max):
     # halfwidth of the plasma bubble
     xi_b = calc_bubble_halfwidth(rb_max)
 
-    # from Eq. (5) of LBN2017
-    if xi>=2*xi_b or xi<=0.: rb = 0.
-    else: rb = rb_max*math.pow((1.-((xi-xi_b)/xi_b)**2),(1./3.))
+    # from Eq. (5) of LBN2017; zero outside 0 < xi < 2*xi_b
+    inside = (xi < 2*xi_b) & (xi > 0.)
+    rb = rb_max*np.cbrt(np.where(inside, 1.-((xi-xi_b)/xi_b)**2, 0.))
+    if np.ndim(rb) == 0:
+        rb = float(rb)
     return rb
 
 def calc_E_decel_along_beam(n_pe, beam_tot_z, beam_num_ptcl):
@@ -151,5 +156,5 @@ def calc_E_decel_along_beam(n_pe, beam_tot_z, beam_num_ptcl):
     # derived from Eq. (8) of LBN2017
     E_decel = math.pi * n_pe * beam_tot_z * \
               np.abs(scipy.constants.e * rsmath.const.MKS_factor) * \
-              (math.sqrt(1. + 8. * strong_check_2 / math.pi) - 1.)
+              (np.sqrt(1. + 8. * strong_check_2 / math.pi) - 1.)
     return E_decel
@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+"""Axisymmetric quasi-static wake of a drive beam, from plasma electron rings
+
+A cheap model between the closed forms of :mod:`rsfbpic.rswake.lbn_wake`
+and an FBPIC run: the plasma electrons are rings, pushed slice by slice
+along xi = ct - z through the fields of the ions, the other rings and
+the beam, which may have any current profile (e.g. a drive and a witness
+beam, so beam loading is included) or be a set of particles.
+
+In units of k_pe^-1, omega_pe^-1, m*c*omega_pe/e and n_pe, ring j
+carries the charge w_j = r0*dr0 of its initial annulus, moves by
+
+    dr/dxi   = p_r/(1+psi)
+    dp_r/dxi = -Btheta + gamma*(dpsi/dr)/(1+psi)
+
+with gamma - p_z = 1 + psi, and the fields follow from the ring
+positions and velocities alone:
+
+    psi        from Gauss's law, -laplacian(psi) = rho - J_z, the beam
+               excluded, 0 beyond the outermost ring
+    Ez(r)      = dpsi/dxi = sum over rings outside r of w_j*(dr_j/dxi)/r_j
+    Btheta     = a*r + b/r between rings, plus the beam term; the jumps
+               of a and b at each ring depend linearly on Btheta there,
+               and beyond the outermost ring Btheta decays as K1(r)
+
+The Btheta recursion, of 2x2 maps of determinant one, is composed for all
+rings at once with a prefix scan (as in the ring model of Baxevanis and
+Stupakov, PRAB 21, 071301). The rings are advanced with Heun's method.
+Fr = Er - c*Btheta = -dpsi/dr. The sheath trajectory is the innermost
+ring inside which the plasma electrons hold more than SHEATH_THRESHOLD
+of the ion charge, so that the few rings left near the axis by a narrow
+beam are skipped.
+
+:copyright: Copyright (c) 2019 Radiasoft LLC. All Rights Reserved.
+:license: http://www.apache.org/licenses/LICENSE-2.0.html
+"""
+# import the usual suspects
+import math
+import numpy as np
+import scipy.constants
+import scipy.special
+
+#: smallest 1 + psi allowed in the ring push
+MIN_ONE_PLUS_PSI = 1.e-2
+
+#: rings faster than this, e.g. trapped at the back of the bubble, are stopped
+MAX_GAMMA = 10.
+
+#: plasma electron charge inside the sheath, as a fraction of the ion charge
+SHEATH_THRESHOLD = 0.5
+
+def calc_k_pe(n_pe):
+    """
+    Calculate the plasma wavenumber
+
+    Args:
+        n_pe: number density of the electron plasma [m^-3]
+    Returns:
+        k_pe: plasma wavenumber [m^-1]
+    """
+    return np.sqrt(n_pe*scipy.constants.e**2/(
+        scipy.constants.m_e*scipy.constants.epsilon_0))/scipy.constants.c
+
+def calc_E0(n_pe):
+    """
+    Calculate the cold non-relativistic wave-breaking field m*c*omega_pe/e
+
+    Args:
+        n_pe: number density of the electron plasma [m^-3]
+    Returns:
+        E0: unit of the normalized fields [V/m]
+    """
+    return scipy.constants.m_e*scipy.constants.c**2*calc_k_pe(n_pe)/scipy.constants.e
+
+def gaussian_current(xi, beam_num_ptcl, beam_rms_z, xi_center=0.):
+    """
+    Evaluate the current of a Gaussian beam
+
+    Args:
+        xi:            positions behind the front of the grid [m]
+        beam_num_ptcl: number of e- in the beam
+        beam_rms_z:    rms length of the beam [m]
+        xi_center:     position of the beam centre [m]
+    Returns:
+        current: magnitude of the beam current [A]
+    """
+    return beam_num_ptcl*scipy.constants.e*scipy.constants.c \
+        * np.exp(-0.5*((xi - xi_center)/beam_rms_z)**2)/(math.sqrt(2.*math.pi)*beam_rms_z)
+
+def calc_lambda(current):
+    """
+    Normalize a beam current, as in the bubble equation of Lu et al.
+
+    Args:
+        current: magnitude of the beam current [A]
+    Returns:
+        lambda: k_pe^2/n_pe times the integral of r*n_b over r, i.e. 2*I/I_A
+            with the Alfven current I_A = 4*pi*epsilon_0*m*c^3/e
+    """
+    return np.asarray(current, dtype=np.float64)*scipy.constants.e/(
+        2.*math.pi*scipy.constants.epsilon_0*scipy.constants.m_e*scipy.constants.c**3)
+
+def solve(xi, n_pe, current=None, sigma_r=None, particles=None, r_max=None,
+          n_rings=1200, r_grid=None):
+    """
+    Compute the quasi-static wake of a beam
+
+    The beam is given either by its current profile and rms radius, or
+    by particles.
+    Args:
+        xi:        uniformly spaced positions behind the front [m], increasing
+        n_pe:      number density of the electron plasma [m^-3]
+        current:   magnitude of the beam current on xi [A]
+        sigma_r:   rms radius of a Gaussian transverse profile [m]
+        particles: dict of arrays xi [m], r [m] and w (e- per macroparticle)
+        r_max:     outer radius of the plasma rings [m]; default 24/k_pe,
+                   which must be beyond the electrons ejected from the
+                   front of the bubble
+        n_rings:   number of plasma electron rings
+        r_grid:    radii of the returned fields [m]; default 200 points
+                   up to r_max/3
+    Returns:
+        wake: dict of xi and r, the fields Ez and Fr [V/m] and psi
+            (normalized), shape (len(xi), len(r)), and rb, the sheath
+            trajectory [m]
+    """
+    k_pe = calc_k_pe(n_pe)
+    xi = np.asarray(xi, dtype=np.float64)
+    if r_max is None:
+        r_max = 24./k_pe
+    if r_grid is None:
+        r_grid = np.linspace(0., r_max/3., 200)
+    beam = _beam(xi, k_pe, n_pe, current, sigma_r, particles)
+    h = (xi[1] - xi[0])*k_pe
+    dr0 = r_max*k_pe/n_rings
+    r = (np.arange(n_rings) + 0.5)*dr0
+    p_r = np.zeros(n_rings)
+    w = r*dr0
+    wake = dict(
+        xi=xi,
+        r=r_grid,
+        psi=np.zeros((len(xi), len(r_grid))),
+        Ez=np.zeros((len(xi), len(r_grid))),
+        Fr=np.zeros((len(xi), len(r_grid))),
+        rb=np.zeros(len(xi)),
+    )
+    for i in range(len(xi)):
+        dr1, dp1, fields = _derivatives(r, p_r, w, beam, i, r_grid*k_pe)
+        for name, value in fields.items():
+            wake[name][i] = value
+        if i + 1 == len(xi):
+            break
+        # Heun's method, with the beam of the next slice in the second stage
+        r2, p2 = _reflect(r + h*dr1, p_r + h*dp1)
+        dr2, dp2, _ = _derivatives(r2, p2, w, beam, i + 1)
+        r, p_r = _reflect(r + 0.5*h*(dr1 + dr2), p_r + 0.5*h*(dp1 + dp2))
+    E0 = calc_E0(n_pe)
+    wake['Ez'] *= E0
+    wake['Fr'] *= E0
+    wake['rb'] /= k_pe
+    return wake
+
+def _beam(xi, k_pe, n_pe, current, sigma_r, particles):
+    # beam charge inside a radius in the units of calc_lambda, per slice
+    if particles is None:
+        lam = calc_lambda(current)
+        s = sigma_r*k_pe
+        return lambda i, r: lam[i]*(-np.expm1(-0.5*(r/s)**2))
+    dxi = xi[1] - xi[0]
+    index = np.rint((np.asarray(particles['xi']) - xi[0])/dxi).astype(np.int64)
+    inside = (index >= 0) & (index < len(xi))
+    index = index[inside]
+    r_p = np.abs(np.asarray(particles['r'])[inside])*k_pe
+    order = np.lexsort((r_p, index))
+    index = index[order]
+    r_p = r_p[order]
+    charge = np.asarray(particles['w'])[inside][order]*k_pe**2/(2.*math.pi*n_pe*dxi)
+    start = np.searchsorted(index, np.arange(len(xi) + 1))
+    cumulative = np.append(0., np.cumsum(charge))
+
+    def lambda_b(i, r):
+        k = np.searchsorted(r_p[start[i]:start[i + 1]], r)
+        return cumulative[start[i] + k] - cumulative[start[i]]
+
+    return lambda_b
+
+def _derivatives(r, p_r, w, beam, i, r_grid=None):
+    order = np.argsort(r)
+    s = r[order]
+    ws = w[order]
+    p = p_r[order]
+    q = np.cumsum(ws)
+    psi = 0.25*(s[-1]**2 - s*s) - _tail(s, q)[:-1]
+    one_psi = np.maximum(1. + psi, MIN_ONE_PLUS_PSI)
+    gamma = (1. + p*p + one_psi*one_psi)/(2.*one_psi)
+    lost = gamma > MAX_GAMMA
+    if lost.any():
+        # stop them for good, as other quasi-static codes do
+        p_r[order[lost]] = 0.
+        p = np.where(lost, 0., p)
+        gamma = np.where(lost, 1., gamma)
+    p_z = np.where(lost, 0., gamma - one_psi)
+    v = p/one_psi
+    # charges and currents at a ring count half of the ring itself
+    dpsi_dr = -0.5*s + (q - 0.5*ws)/s
+    flux = ws*v/s
+    E_z = np.cumsum(flux[::-1])[::-1] - 0.5*flux
+    B_t = _b_theta(s, ws, v, p, p_z, gamma, one_psi, dpsi_dr, E_z, beam(i, s))
+    dr = np.empty_like(r)
+    dp = np.empty_like(r)
+    dr[order] = v
+    dp[order] = -B_t + gamma*dpsi_dr/one_psi
+    if r_grid is None:
+        return dr, dp, None
+    # the sheath: the plasma electrons inside hold a fraction of the ion charge
+    n_e = ws*gamma/one_psi
+    k = np.argmax(np.cumsum(n_e) - 0.5*n_e > SHEATH_THRESHOLD*0.5*s*s)
+    fields = _grid_fields(s, q, flux, r_grid)
+    fields['rb'] = s[k] if k else 0.
+    return dr, dp, fields
+
+def _b_theta(s, ws, v, p, p_z, gamma, one_psi, dpsi_dr, E_z, lambda_b):
+    # Crossing ring k, with d_k = d(w*v/r)/dxi = alpha_k*Btheta_k + beta_k,
+    #   a -> a - d_k/2,  b -> b + j_k + d_k*s_k^2/2
+    # where Btheta_k = a*s_k + b/s_k + (j_k/2 - lambda_b)/s_k
+    alpha = -ws/(s*one_psi)
+    beta = ws/(s*one_psi**2)*(gamma*dpsi_dr - p*(E_z + v*dpsi_dr)) - ws*(v/s)**2
+    j = ws*(v*v - p_z/one_psi)
+    e = (0.5*j - lambda_b)/s
+    x = 0.5*alpha*s
+    maps = np.zeros((len(s), 3, 3))
+    maps[:, 0, 0] = 1. - x
+    maps[:, 0, 1] = -0.5*alpha/s
+    maps[:, 0, 2] = -0.5*(alpha*e + beta)
+    maps[:, 1, 0] = x*s*s
+    maps[:, 1, 1] = 1. + x
+    maps[:, 1, 2] = j + 0.5*s*s*(alpha*e + beta)
+    maps[:, 2, 2] = 1.
+    prefix = _prefix_product(maps)
+    # a on the axis (b = 0 there) is set by the decay of Btheta, as K1(r),
+    # in the undisturbed plasma beyond the outermost ring
+    k0 = scipy.special.k0e(s[-1])
+    k1 = scipy.special.k1e(s[-1])
+    c_a = -s[-1]*k0 - 2.*k1
+    c_b = -k0/s[-1]
+    end = prefix[-1, :2, 2] - [0., lambda_b[-1]]
+    a0 = -(c_a*end[0] + c_b*end[1])/(c_a*prefix[-1, 0, 0] + c_b*prefix[-1, 1, 0])
+    ab = np.empty((len(s), 2))
+    ab[0] = a0, 0.
+    ab[1:] = prefix[:-1, :2, 0]*a0 + prefix[:-1, :2, 2]
+    return ab[:, 0]*s + ab[:, 1]/s + e
+
+def _prefix_product(maps):
+    # prefix[k] = maps[k] @ ... @ maps[0], in log2(n) vectorized steps
+    prefix = maps.copy()
+    step = 1
+    while step < len(prefix):
+        prefix[step:] = np.matmul(prefix[step:], prefix[:-step])
+        step *= 2
+    return prefix
+
+def _grid_fields(s, q, flux, r_grid):
+    k = np.searchsorted(s, r_grid)
+    q_r = np.where(k > 0, q[np.maximum(k - 1, 0)], 0.)
+    edges = np.append(s, s[-1])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log = np.where(q_r > 0., np.log(edges[k]/r_grid), 0.)
+        dpsi_dr = np.where(r_grid > 0., -0.5*r_grid + q_r/r_grid, 0.)
+    psi = 0.25*(s[-1]**2 - r_grid**2) - q_r*log - _tail(s, q)[k]
+    E_z = np.append(np.cumsum(flux[::-1])[::-1], 0.)[k]
+    # beyond the rings the plasma is undisturbed
+    outer = k == len(s)
+    psi[outer] = 0.
+    dpsi_dr[outer] = 0.
+    return dict(psi=psi, Ez=E_z, Fr=-dpsi_dr)
+
+def _tail(s, q):
+    # tail[m] = integral of q/r from s_m to the outermost ring, q constant between rings
+    seg = q[:-1]*np.log(s[1:]/s[:-1])
+    return np.append(np.cumsum(seg[::-1])[::-1], (0., 0.))
+
+def _reflect(r, p_r):
+    # a ring crossing the axis reappears on the other side
+    crossed = r < 0.
+    return np.where(crossed, -r, r), np.where(crossed, -p_r, p_r)
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""Batched fits of simulated wakes to the hollow-channel model
+
+Fits the mode wavenumber Omega*k_pe and loss factor kappa (optionally
+also the bunch centre zeta0) of :mod:`rsfbpic.rswake.hollow_channel` to
+many field lines at once: Ez lines for m=0, Er - c*Btheta lines for m=1.
+The initial wavenumber comes from the FFT peak of each line; the fit is
+a Levenberg-Marquardt iteration vectorized over lines, with analytic
+Jacobians.
+
+:copyright: Copyright (c) 2019 Radiasoft LLC. All Rights Reserved.
+:license: http://www.apache.org/licenses/LICENSE-2.0.html
+"""
+# import the usual suspects
+import functools
+import math
+import numpy as np
+import scipy.constants
+
+# RadiaSoft imports
+from rsfbpic.rsdata import parallel
+from rsfbpic.rsdata import zeta_stack
+from rsfbpic.rswake import hollow_channel
+
+def fft_guess(zeta, lines, pad=4):
+    """
+    Estimate the dominant wavenumber of each line from its FFT
+
+    The peak of the zero-padded spectrum is refined by parabolic
+    interpolation. NaN values are treated as zero.
+    Args:
+        zeta:   uniformly spaced co-moving positions, shape (M,)
+        lines:  field lines, shape (N, M)
+        pad:    zero-padding factor
+    Returns:
+        k: wavenumber of the spectral peak [m^-1], shape (N,)
+    """
+    lines = np.nan_to_num(np.atleast_2d(lines))
+    lines = lines - lines.mean(axis=1, keepdims=True)
+    n = pad*lines.shape[1]
+    spectrum = np.abs(np.fft.rfft(lines, n=n, axis=1))
+    spectrum[:, 0] = 0.
+    i = np.clip(spectrum.argmax(axis=1), 1, spectrum.shape[1] - 2)
+    rows = np.arange(len(i))
+    left = np.log(spectrum[rows, i - 1] + 1.e-300)
+    peak = np.log(spectrum[rows, i] + 1.e-300)
+    right = np.log(spectrum[rows, i + 1] + 1.e-300)
+    denom = left - 2.*peak + right
+    shift = np.where(denom < 0., 0.5*(left - right)/np.where(denom < 0., denom, 1.), 0.)
+    return 2.*math.pi*(i + shift)/(n*(zeta[1] - zeta[0]))
+
+def fit_lines(zeta, lines, sigma, Q, mode=0, Omega_kp=None, zeta0=0.,
+              fit_zeta0=False, max_iter=100, tol=1.e-8, num_workers=1):
+    """
+    Fit the hollow-channel wake to every line in one batched call
+
+    Args:
+        zeta:        co-moving positions, relative to the bunch centre
+        lines:       field lines, shape (N, M) or (M,); NaN is ignored.
+                     float32 lines stay float32 until split into blocks,
+                     which are fitted in float64
+        sigma:       rms length of the drive bunch
+        Q:           charge of the drive bunch [C]
+        mode:        0 to fit Ez, 1 to fit the transverse wake
+        Omega_kp:    initial wavenumbers; default from fft_guess
+        zeta0:       (initial) bunch centre offset
+        fit_zeta0:   fit the bunch centre as well
+        max_iter:    maximum number of iterations
+        tol:         relative change of the residual for convergence
+        num_workers: number of processes the lines are split across
+    Returns:
+        fit: dict of arrays of length N: Omega_kp, kappa, zeta0, their
+            uncertainties (Omega_kp_err, ...), rms_residual and converged,
+            plus residual with the shape of lines
+    """
+    lines = np.atleast_2d(np.asarray(lines))
+    zeta = np.asarray(zeta, dtype=np.float64)
+    if Omega_kp is None:
+        Omega_kp = fft_guess(zeta, lines)
+    p0 = np.zeros((lines.shape[0], 3))
+    p0[:, 0] = Omega_kp
+    p0[:, 2] = zeta0
+    blocks = [
+        (l, p) for l, p in zip(
+            np.array_split(lines, max(num_workers, 1)),
+            np.array_split(p0, max(num_workers, 1)),
+        ) if len(l)
+    ]
+    results = parallel.map_items(
+        functools.partial(
+            _fit_block, zeta, sigma, Q, mode, fit_zeta0, max_iter, tol),
+        blocks, num_workers, star=True,
+    )
+    return {k: np.concatenate([r[k] for r in results]) for k in results[0]}
+
+def fit_stack(path_to_stack, sigma, Q, mode=0, zeta0=0., i_r=slice(None), **kwargs):
+    """
+    Fit every radius and every iteration of a zeta stack
+
+    Args:
+        path_to_stack: stack written by rsdata.zeta_stack.build_stack
+        sigma:         rms length of the drive bunch
+        Q:             charge of the drive bunch [C]
+        mode:          0 for an Ez stack, 1 for an Er - c*Btheta stack
+        zeta0:         zeta of the bunch centre in the stack
+        i_r:           radial indices to fit; an integer, e.g. 0 for
+                       on axis, keeps an r axis of length 1
+        kwargs:        further arguments of fit_lines
+    Returns:
+        fit: as for fit_lines, with arrays of shape (iteration, r)
+        iterations: dump numbers
+        r:     radii of the fitted lines [m]
+    """
+    if not isinstance(i_r, slice) and np.ndim(i_r) == 0:
+        i_r = slice(i_r, i_r + 1 or None)
+    with zeta_stack.open_stack(path_to_stack) as f:
+        stack = f['field'][:, i_r, :]
+        zeta = f['zeta'][...]
+        iterations = f['iteration'][...]
+        r = f['r'][i_r]
+    shape = stack.shape
+    fit = fit_lines(
+        zeta - zeta0, stack.reshape(-1, shape[2]), sigma, Q, mode=mode, **kwargs)
+    for k, v in fit.items():
+        fit[k] = v.reshape(shape if v.ndim == 2 else shape[:2])
+    fit['zeta0'] += zeta0
+    return fit, iterations, r
+
+def _fit_block(zeta, sigma, Q, mode, fit_zeta0, max_iter, tol, lines, p):
+    valid = ~np.isnan(lines)
+    y = np.where(valid, lines, 0.).astype(np.float64)
+    free = [0, 1, 2] if fit_zeta0 else [0, 1]
+    # start from the best amplitude at the initial wavenumber
+    g = _model_jacobian(np.column_stack((p[:, 0], np.ones(len(p)), p[:, 2])),
+                        zeta, sigma, mode)[0]*valid
+    p[:, 1] = (y*g).sum(axis=1)/np.maximum((g*g).sum(axis=1), 1.e-300)
+    model, jac = _model_jacobian(p, zeta, sigma, mode)
+    resid = (y - model)*valid
+    cost = (resid**2).sum(axis=1)
+    lam = np.full(len(p), 1.e-3)
+    converged = np.zeros(len(p), dtype=bool)
+    for _ in range(max_iter):
+        # only lines still converging are updated
+        a = np.flatnonzero(~converged)
+        j = jac[a][:, :, free]*valid[a, :, np.newaxis]
+        jtj = np.einsum('nmp,nmq->npq', j, j)
+        jtr = np.einsum('nmp,nm->np', j, resid[a])
+        diag = np.einsum('npp->np', jtj)
+        damped = jtj + lam[a, np.newaxis, np.newaxis]*(
+            np.eye(len(free))*np.maximum(diag, 1.e-300)[:, :, np.newaxis])
+        trial = p[a]
+        trial[:, free] += np.linalg.solve(damped, jtr[:, :, np.newaxis])[:, :, 0]
+        trial_model, trial_jac = _model_jacobian(trial, zeta, sigma, mode)
+        trial_resid = (y[a] - trial_model)*valid[a]
+        trial_cost = (trial_resid**2).sum(axis=1)
+        better = trial_cost < cost[a]
+        converged[a] = better & (cost[a] - trial_cost <= tol*cost[a])
+        b = a[better]
+        p[b] = trial[better]
+        resid[b] = trial_resid[better]
+        jac[b] = trial_jac[better]
+        cost[b] = trial_cost[better]
+        lam[a] = np.where(better, lam[a]/3., lam[a]*4.)
+        # a stalled line has reached its minimum to machine precision
+        converged |= lam > 1.e12
+        if converged.all():
+            break
+    n = valid.sum(axis=1)
+    j = jac[:, :, free]*valid[:, :, np.newaxis]
+    jtj = np.einsum('nmp,nmq->npq', j, j)
+    cov = np.linalg.pinv(jtj)*(cost/np.maximum(n - len(free), 1))[:, np.newaxis, np.newaxis]
+    err = np.zeros_like(p)
+    err[:, free] = np.sqrt(np.abs(np.einsum('npp->np', cov)))
+    scale = 4.*math.pi*scipy.constants.epsilon_0/Q
+    fit = dict(
+        Omega_kp=p[:, 0],
+        kappa=p[:, 1]*scale,
+        zeta0=p[:, 2],
+        Omega_kp_err=err[:, 0],
+        kappa_err=err[:, 1]*abs(scale),
+        zeta0_err=err[:, 2],
+        rms_residual=np.sqrt(cost/np.maximum(n, 1)),
+        converged=converged,
+        residual=np.where(valid, resid, np.nan),
+    )
+    return fit
+
+def _model_jacobian(p, zeta, sigma, mode):
+    # p columns: Omega_kp, amplitude kappa*Q/(4 pi epsilon_0), zeta0
+    Omega = p[:, 0:1]
+    amplitude = p[:, 1:2]
+    z = zeta[np.newaxis, :] - p[:, 2:3]
+    G = hollow_channel.calc_wake_phasor(Omega, sigma, z)
+    gauss = np.exp(-0.5*(z/sigma)**2)
+    dG_dOmega = (-1.j*z - Omega*sigma**2)*G + 1.j*sigma*math.sqrt(2./math.pi)*gauss
+    dG_dzeta0 = 1.j*Omega*G + math.sqrt(2./math.pi)/sigma*gauss
+    part = np.real if mode == 0 else np.imag
+    jac = np.stack(
+        (amplitude*part(dG_dOmega), part(G), amplitude*part(dG_dzeta0)), axis=2)
+    return amplitude*part(G), jac
@@ -0,0 +1,108 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+import pytest
+
+import h5py
+import numpy as np
+import scipy.constants
+
+from rsfbpic.rsdata import beam_energy
+from rsfbpic.rsdata import read_field_hdf
+
+_MC2 = scipy.constants.m_e*scipy.constants.c**2/scipy.constants.e
+N_PTCL = 1000
+
+
+def _beam(zeta, uz0, duz_dt):
+    def particles(iteration, t):
+        i = np.arange(N_PTCL)
+        return dict(
+            x=np.zeros(N_PTCL),
+            y=np.zeros(N_PTCL),
+            z=scipy.constants.c*t + zeta + 1.e-6*(i/float(N_PTCL) - 0.5),
+            ux=np.zeros(N_PTCL),
+            uy=np.zeros(N_PTCL),
+            # two energies, with weights 1 and 3
+            uz=uz0 + duz_dt*t + np.where(i % 2, 10., -10.),
+            w=np.where(i % 2, 3.e6, 1.e6),
+        )
+    return particles
+
+
+def test_calc_kinetic_energy():
+    u = np.array([0., 1.e-4, 1., 1.e4])
+    expect = (np.sqrt(1. + u*u) - 1.)*_MC2
+    energy = beam_energy.calc_kinetic_energy(np.zeros(4), u, np.zeros(4), scipy.constants.m_e)
+    assert np.allclose(energy, expect, rtol=1.e-12)
+    assert energy[1] > 0.
+
+
+def test_track(fbpic_dumps, tmp_path):
+    species = dict(drive='beam', witness='trailing')
+    dump_dir = fbpic_dumps(iterations=(0, 50, 100), species=dict(
+        beam=_beam(-20.e-6, 2000., -1.e15),
+        trailing=_beam(-5.e-6, 1000., 2.e15),
+    ))
+    out_path = str(tmp_path / 'energy.h5')
+    assert beam_energy.track(
+        dump_dir, out_path, species, (0., 2.e9), bins=100, chunk_size=300,
+        num_workers=2) == [0, 50, 100]
+    # a rerun only appends new dumps
+    assert beam_energy.track(dump_dir, out_path, species, (0., 2.e9), bins=100) == []
+    with h5py.File(out_path, 'r') as f:
+        assert list(f['iteration']) == [0, 50, 100]
+        assert f['witness/histogram'].shape == (3, 100)
+        for i, (n_dump, path_to_file) in enumerate(read_field_hdf.list_dumps(dump_dir)):
+            t = f['time'][i]
+            for role, uz0, duz_dt in (('drive', 2000., -1.e15), ('witness', 1000., 2.e15)):
+                uz = uz0 + duz_dt*t + np.array([-10., 10.])
+                energy = (np.sqrt(1. + uz*uz) - 1.)*_MC2
+                mean = np.average(energy, weights=[1., 3.])
+                assert np.isclose(f[role + '/mean_energy'][i], mean, rtol=1.e-12)
+                assert np.isclose(
+                    f[role + '/rms_spread'][i],
+                    np.sqrt(np.average((energy - mean)**2, weights=[1., 3.])), rtol=1.e-6)
+                assert np.isclose(
+                    f[role + '/charge'][i], 2.e6*N_PTCL*scipy.constants.e, rtol=1.e-12)
+                assert np.isclose(f[role + '/histogram'][i].sum(), f[role + '/charge'][i])
+            ez, z, _ = read_field_hdf.read_line(path_to_file, 'E', 'z', str(n_dump))
+            zeta = z - scipy.constants.c*t
+            along = np.abs(zeta + 20.e-6) <= 1.e-6
+            assert np.isclose(f['peak_decel'][i], ez[along].max())
+            assert f['peak_decel'][i] > 0. and f['peak_accel'][i] > 0.
+            assert np.isclose(
+                f['transformer_ratio'][i], f['peak_accel'][i]/f['peak_decel'][i])
+        assert np.allclose(
+            f['witness/gain'][...], f['witness/mean_energy'][...] - f['witness/mean_energy'][0])
+        assert f['witness/gain'][2] > 0. > f['drive/gain'][2]
+
+
+def test_track_late_role(fbpic_dumps, tmp_path):
+    witness = _beam(-5.e-6, 1000., 2.e15)
+
+    def late_witness(iteration, t):
+        # injected after the first dump
+        p = witness(iteration, t)
+        return dict(p, w=p['w']*0.) if iteration == 0 else p
+
+    beams = dict(beam=_beam(-20.e-6, 2000., -1.e15), trailing=late_witness)
+    first = fbpic_dumps(iterations=(0, 50), species=beams, run='first')
+    both = fbpic_dumps(iterations=(0, 50, 100), species=beams, run='both')
+    out_path = str(tmp_path / 'energy.h5')
+    beam_energy.track(both, out_path, dict(drive='beam', witness='trailing'), (0., 2.e9),
+                      num_workers=1)
+    with h5py.File(out_path, 'r') as f:
+        gain = f['witness/gain'][...]
+        mean = f['witness/mean_energy'][...]
+    assert np.isnan(gain[0]) and np.isnan(mean[0])
+    assert np.allclose(gain[1:], mean[1:] - mean[1])
+    # a role added on a rerun starts with NaN rows
+    out_path = str(tmp_path / 'rerun.h5')
+    beam_energy.track(first, out_path, dict(drive='beam'), (0., 2.e9), num_workers=1)
+    assert beam_energy.track(both, out_path, dict(drive='beam', witness='trailing'),
+                             (0., 2.e9), num_workers=1) == [100]
+    with h5py.File(out_path, 'r') as f:
+        assert f['witness/histogram'].shape == (3, 200)
+        assert np.isnan(f['witness/charge'][:2]).all()
+        assert np.isclose(f['witness/mean_energy'][2], mean[2], rtol=1.e-12)
+        assert f['witness/gain'][2] == 0.
+        assert np.isfinite(f['drive/gain'][...]).all()
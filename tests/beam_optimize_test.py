@@ -0,0 +1,79 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+import pytest
+
+import numpy as np
+import scipy.constants
+
+from rsfbpic.rswake import beam_optimize
+
+# parameters of examples/bubble/lbn_example.py
+n_pe = 4.e22
+k_pe = np.sqrt(n_pe*scipy.constants.e**2/(
+    scipy.constants.m_e*scipy.constants.epsilon_0))/scipy.constants.c
+lambda_pe = 2.*np.pi/k_pe
+example = dict(
+    beam_rms_z=0.5/k_pe,
+    beam_tot_q=3.e-9,
+    wb_rms_z=0.036*lambda_pe,
+    wb_tot_q=0.1e-9,
+    wb_trail=0.9*lambda_pe,
+)
+
+
+def test_pareto_front():
+    objectives = [[1., 1.], [2., 0.5], [0.5, 0.5], [1., 1.], [0.5, 2.], [2., 0.4]]
+    assert list(beam_optimize.pareto_front(objectives, block=2)) \
+        == [True, True, False, True, True, False]
+
+
+def test_evaluate_lbn():
+    params = {k: np.array([v, v]) for k, v in example.items()}
+    # at the example's 0.9*lambda_pe the witness is behind the LBN bubble
+    params['wb_trail'] = np.array([0.6, 0.01])*lambda_pe
+    res = beam_optimize.evaluate_lbn(params, n_pe)
+    assert np.allclose(res['strong_1'], 3.66, rtol=2.e-3)
+    assert np.allclose(res['strong_2'], 3.12, rtol=2.e-3)
+    # the witness must trail the drive beam
+    assert list(res['feasible']) == [True, False]
+    assert res['transformer_ratio'][0] > 0.
+    assert np.isclose(res['efficiency'][0], res['transformer_ratio'][0]/30.)
+    heavier = dict(params, wb_tot_q=10.*params['wb_tot_q'])
+    assert beam_optimize.evaluate_lbn(heavier, n_pe)['E_acc'][0] < res['E_acc'][0]
+
+
+@pytest.mark.parametrize('evaluate, fixed', [
+    (beam_optimize.evaluate_lbn, dict(wb_rms_z=example['wb_rms_z'])),
+    (beam_optimize.evaluate_hollow_channel,
+     dict(wb_rms_z=example['wb_rms_z'], channel_radius=1./k_pe)),
+])
+def test_optimize(evaluate, fixed):
+    bounds = dict(
+        beam_rms_z=(0.25/k_pe, 1./k_pe),
+        beam_tot_q=(1.e-9, 5.e-9),
+        wb_tot_q=(1.e-11, 1.e-9),
+        wb_trail=(0.3*lambda_pe, 1.5*lambda_pe),
+    )
+    front = beam_optimize.optimize(
+        evaluate, bounds, fixed, population=400, generations=3, num_workers=2,
+        seed=1, n_pe=n_pe)
+    assert len(front['transformer_ratio']) > 1
+    assert front['feasible'].all()
+    assert np.all(np.diff(front['transformer_ratio']) <= 0.)
+    # along the front, a higher transformer ratio costs efficiency
+    assert np.all(np.diff(front['efficiency']) >= 0.)
+    for k, (low, high) in bounds.items():
+        assert np.all((front[k] >= low*(1. - 1.e-12)) & (front[k] <= high*(1. + 1.e-12)))
+    again = beam_optimize.optimize(
+        evaluate, bounds, fixed, population=400, generations=3, num_workers=1,
+        seed=1, n_pe=n_pe)
+    assert np.array_equal(again['efficiency'], front['efficiency'])
+
+
+def test_optimize_infeasible():
+    # the witness would sit inside the drive beam
+    bounds = dict(wb_trail=(0.001*lambda_pe, 0.002*lambda_pe))
+    fixed = dict((k, v) for k, v in example.items() if k != 'wb_trail')
+    with pytest.raises(ValueError):
+        beam_optimize.optimize(
+            beam_optimize.evaluate_lbn, bounds, fixed, population=50, generations=2,
+            seed=1, n_pe=n_pe)
@@ -0,0 +1,99 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+import pytest
+
+import json
+import os
+
+import h5py
+import numpy as np
+
+from rsfbpic.rsdata import campaign
+from rsfbpic.rsdata import reductions
+
+
+def _stand_in(params, run_dir):
+    """Write two FBPIC-like dumps of a wake linear in the witness charge"""
+    if params.get('fail'):
+        raise RuntimeError('diverged')
+    dump_dir = os.path.join(run_dir, campaign.DUMP_SUBDIR)
+    os.makedirs(dump_dir)
+    i = np.arange(64)
+    for iteration in (0, 100):
+        ez = 1.e9*np.sin(0.1*i) + 1.e20*params['witness_Q']*(i < 20)
+        with h5py.File(os.path.join(dump_dir, 'data{:08d}.h5'.format(iteration)), 'w') as f:
+            step = f.create_group('data/{}'.format(iteration))
+            step.attrs['time'] = iteration*1.e-14
+            step.attrs['timeUnitSI'] = 1.
+            record = step.create_group('fields/E')
+            record.create_dataset('z', data=np.tile(ez, (1, 4, 1)))
+            record.attrs['gridSpacing'] = np.array([1.e-6, 0.5e-6])
+            record.attrs['gridGlobalOffset'] = np.array([0., 0.])
+            record.attrs['gridUnitSI'] = 1.
+    with open(os.path.join(run_dir, 'launch.json'), 'w') as f:
+        json.dump(dict(pid=os.getpid(), threads=_startup_environ().get('OMP_NUM_THREADS')), f)
+
+
+def _startup_environ():
+    # the environment the process started with, before numpy loaded BLAS
+    if not os.path.exists('/proc/self/environ'):
+        return os.environ
+    with open('/proc/self/environ', 'rb') as f:
+        items = [v.decode().split('=', 1) for v in f.read().split(b'\0') if b'=' in v]
+    return dict(items)
+
+
+def _launches(results):
+    res = []
+    for r in results:
+        with open(os.path.join(r['run_dir'], 'launch.json')) as f:
+            res.append(json.load(f))
+    return res
+
+
+def test_param_hash():
+    assert campaign.param_hash(dict(a=1., b=[1, 2])) == campaign.param_hash(
+        dict(b=[1, 2], a=np.float64(1.)))
+    assert campaign.param_hash(dict(a=1.)) != campaign.param_hash(dict(a=1.5))
+    runs = campaign.expand(dict(a=0, b=0), scan=dict(a=[1, 2], b=[3]), runs=[dict(c=4)])
+    assert runs == [dict(a=1, b=3), dict(a=2, b=3), dict(a=0, b=0, c=4)]
+
+
+def test_run_campaign(tmp_path):
+    out_dir = str(tmp_path / 'campaign')
+    base = dict(witness_Q=0., seed=0)
+    runs = campaign.expand(base, scan=dict(witness_Q=[1.e-12, 3.e-12, 1.e-11]))
+    results = campaign.run_campaign(
+        out_dir, _stand_in, runs, baseline=base,
+        reductions=dict(on_axis_ez=reductions.on_axis_ez), max_workers=2, threads_per_run=2)
+    assert [r['params'] for r in results] == [base] + runs
+    assert all(r['launched'] for r in results)
+    launches = _launches(results)
+    assert os.getpid() not in [l['pid'] for l in launches]
+    assert all(l['threads'] == '2' for l in launches)
+    assert os.environ.get('OMP_NUM_THREADS') == _startup_environ().get('OMP_NUM_THREADS')
+    for r in results[1:]:
+        with h5py.File(os.path.splitext(r['state_path'])[0] + '.h5', 'r') as f:
+            assert list(f['wake_ez_iteration']) == [0, 100]
+            wake = f['wake_ez'][...]
+        assert np.allclose(wake[:, :20], 1.e20*r['params']['witness_Q'])
+        assert np.allclose(wake[:, 20:], 0.)
+    with open(results[0]['state_path']) as f:
+        assert json.load(f)['arrays'] == ['on_axis_ez']
+    # the baseline and finished runs are reused, a failure is reported
+    # after the other runs, and only the new runs are launched
+    more = runs + [dict(base, witness_Q=3.e-11), dict(base, witness_Q=1.e-10, fail=True)]
+    with pytest.raises(RuntimeError):
+        campaign.run_campaign(out_dir, _stand_in, more, baseline=base, max_workers=1)
+    results = campaign.run_campaign(out_dir, _stand_in, more[:-1], baseline=base, max_workers=1)
+    assert [r['launched'] for r in results] == [False]*5
+    assert [l['pid'] for l in _launches(results)][4] == os.getpid()
+    assert not campaign.is_complete(campaign.run_dir(out_dir, more[-1]))
+    with h5py.File(os.path.join(results[4]['run_dir'], 'reductions.h5'), 'r') as f:
+        assert np.allclose(f['wake_ez'][:, 0], 3.e9)
+    # rerunning a complete campaign with a pool launches nothing
+    results = campaign.run_campaign(out_dir, _stand_in, more[:-1], baseline=base, max_workers=2)
+    assert [r['launched'] for r in results] == [False]*5
+    with open(os.path.join(out_dir, 'campaign.json')) as f:
+        index = json.load(f)
+    assert index['baseline'] == results[0]['hash']
+    assert len(index['runs']) == 6
@@ -1,3 +1,114 @@
 # This avoids a plugin dependency issue with pytest-forked/xdist:
 # https://github.com/pytest-dev/pytest/issues/935
 pytest_plugins = ['pykern.pytest_plugin']
+
+import pytest
+
+# wavenumber and amplitude of the synthetic wake written by fbpic_dumps
+WAKE_K = 2.e5   # [rad/m]
+WAKE_E0 = 1.e9  # [V/m]
+
+
+@pytest.fixture
+def fbpic_dumps(tmp_path):
+    """Factory writing FBPIC-like openPMD dumps of a synthetic wake
+
+    The fields depend only on zeta = z - c*t and r, and the grid moves
+    with a window at c, like an FBPIC run with a moving window.
+    """
+
+    def write(iterations=(0, 50, 100), nr=16, nz=64, dt=1.e-14, species=None,
+              run='hdf5'):
+        import h5py
+        import numpy as np
+        import scipy.constants
+
+        c = scipy.constants.c
+        dr = 1.e-6
+        dz = 0.5e-6
+        dump_dir = tmp_path / run
+        dump_dir.mkdir()
+        for iteration in iterations:
+            t = iteration * dt
+            # the window moves by whole cells, so zeta is shifted by a
+            # fraction of a cell from dump to dump
+            zmin = (np.floor(c * t / dz) - nz) * dz
+            r = (np.arange(nr) + 0.5) * dr
+            z = zmin + np.arange(nz) * dz
+            zeta = z - c * t
+            rr, zz = np.meshgrid(r, zeta, indexing='ij')
+            envelope = np.exp(-(rr / (nr * dr / 2.)) ** 2)
+            fields = dict(
+                E=dict(
+                    r=WAKE_E0 * envelope * np.cos(WAKE_K * zz),
+                    t=np.zeros_like(rr),
+                    z=WAKE_E0 * envelope * np.sin(WAKE_K * zz),
+                ),
+                B=dict(
+                    r=np.zeros_like(rr),
+                    t=WAKE_E0 / c * envelope * np.cos(WAKE_K * zz) * 0.5,
+                    z=np.zeros_like(rr),
+                ),
+                rho=-scipy.constants.e * 1.e22 * (1. - envelope),
+            )
+            path = dump_dir / 'data{:08d}.h5'.format(iteration)
+            with h5py.File(str(path), 'w') as f:
+                f.attrs['basePath'] = '/data/%T/'
+                f.attrs['meshesPath'] = 'fields/'
+                f.attrs['particlesPath'] = 'particles/'
+                f.attrs['iterationEncoding'] = 'fileBased'
+                f.attrs['iterationFormat'] = 'data%T.h5'
+                step = f.create_group('data/{}'.format(iteration))
+                step.attrs['time'] = t
+                step.attrs['timeUnitSI'] = 1.
+                step.attrs['dt'] = dt
+                for name, value in fields.items():
+                    if isinstance(value, dict):
+                        record = step.create_group('fields/' + name)
+                        for coord, data in value.items():
+                            d = record.create_dataset(coord, data=data[np.newaxis])
+                            d.attrs['position'] = np.array([0.5, 0.])
+                            d.attrs['unitSI'] = 1.
+                    else:
+                        record = step.create_dataset(
+                            'fields/' + name, data=value[np.newaxis])
+                        record.attrs['position'] = np.array([0.5, 0.])
+                        record.attrs['unitSI'] = 1.
+                    record.attrs['gridSpacing'] = np.array([dr, dz])
+                    record.attrs['gridGlobalOffset'] = np.array([0., zmin])
+                    record.attrs['gridUnitSI'] = 1.
+                    record.attrs['geometry'] = 'thetaMode'
+                    record.attrs['axisLabels'] = np.array([b'r', b'z'])
+                for name, particles in (species or {}).items():
+                    _write_species(step, name, particles(iteration, t))
+        return str(dump_dir)
+
+    return write
+
+
+def _write_species(step, name, particles):
+    import numpy as np
+    import scipy.constants
+
+    group = step.create_group('particles/' + name)
+    m = scipy.constants.m_e
+    c = scipy.constants.c
+    n = len(particles['w'])
+    for record, unit, components in (
+        ('position', 1., ('x', 'y', 'z')),
+        ('momentum', m * c, ('ux', 'uy', 'uz')),
+    ):
+        for axis, key in zip('xyz', components):
+            d = group.create_dataset('{}/{}'.format(record, axis), data=particles[key])
+            d.attrs['unitSI'] = unit
+    for axis in 'xyz':
+        offset = group.create_group('positionOffset/' + axis)
+        offset.attrs['value'] = 0.
+        offset.attrs['shape'] = np.array([n])
+        offset.attrs['unitSI'] = 1.
+    group.create_dataset('weighting', data=particles['w']).attrs['unitSI'] = 1.
+    for record, value in (('charge', -scipy.constants.e), ('mass', m)):
+        constant = group.create_group(record)
+        constant.attrs['value'] = value
+        constant.attrs['shape'] = np.array([n])
+        constant.attrs['unitSI'] = 1.
@@ -0,0 +1,73 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+import pytest
+
+import math
+import numpy as np
+
+from rsfbpic.rsdata import deposit
+from rsfbpic.rsdata import read_particle_hdf
+
+# uniform plasma cylinder with a linear z-uz correlation
+N_PTCL = 200000
+R_MAX = 10.e-6
+N_PE = 1.e23
+
+
+def _plasma(iteration, t):
+    rng = np.random.RandomState(iteration)
+    r = R_MAX * np.sqrt(rng.uniform(size=N_PTCL))
+    theta = rng.uniform(0., 2. * math.pi, size=N_PTCL)
+    z = rng.uniform(-20.e-6, 0., size=N_PTCL)
+    return dict(
+        x=r * np.cos(theta),
+        y=r * np.sin(theta),
+        z=z,
+        ux=np.zeros(N_PTCL),
+        uy=np.zeros(N_PTCL),
+        uz=1.e3 + 1.e8 * z,
+        w=np.full(N_PTCL, N_PE * math.pi * R_MAX ** 2 * 20.e-6 / N_PTCL),
+    )
+
+
+def test_cic_histogram2d():
+    hist = deposit.cic_histogram2d(
+        np.array([0.5, 1.75]), np.array([0.5, 0.5]), np.array([1., 2.]),
+        (0., 2.), (0., 1.), (2, 1),
+    )
+    # the second point lies a quarter cell past the centre of the last
+    # bin, so a quarter of its weight falls off the grid
+    assert np.allclose(hist, [[1.], [1.5]])
+
+
+def test_read_species(fbpic_dumps):
+    dump_dir = fbpic_dumps(iterations=(0,), species=dict(electrons=_plasma))
+    path_to_file = dump_dir + '/data00000000.h5'
+    assert read_particle_hdf.count_species(path_to_file, 'electrons', '0') == N_PTCL
+    chunks = list(read_particle_hdf.iter_species(
+        path_to_file, 'electrons', '0', ['z', 'uz', 'w'], chunk_size=60000))
+    assert [len(c['z']) for c in chunks] == [60000, 60000, 60000, 20000]
+    expect = _plasma(0, 0.)
+    assert np.allclose(np.concatenate([c['uz'] for c in chunks]), expect['uz'])
+
+
+def test_density_and_phase_space(fbpic_dumps):
+    dump_dir = fbpic_dumps(iterations=(0, 50), species=dict(electrons=_plasma))
+    iterations, n = deposit.accumulate(
+        dump_dir, deposit.density_rz, num_workers=2, species='electrons',
+        r_range=(0., 2. * R_MAX), z_range=(-20.e-6, 0.), bins=(20, 10), chunk_size=50000,
+    )
+    assert list(iterations) == [0, 50]
+    assert n.shape == (2, 20, 10) and n.dtype == np.float32
+    # interior cells, away from the plasma edge and the z ends; linear
+    # weights overestimate the density in the cell on axis
+    assert np.allclose(n[:, 1:8, 1:-1].mean(axis=2), N_PE, rtol=0.05)
+    assert np.allclose(n[:, 0, 1:-1].mean(axis=1), N_PE, rtol=0.2)
+    assert np.allclose(n[:, 11:, :], 0.)
+    _, hist = deposit.accumulate(
+        dump_dir, deposit.phase_space, num_workers=1, species='electrons',
+        name='z-uz', a_range=(-20.e-6, 0.), b_range=(-1.e3, 1.e3), bins=(40, 40),
+    )
+    total = N_PE * math.pi * R_MAX ** 2 * 20.e-6
+    assert np.allclose(hist.sum(axis=(1, 2)), total, rtol=0.05)
+    # the correlation puts the weight on the diagonal
+    assert (hist[0].argmax(axis=1)[2:-2] == np.arange(40)[2:-2]).all()
@@ -0,0 +1,87 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+import pytest
+
+import h5py
+import numpy as np
+import scipy.signal
+
+from rsfbpic.rswake import filters
+
+# the 3x3 kernel of curl_filter in jupyter/panofsky_wenzel/pwfa_videos.ipynb
+CURL_KERNEL = np.array([[1., 1., 1.],
+                        [1., 2., 1.],
+                        [1., 1., 1.]])/10.
+
+
+def _stack(shape=(4, 24, 40)):
+    return np.random.RandomState(0).normal(size=shape)
+
+
+def test_kernels():
+    assert np.allclose(filters.binomial_kernel(2), np.array([1., 4., 6., 4., 1.])/16.)
+    assert np.isclose(filters.gaussian_kernel(2.5).sum(), 1.)
+
+
+@pytest.mark.parametrize('num_threads', [1, 3])
+def test_binomial_in_place(num_threads):
+    stack = _stack()
+    expect = np.array([
+        scipy.signal.convolve2d(f, np.outer([1., 2., 1.], [1., 2., 1.])/16., boundary='symm', mode='same')
+        for f in stack
+    ])
+    result = filters.binomial(stack, num_threads=num_threads)
+    assert result is stack
+    assert np.allclose(stack, expect)
+
+
+def test_user_kernel():
+    stack = _stack()
+    expect = np.array([
+        scipy.signal.convolve2d(f, CURL_KERNEL, boundary='symm', mode='same') for f in stack
+    ])
+    direct = stack.copy()
+    filters.convolve(direct, CURL_KERNEL, num_threads=2)
+    assert np.allclose(direct, expect)
+    filters.fft_convolve(stack, CURL_KERNEL, num_threads=2)
+    assert np.allclose(stack, expect)
+    # a separable kernel gives the same result either way
+    a = _stack()
+    b = a.copy()
+    kernel = np.outer(filters.gaussian_kernel(1.5), filters.gaussian_kernel(2.))
+    filters.convolve(a, kernel)
+    filters.fft_convolve(b, kernel)
+    assert np.allclose(a, b)
+
+
+@pytest.mark.parametrize('shape', [(4, 4), (8, 8), (3, 8)])
+def test_even_kernel(shape):
+    rng = np.random.RandomState(1)
+    full = rng.normal(size=shape)
+    a, b = rng.normal(size=shape[0]), rng.normal(size=shape[1])
+    stack = _stack()
+    for kernel, apply in (
+        (np.outer(a, b), lambda s: filters.separable(s, a, b)),
+        (full, lambda s: filters._direct_convolve(s, full, 'reflect', 2)),
+        (full, lambda s: filters.fft_convolve(s, full)),
+        (full, lambda s: filters.convolve(s, full)),
+    ):
+        expect = np.array([
+            scipy.signal.convolve2d(f, kernel, boundary='symm', mode='same') for f in stack
+        ])
+        result = stack.copy()
+        apply(result)
+        assert np.allclose(result, expect)
+
+
+@pytest.mark.parametrize('num_threads', [1, 3])
+def test_gaussian_long_kernel_and_dataset(tmp_path, num_threads):
+    stack = _stack((2, 4, 24, 80))
+    expect = stack.copy()
+    filters.separable(expect, filters.gaussian_kernel(1.), filters.gaussian_kernel(10.))
+    with h5py.File(str(tmp_path / 'stack.h5'), 'w') as f:
+        dataset = f.create_dataset('field', data=stack)
+        filters.gaussian(dataset, 1., 10., num_threads=num_threads)
+        assert np.allclose(dataset[...], expect)
+        dataset[...] = stack
+        filters.binomial(dataset, 2, num_threads=num_threads)
+        assert np.allclose(dataset[...], filters.binomial(stack.copy(), 2))
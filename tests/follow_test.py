@@ -0,0 +1,90 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+import pytest
+
+import json
+import os
+
+import h5py
+import numpy as np
+import scipy.constants
+
+from rsfbpic.rsdata import follow
+from rsfbpic.rsdata import reductions
+
+
+def test_calc_bubble_radius():
+    n_pe = 1.e22
+    r = (np.arange(10) + 0.5)*1.e-6
+    rho = np.zeros((10, 3))
+    # column 1: beam on axis, bubble out to r=6 um, then the sheath
+    rho[:, 1] = [-5., 1., 1., 1., 1., 1., -2., -1., 0., 0.]
+    # column 2: bubble from the axis out to 3 um
+    rho[:3, 2] = 1.
+    rb = reductions.calc_bubble_radius(rho*scipy.constants.e*n_pe, r, n_pe)
+    assert np.allclose(rb, [0., 6.e-6, 3.e-6])
+
+
+def test_calc_pw_curl():
+    r = np.linspace(0., 1., 11)
+    z = np.linspace(0., 2., 21)
+    rr, zz = np.meshgrid(r, z, indexing='ij')
+    # a force derived from a potential has no curl
+    curl_F, curl_rs, curl_zs = reductions.calc_pw_curl(2.*rr*zz, rr**2, r, z)
+    assert curl_F.shape == (10, 20)
+    assert np.allclose(curl_F, 0.)
+    curl_F, _, _ = reductions.calc_pw_curl(zz**2, np.zeros_like(rr), r, z)
+    assert np.allclose(curl_F, 2.*curl_zs[np.newaxis, :])
+
+
+def test_follow(fbpic_dumps, tmp_path):
+    dump_dir = fbpic_dumps(iterations=(0, 50))
+    state_path = str(tmp_path / 'follow.json')
+    follower = follow.DumpFollower(
+        dump_dir, state_path, reductions.default_reductions(1.e22), settle_time=3600.)
+    # the last dump may still be being written
+    assert follower.poll() == [0]
+    # a later dump completes it, but a half-written dump is never read
+    with open(os.path.join(dump_dir, 'data00000100.h5'), 'wb') as f:
+        f.write(b'\x89HDF\r\n')
+    assert follower.poll() == [50]
+    follower.settle_time = 0.
+    assert follower.poll() == []
+    os.remove(os.path.join(dump_dir, 'data00000100.h5'))
+    with open(state_path) as f:
+        state = json.load(f)
+    assert state['iterations'] == [0, 50]
+    assert len(state['scalars']['pw_curl_norm']) == 2
+    assert state['arrays'] == ['bubble_radius', 'on_axis_ez']
+    with h5py.File(str(tmp_path / 'follow.h5'), 'r') as f:
+        assert f['on_axis_ez'].shape == (2, 64)
+        assert list(f['on_axis_ez_iteration']) == [0, 50]
+    # a restarted follower resumes from the state file
+    restarted = follow.DumpFollower(
+        dump_dir, state_path, reductions.default_reductions(1.e22), settle_time=0.)
+    assert restarted.poll() == []
+    state = follow.follow(
+        dump_dir, state_path, reductions.default_reductions(1.e22),
+        poll_interval=0., settle_time=0., idle_timeout=0.)
+    assert state['iterations'] == [0, 50]
+
+
+def test_follow_skips_corrupt_dump(fbpic_dumps, tmp_path):
+    dump_dir = fbpic_dumps(iterations=(0, 50, 100))
+    # dump 50 is complete, as 100 follows it, but cannot be opened
+    with open(os.path.join(dump_dir, 'data00000050.h5'), 'wb') as f:
+        f.write(b'\x89HDF\r\n')
+    state_path = str(tmp_path / 'follow.json')
+    follower = follow.DumpFollower(
+        dump_dir, state_path, dict(on_axis_ez=reductions.on_axis_ez), settle_time=0.,
+        max_attempts=2)
+    assert follower.poll() == [0]
+    assert follower.poll() == [100]
+    assert follower.poll() == []
+    with open(state_path) as f:
+        state = json.load(f)
+    assert state['iterations'] == [0, 100]
+    assert state['skipped'] == [50]
+    # a restarted follower does not retry it
+    restarted = follow.DumpFollower(
+        dump_dir, state_path, dict(on_axis_ez=reductions.on_axis_ez), settle_time=0.)
+    assert restarted.poll() == []
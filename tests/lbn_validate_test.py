@@ -0,0 +1,117 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+import pytest
+
+import os
+
+import h5py
+import numpy as np
+import scipy.constants
+
+from rsfbpic.rsdata import read_field_hdf
+from rsfbpic.rsdata import repack
+from rsfbpic.rswake import lbn_validate
+from rsfbpic.rswake import lbn_wake
+
+# strong bubble parameters of lbn_test
+n_pe = 4.e22
+k_pe = np.sqrt(n_pe*scipy.constants.e**2/(
+    scipy.constants.m_e*scipy.constants.epsilon_0))/scipy.constants.c
+beam_tot_z = 2./k_pe
+beam_num_ptcl = 3.e-9/scipy.constants.e
+
+
+def test_vectorized_lbn():
+    rb_max = lbn_wake.calc_rb_max(n_pe, beam_tot_z, beam_num_ptcl)
+    xi = np.linspace(-0.5, 2.5, 31)*lbn_wake.calc_bubble_halfwidth(rb_max)
+    rb = lbn_wake.calc_local_bubble_radius(xi, rb_max)
+    assert np.array_equal(rb, [lbn_wake.calc_local_bubble_radius(x, rb_max) for x in xi])
+    assert isinstance(lbn_wake.calc_local_bubble_radius(xi[10], rb_max), float)
+    inside = rb > 0.
+    assert np.allclose(
+        lbn_wake.calc_Ez_on_axis_no_beam(n_pe, rb[inside], rb_max),
+        [lbn_wake.calc_Ez_on_axis_no_beam(n_pe, r, rb_max) for r in rb[inside]])
+
+
+def test_compare():
+    rb_max = lbn_wake.calc_rb_max(n_pe, beam_tot_z, beam_num_ptcl)
+    xi_b = lbn_wake.calc_bubble_halfwidth(rb_max)
+    xi = np.linspace(-0.2*xi_b, 2.2*xi_b, 241)[::-1]
+    rb, Ez = lbn_validate.predict(xi, n_pe, beam_tot_z, beam_num_ptcl)
+    Ez = np.nan_to_num(Ez)
+    # a perfect line, and one with 10% stronger fields and a 5% longer bubble
+    longer = lbn_validate.predict(xi/1.05, n_pe, beam_tot_z, beam_num_ptcl)[0]
+    m = lbn_validate.compare(
+        np.array([xi, xi]), np.array([Ez, 1.1*Ez]), np.array([rb, longer]),
+        n_pe, beam_tot_z, beam_num_ptcl)
+    assert set(m) == set(lbn_validate.METRICS)
+    for k in ('rb_max_error', 'rb_l2', 'ez_l2', 'peak_error', 'decel_error'):
+        assert abs(m[k][0]) < 1.e-12
+    assert abs(m['closure_error'][0]) < 0.01
+    assert np.allclose([m['ez_l2'][1], m['peak_error'][1], m['decel_error'][1]], 0.1)
+    assert abs(m['closure_error'][1] - 0.05) < 0.01
+    assert m['rb_l2'][1] > 0.01
+
+
+def test_validate_runs(fbpic_dumps):
+    paths = [
+        fbpic_dumps(iterations=(0, 50), run='a'),
+        fbpic_dumps(iterations=(0, 50, 100), run='b'),
+    ]
+    report = lbn_validate.validate_runs(
+        paths, n_pe, beam_tot_z, [beam_num_ptcl, 2*beam_num_ptcl], num_workers=2)
+    assert report.dtype == lbn_validate.REPORT_DTYPE
+    assert list(report['run']) == ['a', 'a', 'b', 'b', 'b']
+    assert list(report['iteration']) == [0, 50, 0, 50, 100]
+    assert report['strong_2'][-1] == 2*report['strong_2'][0]
+    assert np.all(report['strong_1'] > 1.)
+    table = lbn_validate.format_report(report)
+    assert len(table.splitlines()) == 6
+
+
+def _lbn_bubble(dump_dir):
+    """Replace Ez and rho of every dump with the LBN bubble, 5 um behind the window front"""
+    for n_dump, path_to_file in read_field_hdf.list_dumps(dump_dir):
+        n_dump_str = str(n_dump)
+        r, z = read_field_hdf.read_r_z(path_to_file, 'E', n_dump_str)
+        xi = z[-1] - 5.e-6 - z
+        rb, Ez = lbn_validate.predict(xi, n_pe, beam_tot_z, beam_num_ptcl)
+        with h5py.File(path_to_file, 'r+') as f:
+            fields = f['data'][n_dump_str]['fields']
+            fields['E/z'][0] = np.nan_to_num(Ez)[np.newaxis, :]
+            # only the ions are left inside the bubble
+            fields['rho'][0] = scipy.constants.e*n_pe*(r[:, np.newaxis] < rb)
+
+
+def test_validate_dir(fbpic_dumps, tmp_path):
+    # dr = 1 um, dz = 0.5 um; the bubble is ~100 um wide and ~165 um long
+    for run, iterations in (('a', (0, 50)), ('b', (0, 50, 100))):
+        _lbn_bubble(fbpic_dumps(iterations=iterations, nr=128, nz=400, run=run))
+    os.rename(str(tmp_path / 'b'), str(tmp_path / 'hdf5'))
+    os.makedirs(str(tmp_path / 'b'))
+    os.rename(str(tmp_path / 'hdf5'), str(tmp_path / 'b' / 'hdf5'))
+    repack.repack(str(tmp_path / 'a'), str(tmp_path / 'c.h5'))
+    os.makedirs(str(tmp_path / 'empty'))
+    assert [n for n, _ in lbn_validate.find_runs(str(tmp_path))] == ['a', 'b', 'c']
+    report = lbn_validate.validate_dir(
+        str(tmp_path), n_pe, beam_tot_z, [beam_num_ptcl, beam_num_ptcl, 2*beam_num_ptcl],
+        num_workers=2)
+    assert list(report['run']) == ['a', 'a', 'b', 'b', 'b', 'c', 'c']
+    rb_max = lbn_wake.calc_rb_max(n_pe, beam_tot_z, beam_num_ptcl)
+    same = report['run'] != 'c'
+    # the bubble radius is found to within a cell, Ez along the beam to
+    # within the cell the front is shifted by
+    assert np.all(np.abs(report['rb_max_error'][same])*rb_max < 1.e-6)
+    assert np.all(np.abs(report['decel_error'][same]) < 0.02)
+    assert np.all(report['rb_l2'][same] < 0.03)
+    assert np.all(np.abs(report['closure_error'][same]) < 0.02)
+    # run c is the bubble of run a, compared with twice the charge
+    rb_max_2 = lbn_wake.calc_rb_max(n_pe, beam_tot_z, 2*beam_num_ptcl)
+    assert np.allclose(report['rb_max_error'][~same], rb_max/rb_max_2 - 1., atol=0.02)
+    E_decel_2 = lbn_wake.calc_E_decel_along_beam(n_pe, beam_tot_z, 2*beam_num_ptcl)
+    assert np.all(report['decel_error'][~same] < 0.)
+    assert np.allclose(
+        report['decel_error'][~same],
+        lbn_wake.calc_E_decel_along_beam(n_pe, beam_tot_z, beam_num_ptcl)/E_decel_2 - 1.,
+        atol=0.02)
+    with pytest.raises(ValueError):
+        lbn_validate.validate_dir(str(tmp_path / 'empty'), n_pe, beam_tot_z, beam_num_ptcl)
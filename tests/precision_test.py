@@ -0,0 +1,88 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+import pytest
+
+import h5py
+import numpy as np
+
+from rsfbpic.rsdata import precision
+from rsfbpic.rsdata import read_field_hdf
+from rsfbpic.rsdata import reductions
+from rsfbpic.rsdata import repack
+from rsfbpic.rsdata import zeta_stack
+
+
+def test_convert():
+    values = np.linspace(-1., 1., 3000).reshape(3, 1000)
+    values[1, 5] = np.nan
+    tally = precision.ErrorTally()
+    converted = precision.convert(values, chunk_size=1000, tally=tally)
+    assert converted.dtype == np.float32
+    assert np.array_equal(converted, values.astype(np.float32), equal_nan=True)
+    report = tally.report()
+    assert 0. < report['conversion_max_rel_error'] <= 2.**-24
+    assert report['conversion_rms_error'] <= report['conversion_max_abs_error']
+
+
+def test_convert_selection(tmp_path, monkeypatch):
+    values = np.random.RandomState(0).normal(size=(2, 7, 300))
+    with h5py.File(str(tmp_path / 'values.h5'), 'w') as f:
+        dataset = f.create_dataset('values', data=values)
+        for selection in (
+                Ellipsis, (1,), (0, slice(None), slice(None)), (1, 3, slice(None)),
+                (slice(None), 2, slice(10, 200)), (0, slice(1, 6, 2)), (1, 4, 5)):
+            converted = precision.convert(dataset, chunk_size=500, selection=selection)
+            assert np.array_equal(converted, values[selection].astype(np.float32))
+        with pytest.raises(ValueError):
+            precision.convert(dataset, selection=(slice(None, None, -1),))
+        # readers convert a chunk at a time
+        calls = []
+        convert = precision.convert
+
+        def record(*args, **kwargs):
+            calls.append(kwargs.get('selection'))
+            return convert(*args, **kwargs)
+
+        monkeypatch.setattr(precision, 'convert', record)
+        assert np.array_equal(
+            precision.read(dataset, (0, slice(None), slice(None)), precision.FLOAT32),
+            values[0].astype(np.float32))
+        assert calls == [(0, slice(None), slice(None))]
+
+
+def test_float32_readers(fbpic_dumps, tmp_path):
+    dump_dir = fbpic_dumps(iterations=(0, 50))
+    (n_dump, path_to_file) = read_field_hdf.list_dumps(dump_dir)[-1]
+    ez = read_field_hdf.read_vector(path_to_file, 'E', 'z', str(n_dump))
+    ez32 = read_field_hdf.read_vector(
+        path_to_file, 'E', 'z', str(n_dump), dtype=precision.FLOAT32)
+    assert ez.dtype == np.float64 and ez32.dtype == np.float32
+    assert np.array_equal(ez32, ez.astype(np.float32))
+    _, series = read_field_hdf.read_series(dump_dir, 'rho', None, 0, dtype=precision.FLOAT32)
+    assert series.dtype == np.float32
+    full = reductions.default_reductions(1.e22)
+    single = reductions.default_reductions(1.e22, dtype=precision.FLOAT32)
+    for name in full:
+        expect = full[name](path_to_file, str(n_dump))
+        actual = single[name](path_to_file, str(n_dump))
+        assert np.allclose(actual, expect, rtol=1.e-5, atol=1.e-5*np.abs(expect).max())
+
+
+def test_float32_stacks(fbpic_dumps, tmp_path):
+    dump_dir = fbpic_dumps(iterations=(0, 50, 100))
+    sizes = {}
+    for dtype in (np.float64, np.float32):
+        out_path = zeta_stack.build_stack(
+            dump_dir, str(tmp_path / '{}.h5'.format(np.dtype(dtype).name)), 'E', 'z',
+            chunks=(1, 16, 32), compression=None, dtype=dtype)
+        with h5py.File(out_path, 'r') as f:
+            sizes[dtype] = f['field'].id.get_storage_size()
+            assert f['field'].dtype == dtype
+            if dtype == np.float32:
+                assert 0. < f['field'].attrs['conversion_max_rel_error'] <= 2.**-24
+            else:
+                assert 'conversion_max_rel_error' not in f['field'].attrs
+    assert 2*sizes[np.float32] == sizes[np.float64]
+    out_path = repack.repack(dump_dir, str(tmp_path / 'run.h5'), float32=True)
+    with h5py.File(out_path, 'r') as f:
+        for key in precision.ERROR_ATTRS:
+            assert key in f['repack/fields/E/z'].attrs
@@ -0,0 +1,47 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+import pytest
+
+import numpy as np
+
+from rsfbpic.rsdata import pyramid
+from rsfbpic.rsdata import read_field_hdf
+
+
+def test_downsample():
+    frame = np.arange(15.).reshape(3, 5)
+    frame_min, frame_max = pyramid.downsample(frame, frame)
+    assert np.array_equal(frame_min, [[0., 2., 4.], [10., 12., 14.]])
+    assert np.array_equal(frame_max, [[6., 8., 9.], [11., 13., 14.]])
+    assert pyramid.calc_levels((16, 1000), tile=(64, 256)) == 3
+
+
+def test_build_and_fetch(fbpic_dumps, tmp_path):
+    dump_dir = fbpic_dumps(iterations=(0, 50), nr=16, nz=100)
+    out_path = pyramid.build_pyramid(
+        dump_dir, str(tmp_path / 'pyramid.h5'), [('E', 'z'), ('rho', None)],
+        tile=(4, 16), num_workers=2)
+    n_dump, path_to_file = read_field_hdf.list_dumps(dump_dir)[1]
+    ez, r, z, _ = read_field_hdf.read_field_rz(path_to_file, 'E', 'z', str(n_dump))
+    with pyramid.open_pyramid(out_path) as f:
+        assert f.attrs['levels'] == 4
+        assert f['E/z/level3/max'].shape == (2, 2, 13)
+        # each coarse cell bounds the 8x8 block of fine cells it covers
+        coarse = f['E/z/level3/max'][1]
+        assert np.allclose(coarse[1, 2], ez[8:16, 16:24].max())
+        assert np.allclose(f['E/z/level3/min'][1, 0, 12], ez[0:8, 96:100].min())
+        view = pyramid.fetch(f, 'E/z', 50)
+        assert view['level'] == 0
+        assert np.allclose(view['min'], ez) and np.allclose(view['z'], z)
+        view = pyramid.fetch(f, 'E/z', 50, max_shape=(4, 16))
+        assert view['level'] == 3
+        assert view['min'].shape == (2, 13)
+        # zoomed in on a window, a finer level is read, only over the window
+        view = pyramid.fetch(
+            f, 'E/z', 50, r_range=(r[2], r[9]), z_range=(z[40], z[71]), max_shape=(4, 16))
+        assert view['level'] == 1
+        assert view['max'].shape == (4, 16)
+        assert np.allclose(view['r'][[0, -1]], [0.5*(r[2] + r[3]), 0.5*(r[8] + r[9])])
+        assert np.all(view['max'] >= view['min'])
+        assert np.isclose(view['z'][0], 0.5*(z[40] + z[41]))
+        rho = pyramid.fetch(f, 'rho', 0)
+        assert rho['min'].dtype == np.float32
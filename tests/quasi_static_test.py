@@ -0,0 +1,105 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+import pytest
+
+import numpy as np
+import scipy.constants
+import scipy.integrate
+
+from rsfbpic.rswake import lbn_wake
+from rsfbpic.rswake import quasi_static
+
+# a 6 nC drive beam in the plasma of lbn_test, in the strong bubble regime
+n_pe = 4.e22
+k_pe = quasi_static.calc_k_pe(n_pe)
+beam_rms_z = 0.5/k_pe
+beam_rms_r = 0.3/k_pe
+beam_num_ptcl = 6.e-9/scipy.constants.e
+xi = np.linspace(-2., 10., 961)/k_pe
+
+
+@pytest.fixture(scope='module')
+def drive_wake():
+    current = quasi_static.gaussian_current(xi, beam_num_ptcl, beam_rms_z)
+    return quasi_static.solve(xi, n_pe, current=current, sigma_r=beam_rms_r)
+
+
+def _bubble(wake):
+    # from the bubble front to its first closure
+    rb = wake['rb']*k_pe
+    front = np.argmax(rb > 0.5)
+    return slice(front, front + np.argmax(rb[front:] < 0.3))
+
+
+def test_lbn(drive_wake):
+    bubble = _bubble(drive_wake)
+    rb_max = lbn_wake.calc_rb_max(n_pe, 4.*beam_rms_z, beam_num_ptcl)
+    assert drive_wake['rb'][bubble].max() == pytest.approx(rb_max, rel=0.15)
+    length = (drive_wake['xi'][bubble.stop] - drive_wake['xi'][bubble.start])
+    assert length == pytest.approx(2.*lbn_wake.calc_bubble_halfwidth(rb_max), rel=0.25)
+    along = np.abs(xi) < 2.*beam_rms_z
+    E_decel = lbn_wake.calc_E_decel_along_beam(n_pe, 4.*beam_rms_z, beam_num_ptcl)
+    assert drive_wake['Ez'][along, 0].mean() == pytest.approx(E_decel, rel=0.25)
+    # decelerating at the front, accelerating at the back, focusing throughout
+    Ez = drive_wake['Ez'][bubble, 0]
+    assert Ez[0] > 0. and Ez[-10] < 0.
+    assert np.all(np.diff(Ez[len(Ez)//3:-len(Ez)//5]) < 0.)
+    inside = drive_wake['r'] < 0.5*drive_wake['rb'][bubble].max()
+    assert np.all(drive_wake['Fr'][bubble.start + len(Ez)//2, inside][1:] > 0.)
+
+
+def test_bubble_equation(drive_wake):
+    # the bubble equation of examples/bubble, in the thin-sheath limit of
+    # Lu et al., PRL 96, 165002: rb*rb'' + 2*rb'^2 + 1 = 4*lambda/rb^2
+    lam = quasi_static.calc_lambda(
+        quasi_static.gaussian_current(xi, beam_num_ptcl, beam_rms_z))
+    x = xi*k_pe
+    rb = drive_wake['rb']*k_pe
+    bubble = _bubble(drive_wake)
+    i = np.argmax(rb > 1.5)
+    slope = np.polyfit(x[i - 4:i + 5], rb[i - 4:i + 5], 1)[0]
+
+    def derivative(t, y):
+        return [y[1], (4.*np.interp(t, x, lam)/y[0]**2 - 1. - 2.*y[1]**2)/y[0]]
+
+    def closed(t, y):
+        return y[0] - 0.3
+
+    closed.terminal = True
+    lu = scipy.integrate.solve_ivp(
+        derivative, (x[i], x[bubble.stop]), [rb[i], slope], t_eval=x[i:bubble.stop],
+        events=closed, rtol=1.e-8).y[0]
+    rb = rb[i:i + len(lu)]
+    assert rb.max() == pytest.approx(lu.max(), rel=0.15)
+    front = slice(0, np.argmax(rb))
+    assert np.abs(rb[front] - lu[front]).max() < 0.1*lu.max()
+
+
+def test_particles(drive_wake):
+    rng = np.random.RandomState(1)
+    n = 400000
+    particles = dict(
+        xi=rng.normal(0., beam_rms_z, n),
+        r=beam_rms_r*np.sqrt(-2.*np.log(rng.uniform(size=n))),
+        w=np.full(n, beam_num_ptcl/n),
+    )
+    wake = quasi_static.solve(xi, n_pe, particles=particles)
+    bubble = _bubble(drive_wake)
+    assert _bubble(wake).stop == pytest.approx(bubble.stop, abs=10)
+    # the first half of the bubble, away from the closure
+    half = slice(bubble.start, (bubble.start + bubble.stop)//2)
+    rb_max = drive_wake['rb'][bubble].max()
+    assert np.abs(wake['rb'][half] - drive_wake['rb'][half]).max() < 0.05*rb_max
+    E_decel = drive_wake['Ez'][bubble, 0].max()
+    assert np.abs(wake['Ez'][half, 0] - drive_wake['Ez'][half, 0]).max() < 0.05*E_decel
+
+
+def test_beam_loading(drive_wake):
+    witness = 5./k_pe
+    current = quasi_static.gaussian_current(xi, beam_num_ptcl, beam_rms_z) \
+        + quasi_static.gaussian_current(xi, 0.25*beam_num_ptcl, 0.2/k_pe, witness)
+    wake = quasi_static.solve(xi, n_pe, current=current, sigma_r=beam_rms_r)
+    # the wake ahead of the witness is unchanged, and flattened along it
+    ahead = xi < witness - 1.6/k_pe
+    assert np.allclose(wake['Ez'][ahead], drive_wake['Ez'][ahead], rtol=1.e-6, atol=1.)
+    i = np.argmin(np.abs(xi - witness))
+    assert drive_wake['Ez'][i, 0] < wake['Ez'][i, 0] < 0.
@@ -0,0 +1,108 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+import pytest
+
+import h5py
+import numpy as np
+
+from rsfbpic.rsdata import read_field_hdf
+from rsfbpic.rsdata import repack
+
+
+@pytest.mark.parametrize('compression', ['gzip', 'lzf'])
+def test_repack_reads_transparently(fbpic_dumps, tmp_path, compression):
+    dump_dir = fbpic_dumps(iterations=(0, 50, 100))
+    out_path = repack.repack(
+        dump_dir, str(tmp_path / 'run.h5'), chunking='on_axis', compression=compression)
+    assert repack.is_repacked(out_path)
+    assert read_field_hdf.list_dumps(out_path) == [(0, out_path), (50, out_path), (100, out_path)]
+    for n_dump, path_to_file in read_field_hdf.list_dumps(dump_dir):
+        n_dump_str = str(n_dump)
+        assert np.array_equal(
+            read_field_hdf.read_vector(out_path, 'E', 'z', n_dump_str),
+            read_field_hdf.read_vector(path_to_file, 'E', 'z', n_dump_str),
+        )
+        assert np.array_equal(
+            read_field_hdf.read_scalar(out_path, 'rho', n_dump_str),
+            read_field_hdf.read_scalar(path_to_file, 'rho', n_dump_str),
+        )
+        assert read_field_hdf.read_time(out_path, n_dump_str) \
+            == read_field_hdf.read_time(path_to_file, n_dump_str)
+        assert read_field_hdf.read_dr_dz(out_path, 'E', n_dump_str) \
+            == read_field_hdf.read_dr_dz(path_to_file, 'E', n_dump_str)
+    with h5py.File(out_path, 'r') as f:
+        stack = f['repack/fields/E/z']
+        assert stack.compression == compression
+        assert stack.chunks == (3, 1, 1, 64)
+
+
+def test_read_series_and_float32(fbpic_dumps, tmp_path):
+    dump_dir = fbpic_dumps(iterations=(0, 50))
+    out_path = repack.repack(dump_dir, str(tmp_path / 'run.h5'), float32=True)
+    iterations, series = read_field_hdf.read_series(out_path, 'E', 'z', 0)
+    expect_iterations, expect = read_field_hdf.read_series(dump_dir, 'E', 'z', 0)
+    assert list(iterations) == list(expect_iterations) == [0, 50]
+    assert series.dtype == np.float32
+    assert np.allclose(series, expect, rtol=1.e-6, atol=1.e-6 * np.abs(expect).max())
+
+
+@pytest.mark.parametrize('buffer_bytes', [1, 2**28])
+def test_repack_opens_one_dump_at_a_time(fbpic_dumps, tmp_path, monkeypatch, buffer_bytes):
+    dump_dir = fbpic_dumps(iterations=range(0, 300, 10), nr=8)
+    opened = set()
+    most = []
+
+    class File(h5py.File):
+        def __init__(self, name, *args, **kwargs):
+            super(File, self).__init__(name, *args, **kwargs)
+            self.dump = name if name.startswith(dump_dir) else None
+            if self.dump:
+                opened.add(self.dump)
+                most.append(len(opened))
+
+        def close(self):
+            opened.discard(self.dump)
+            super(File, self).close()
+
+    monkeypatch.setattr(repack, 'BUFFER_BYTES', buffer_bytes)
+    monkeypatch.setattr(h5py, 'File', File)
+    out_path = repack.repack(dump_dir, str(tmp_path / 'run.h5'), chunking='on_axis')
+    monkeypatch.undo()
+    assert max(most) == 1
+    iterations, series = read_field_hdf.read_series(out_path, 'E', 'z', 3)
+    assert np.array_equal(series, read_field_hdf.read_series(dump_dir, 'E', 'z', 3)[1])
+
+
+@pytest.mark.parametrize('chunking', ['time_series', 'on_axis', 'snapshot'])
+def test_repack_writes_whole_chunks(fbpic_dumps, tmp_path, monkeypatch, chunking):
+    # rewriting a compressed chunk costs a read, decompress and compress
+    # of the whole chunk, and leaves the old copy in the file
+    writes = []
+    setitem = h5py.Dataset.__setitem__
+
+    def record(dataset, key, value):
+        if dataset.name.startswith('/' + read_field_hdf.REPACK_STACK_PATH):
+            writes.append((dataset.name, dataset.shape, dataset.chunks, key))
+        setitem(dataset, key, value)
+
+    monkeypatch.setattr(h5py.Dataset, '__setitem__', record)
+    dump_dir = fbpic_dumps(iterations=range(0, 400, 10), nr=40)
+    out_path = repack.repack(dump_dir, str(tmp_path / 'run.h5'), chunking=chunking)
+    written = {}
+    for name, shape, chunks, key in writes:
+        ranges = []
+        for k, s in zip(key, shape):
+            start, stop, _ = k.indices(s)
+            c = chunks[len(ranges)]
+            assert start % c == 0 and (stop % c == 0 or stop == s)
+            ranges.append(range(start//c, -(-stop//c)))
+        for index in np.ndindex(*[len(r) for r in ranges]):
+            chunk = (name,) + tuple(r[i] for r, i in zip(ranges, index))
+            written[chunk] = written.get(chunk, 0) + 1
+    assert set(written.values()) == {1}
+    with h5py.File(out_path, 'r') as f:
+        expect = 0
+        for name in set(w[0] for w in writes):
+            expect += np.prod([-(-s//c) for s, c in zip(f[name].shape, f[name].chunks)])
+            assert np.array_equal(
+                f[name][-1], f['data/390/fields/' + name.split('fields/')[1]][...])
+    assert len(written) == expect
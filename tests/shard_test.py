@@ -0,0 +1,105 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+import pytest
+
+import os
+
+import numpy as np
+
+from rsfbpic.rsdata import read_field_hdf
+from rsfbpic.rsdata import reductions
+from rsfbpic.rsdata import shard
+
+_calls = []
+
+
+class _Rank1(object):
+    """Rank 1 of an MPI job, receiving what rank 0 broadcasts"""
+
+    def __init__(self, root_value):
+        self.root_value = root_value
+
+    def Get_size(self):
+        return 2
+
+    def Get_rank(self):
+        return 1
+
+    def Barrier(self):
+        pass
+
+    def bcast(self, obj, root=0):
+        assert root == 0 and obj is None
+        return self.root_value
+
+
+def _flaky_ez(path_to_file, n_dump_str):
+    _calls.append(n_dump_str)
+    if n_dump_str == '150' and 'resumed' not in _calls:
+        raise RuntimeError('node lost')
+    return reductions.on_axis_ez(path_to_file, n_dump_str)
+
+
+def test_reduce_dumps(fbpic_dumps, tmp_path):
+    dump_dir = fbpic_dumps(iterations=range(0, 300, 50))
+    dumps = read_field_hdf.list_dumps(dump_dir)
+    expect = np.array([reductions.on_axis_ez(p, str(n)) for n, p in dumps])
+    iterations, stack = shard.reduce_dumps(
+        dump_dir, reductions.on_axis_ez, str(tmp_path / 'stack'), num_shards=4,
+        checkpoint_every=1, num_workers=2)
+    assert list(iterations) == [n for n, _ in dumps]
+    assert np.array_equal(stack, expect)
+    iterations, total = shard.reduce_dumps(
+        dump_dir, reductions.on_axis_ez, str(tmp_path / 'sum'), how='sum',
+        num_shards=3, num_workers=1)
+    assert np.allclose(total, expect.sum(axis=0))
+    with pytest.raises(ValueError):
+        shard.reduce_dumps(
+            dump_dir, reductions.on_axis_ez, str(tmp_path / 'sum'), how='sum',
+            num_shards=2, num_workers=1)
+
+
+@pytest.mark.parametrize('how', ['stack', 'sum'])
+def test_resume(fbpic_dumps, tmp_path, how):
+    del _calls[:]
+    dump_dir = fbpic_dumps(iterations=range(0, 300, 50))
+    checkpoint_dir = str(tmp_path / 'checkpoint')
+    with pytest.raises(RuntimeError):
+        shard.reduce_dumps(
+            dump_dir, _flaky_ez, checkpoint_dir, how=how, num_shards=2,
+            checkpoint_every=1, num_workers=1)
+    # shard 0 finished 0, 100, 200; shard 1 checkpointed 50 before failing
+    assert _calls == ['0', '100', '200', '50', '150']
+    assert len(os.listdir(checkpoint_dir)) == (4 if how == 'stack' else 2)
+    del _calls[:]
+    _calls.append('resumed')
+    iterations, result = shard.reduce_dumps(
+        dump_dir, _flaky_ez, checkpoint_dir, how=how, num_workers=1)
+    assert _calls == ['resumed', '150', '250']
+    dumps = read_field_hdf.list_dumps(dump_dir)
+    expect = np.array([reductions.on_axis_ez(p, str(n)) for n, p in dumps])
+    assert list(iterations) == list(range(0, 300, 50))
+    if how == 'stack':
+        assert np.array_equal(result, expect)
+    else:
+        assert np.allclose(result, expect.sum(axis=0))
+
+
+def test_mpi_rank_checks_on_root(fbpic_dumps, tmp_path, monkeypatch):
+    dump_dir = fbpic_dumps(iterations=range(0, 300, 50))
+    checkpoint_dir = str(tmp_path / 'sum')
+    _, expect = shard.reduce_dumps(
+        dump_dir, reductions.on_axis_ez, checkpoint_dir, how='sum', num_shards=2,
+        num_workers=1)
+
+    def no_check(*args):
+        raise AssertionError('only rank 0 reads the checkpoint before the barrier')
+
+    monkeypatch.setattr(shard, '_check_shards', no_check)
+    iterations, total = shard.reduce_dumps(
+        dump_dir, reductions.on_axis_ez, checkpoint_dir, how='sum', comm=_Rank1(2))
+    assert list(iterations) == list(range(0, 300, 50))
+    assert np.array_equal(total, expect)
+    with pytest.raises(ValueError):
+        shard.reduce_dumps(
+            dump_dir, reductions.on_axis_ez, checkpoint_dir, how='sum',
+            comm=_Rank1(ValueError('checkpoint written with 2 shards')))
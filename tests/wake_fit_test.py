@@ -0,0 +1,74 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+import pytest
+
+import h5py
+import numpy as np
+import scipy.constants
+
+from rsfbpic.rswake import hollow_channel
+from rsfbpic.rswake import wake_fit
+
+# hollow channel of jupyter/hollow_channel
+n_pe = 1.e24
+k_pe = np.sqrt(n_pe*scipy.constants.e**2
+               / (scipy.constants.m_e*scipy.constants.epsilon_0))/scipy.constants.c
+b = 20.e-6
+sigma = 9.e-6
+Q = 1.e10*(-1.*scipy.constants.e)
+zeta = np.linspace(-120.e-6, 30.e-6, 300)
+
+
+def _lines(n, mode, noise=0.02):
+    rng = np.random.RandomState(mode)
+    scale = rng.uniform(0.8, 1.2, size=(n, 2))
+    Omega_kp = scale[:, 0]*hollow_channel.calc_Omega0(k_pe, b)*k_pe
+    kappa = scale[:, 1]*hollow_channel.calc_kappa0(k_pe, b)
+    calc = hollow_channel.calc_Ez if mode == 0 else hollow_channel.calc_W1_perp
+    lines = calc(Omega_kp[:, np.newaxis], sigma, Q, kappa[:, np.newaxis], zeta)
+    lines += noise*np.abs(lines).max()*rng.normal(size=lines.shape)
+    return Omega_kp, kappa, lines
+
+
+def test_narrow_channel_limit():
+    # as k_pe*b -> 0 the m=0 mode goes to the plasma frequency
+    # and the m=1 mode to 1/sqrt(2) of it
+    assert np.isclose(hollow_channel.calc_Omega0(k_pe, 1.e-6/k_pe), 1., rtol=1.e-4)
+    assert np.isclose(hollow_channel.calc_Omega1(k_pe, 1.e-6/k_pe), np.sqrt(0.5), rtol=1.e-4)
+    assert hollow_channel.calc_Omega0(k_pe, b) < 1.
+
+
+@pytest.mark.parametrize('mode', [0, 1])
+def test_fit_lines(mode):
+    Omega_kp, kappa, lines = _lines(40, mode)
+    assert np.allclose(wake_fit.fft_guess(zeta, lines), Omega_kp, rtol=0.1)
+    fit = wake_fit.fit_lines(zeta, lines, sigma, Q, mode=mode, num_workers=2)
+    assert fit['converged'].all()
+    assert fit['residual'].shape == lines.shape
+    assert np.allclose(fit['Omega_kp'], Omega_kp, rtol=1.e-2)
+    assert np.allclose(fit['kappa'], kappa, rtol=1.e-2)
+    # uncertainties are consistent with the scatter
+    pull = (fit['Omega_kp'] - Omega_kp)/fit['Omega_kp_err']
+    assert 0.5 < np.std(pull) < 2.
+
+
+def test_fit_stack(tmp_path):
+    Omega_kp, kappa, lines = _lines(6, 0, noise=0.)
+    path_to_stack = str(tmp_path / 'stack.h5')
+    zeta0 = 50.e-6
+    with h5py.File(path_to_stack, 'w') as f:
+        f['field'] = lines.reshape(3, 2, len(zeta))
+        f['zeta'] = zeta + zeta0
+        f['iteration'] = np.array([0, 50, 100])
+        f['r'] = np.array([0.5e-6, 1.5e-6])
+    fit, iterations, r = wake_fit.fit_stack(
+        path_to_stack, sigma, Q, zeta0=zeta0, fit_zeta0=True)
+    assert list(iterations) == [0, 50, 100]
+    assert fit['kappa'].shape == (3, 2)
+    assert np.allclose(fit['Omega_kp'], Omega_kp.reshape(3, 2), rtol=1.e-6)
+    assert np.allclose(fit['zeta0'], zeta0, atol=1.e-9)
+    # a single radius, e.g. on axis, keeps the r axis
+    for i_r in (0, -1):
+        fit, _, r = wake_fit.fit_stack(path_to_stack, sigma, Q, zeta0=zeta0, i_r=i_r)
+        assert fit['Omega_kp'].shape == (3, 1)
+        assert len(r) == 1
+        assert np.allclose(fit['Omega_kp'][:, 0], Omega_kp.reshape(3, 2)[:, i_r], rtol=1.e-6)
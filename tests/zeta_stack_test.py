@@ -0,0 +1,54 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+import pytest
+
+import numpy as np
+
+from rsfbpic.rsdata import read_field_hdf
+from rsfbpic.rsdata import zeta_stack
+
+
+def test_list_dumps(fbpic_dumps):
+    dump_dir = fbpic_dumps(iterations=(100, 0, 50))
+    dumps = read_field_hdf.list_dumps(dump_dir)
+    assert [d[0] for d in dumps] == [0, 50, 100]
+    assert dumps[1][1].endswith('data00000050.h5')
+
+
+def test_resample_to_zeta():
+    zeta_field = np.linspace(0., 1., 11)
+    field = np.vstack((zeta_field, 2. * zeta_field))
+    zeta = np.array([-0.1, 0.05, 0.5, 1.])
+    resampled = zeta_stack.resample_to_zeta(field, zeta_field, zeta)
+    assert np.isnan(resampled[:, 0]).all()
+    assert np.allclose(resampled[:, 1:], np.vstack((zeta[1:], 2. * zeta[1:])))
+
+
+def test_build_stack(fbpic_dumps, tmp_path):
+    dump_dir = fbpic_dumps(iterations=(0, 7, 13, 20))
+    out_path = str(tmp_path / 'ez_stack.h5')
+    zeta_stack.build_stack(dump_dir, out_path, 'E', 'z')
+    with zeta_stack.open_stack(out_path) as f:
+        assert f['field'].shape == (4, 16, len(f['zeta']))
+        assert f['field'].compression == 'gzip'
+        assert list(f['iteration'][:]) == [0, 7, 13, 20]
+        # the synthetic wake is stationary in zeta
+        on_axis = f['field'][:, 0, :]
+        assert not np.isnan(on_axis).any()
+        assert np.allclose(on_axis, on_axis[0], atol=1.e-2 * np.abs(on_axis).max())
+
+
+def test_build_stack_chunks(fbpic_dumps, tmp_path):
+    dump_dir = fbpic_dumps(iterations=range(0, 70, 10))
+    zeta_stack.build_stack(dump_dir, str(tmp_path / 'deep.h5'), 'E', 'z')
+    # frames are written a chunk deep at a time, with a partial last chunk
+    zeta_stack.build_stack(dump_dir, str(tmp_path / 'shallow.h5'), 'E', 'z', chunks=(3, 8, 16))
+    with zeta_stack.open_stack(str(tmp_path / 'deep.h5')) as deep:
+        with zeta_stack.open_stack(str(tmp_path / 'shallow.h5')) as shallow:
+            assert shallow['field'].chunks == (3, 8, 16)
+            assert np.array_equal(shallow['field'][...], deep['field'][...])
+            for i, (n_dump, path_to_file) in enumerate(read_field_hdf.list_dumps(dump_dir)):
+                field, _, z, time = read_field_hdf.read_field_rz(
+                    path_to_file, 'E', 'z', str(n_dump))
+                frame = zeta_stack.resample_to_zeta(
+                    field, zeta_stack.calc_zeta(z, time), deep['zeta'][...])
+                assert np.array_equal(deep['field'][i], frame)